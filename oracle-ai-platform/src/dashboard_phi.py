@@ -14,6 +14,10 @@ try:
     # Essayer d'importer depuis le bon chemin
     sys.path.append(os.path.dirname(os.path.dirname(__file__)))
     from src.rag_engine import OracleRAGEngine
+    from src.rag_hybrid import BM25Index
+    from src.rag_context import RetrievalCache, RetrievalContext, retrieve
+    from src.rag_rerank import get_reranker
+    from src.rag_loader import BackgroundLoader, READY
     print("✅ RAG Engine importé avec succès")
     
     # Créer une classe RAGIntegration fonctionnelle
@@ -21,21 +25,48 @@ try:
         def __init__(self, llm_engine=None):
             print("🔧 Initialisation RAG Integration...")
             try:
-                # Utiliser un fallback si OracleRAGEngine échoue
-                try:
-                    self.rag_engine = OracleRAGEngine(persist_directory="./data/chroma_db")
-                    print("✅ RAG Engine initialisé avec succès")
-                except Exception as e:
-                    print(f"⚠️ RAG Engine erreur, utilisant fallback: {e}")
-                    # Créer un moteur RAG minimal
-                    self.rag_engine = self._create_fallback_rag_engine()
+                # Moteur lexical (BM25) immédiatement; ChromaDB + embeddings chargés en arrière-plan,
+                # le fallback reste en place si OracleRAGEngine échoue
+                self.rag_engine = self._create_fallback_rag_engine()
+                self.loader = BackgroundLoader(lambda: OracleRAGEngine(persist_directory="./data/chroma_db"),
+                                               on_ready=self._engine_ready)
                 
                 self.llm_engine = llm_engine
+                self.cascade = None
+                if hasattr(llm_engine, 'router'):
+                    # Documentation / petit modèle d'abord, Phi seulement si nécessaire
+                    from src.llm_cascade import ModelCascade
+                    from src.security_audit import SecurityAuditor
+                    # Évaluations de sécurité: règles SecurityAuditor (sans LLM) au niveau 0
+                    self.cascade = ModelCascade(llm_engine, auditor=SecurityAuditor())
+                # Résultats de recherche récents (requête normalisée + version de la collection)
+                self.retrieval_cache = RetrievalCache()
+                # Reclassement cross-encoder optionnel (RAG_RERANK=1)
+                self.reranker = get_reranker()
+                self.loader.start()
                 print("✅ RAG Integration prête")
             except Exception as e:
                 print(f"❌ Erreur initialisation RAG: {e}")
                 self.rag_engine = None
                 self.llm_engine = None
+                self.cascade = None
+                self.loader = None
+        
+        def _engine_ready(self, engine):
+            """Remplace le moteur lexical par le moteur complet (thread de chargement)"""
+            self.rag_engine = engine
+            self.retrieval_cache.clear()
+            print("✅ RAG Engine initialisé avec succès")
+        
+        @property
+        def status(self):
+            """État du moteur pour la barre latérale: loading, ready ou fallback"""
+            if not self.loader:
+                return {'state': 'fallback' if self.rag_engine else 'unavailable', 'seconds': None, 'error': None}
+            status = self.loader.status()
+            if status['state'] not in ('loading', READY):
+                status['state'] = 'fallback'
+            return status
         
         def _create_fallback_rag_engine(self):
             """Crée un moteur RAG fallback sans dépendances complexes"""
@@ -47,6 +78,9 @@ try:
                     
                     # Charger les 15 documents Oracle de base
                     self._load_documents()
+                    # Index BM25 (identifiants Oracle exacts) au lieu d'un parcours de tous les documents
+                    self.index = BM25Index()
+                    self.index.add([str(i) for i in range(len(self.documents))], self.documents, self.metadatas)
                 
                 def _load_documents(self):
                     """Charge les 15 documents Oracle de base"""
@@ -475,29 +509,21 @@ Références: Administrator's Guide, Chapter 16"""
                 def count(self):
                     return len(self.documents)
                 
-                def query(self, question, n_results=5):
-                    """Recherche simple basée sur mots-clés"""
-                    results = []
-                    for i, (doc, meta) in enumerate(zip(self.documents, self.metadatas)):
-                        score = self._calculate_similarity(question, doc)
-                        if score > 0.1:  # Seuil bas pour simplicité
-                            results.append({
-                                'document': doc,
-                                'metadata': meta,
-                                'similarity_score': score
-                            })
-                    
-                    # Trier par score et retourner les meilleurs
-                    results.sort(key=lambda x: x['similarity_score'], reverse=True)
-                    return results[:n_results]
+                @property
+                def version(self):
+                    return self.index.generation
                 
-                def _calculate_similarity(self, query, document):
-                    """Calcul de similarité simple basé sur mots communs"""
-                    query_words = set(query.lower().split())
-                    doc_words = set(document.lower().split())
-                    common = len(query_words.intersection(doc_words))
-                    total = len(query_words.union(doc_words))
-                    return common / total if total > 0 else 0
+                def query_many(self, questions, n_results=5, where=None):
+                    return [self.query(question, n_results, where) for question in questions]
+                
+                def query(self, question, n_results=5, where=None):
+                    """Recherche par mots-clés (BM25), score rapporté à l'IDF de la requête"""
+                    hits = self.index.search(question, n_results, where)
+                    return [{
+                        'document': self.documents[int(doc_id)],
+                        'metadata': self.metadatas[int(doc_id)],
+                        'lexical_score': self.index.lexical_score(question, score)
+                    } for doc_id, score in hits]
                 
                 def get_collection_stats(self):
                     categories = {}
@@ -531,19 +557,24 @@ Références: Administrator's Guide, Chapter 16"""
                 return {'total_documents': 0, 'categories': {}, 'topics': {}, 'categories_distribution': {}}
         
         def retrieve_context(self, query, n_results=5):
+            return self.retrieve(query, n_results).documents
+        
+        def retrieve(self, query, n_results=5):
+            """Recherche unique par tour de chat (réponse, sources et télémétrie), via le LRU"""
             if not self.rag_engine:
-                return []
-            
+                return RetrievalContext(query, [])
+            # Moteur dans la version: rien de servi par le LRU après le passage au moteur complet
+            version = (type(self.rag_engine).__name__, getattr(self.rag_engine, 'version', None))
+            return retrieve(self.retrieval_cache, self._search, query, n_results, version=version)
+        
+        def _search(self, query, n_results, where=None):
             try:
-                results = self.rag_engine.query(query, n_results)
-                
-                formatted_results = []
-                for result in results:
-                    formatted_results.append({
-                        'content': result['document'][:500],
-                        'metadata': result['metadata'],
-                        'distance': 1 - result['similarity_score'] if 'similarity_score' in result else 0.5
-                    })
+                # Candidats en plus si reclassement, puis les n_results meilleurs
+                fetch = max(n_results, self.reranker.candidates) if self.reranker else n_results
+                formatted_results = self._format(self.rag_engine.query(query, fetch))
+                if self.reranker:
+                    formatted_results, _ = self.reranker.rerank(query, formatted_results, n_results)
+                formatted_results = formatted_results[:n_results]
                 
                 print(f"📚 {len(formatted_results)} documents récupérés pour: '{query[:30]}...'")
                 return formatted_results
@@ -551,6 +582,19 @@ Références: Administrator's Guide, Chapter 16"""
                 print(f"❌ Erreur retrieve_context: {e}")
                 return []
         
+        @staticmethod
+        def _format(results):
+            return [{
+                'content': result['document'][:500],
+                # Contenu coupé pour l'affichage: jamais rendu comme réponse complète
+                'truncated': len(result['document']) > 500,
+                'metadata': result['metadata'],
+                # Distance Chroma réelle (None: BM25 seul, pertinence dans lexical_score)
+                'distance': result.get('distance'),
+                'lexical_score': result.get('lexical_score'),
+                'rrf_score': result.get('rrf_score')
+            } for result in results]
+        
         def search_by_category(self, category, query, n_results=5):
             return self.retrieve_context(f"{query} {category}", n_results)
         
@@ -559,6 +603,9 @@ Références: Administrator's Guide, Chapter 16"""
                 return False
             
             try:
+                # Un ajout au moteur lexical serait perdu au passage au moteur complet
+                if self.loader:
+                    self.loader.wait()
                 metadata.update({
                     'category': category,
                     'topic': topic,
@@ -575,6 +622,7 @@ Références: Administrator's Guide, Chapter 16"""
                     if hasattr(self.rag_engine, 'documents'):
                         self.rag_engine.documents.append(content)
                         self.rag_engine.metadatas.append(metadata)
+                        self.rag_engine.index.add([str(len(self.rag_engine.documents) - 1)], [content], [metadata])
                         return True
                     return False
             except Exception as e:
@@ -591,25 +639,32 @@ Références: Administrator's Guide, Chapter 16"""
             ]
             
             results = {}
-            for query in test_queries:
-                docs = self.retrieve_context(query, 3)
+            if not self.rag_engine:
+                return results
+            # Toutes les questions en un lot (un seul appel au modèle d'embedding)
+            for query, found in zip(test_queries, self.rag_engine.query_many(test_queries, 3)):
+                docs = self._format(found)
                 results[query] = {
                     'found': len(docs),
                     'top_topics': [doc['metadata'].get('topic', 'N/A') for doc in docs[:2]] if docs else [],
-                    'relevance': [1 - doc.get('distance', 0.5) for doc in docs[:2]] if docs else []
+                    'relevance': [1 - doc['distance'] if doc.get('distance') is not None else doc.get('lexical_score')
+                                  for doc in docs[:2]] if docs else []
                 }
                 print(f"📚 {len(docs)} documents récupérés pour: '{query}'")
             
             return results
         
-        def enhanced_llm_query(self, prompt):
-            """Utilise LLM avec contexte RAG"""
+        def enhanced_llm_query(self, prompt, history=None, retrieval=None):
+            """
+            Utilise LLM avec contexte RAG (history: messages précédents du chat,
+            retrieval: recherche déjà faite pour ce tour)
+            """
             if not self.llm_engine:
                 return "LLM non disponible. Veuillez lancer Ollama avec 'ollama serve'"
             
             try:
-                # Récupérer contexte RAG
-                context_docs = self.retrieve_context(prompt, 3)
+                # Récupérer contexte RAG (une seule recherche par tour)
+                context_docs = (retrieval or self.retrieve(prompt, 3)).documents
                 
                 if context_docs:
                     # Construire le contexte
@@ -618,19 +673,23 @@ Références: Administrator's Guide, Chapter 16"""
                         context_text += f"\n--- Document {i} ---\n"
                         context_text += f"Catégorie: {doc['metadata'].get('category', 'N/A')}\n"
                         context_text += f"Topic: {doc['metadata'].get('topic', 'N/A')}\n"
-                        context_text += f"Contenu: {doc['content'][:300]}...\n"
+                        context_text += f"Contenu: {doc['content']}\n"
                     
                     prompt_with_context = f"{context_text}\n\nQUESTION: {prompt}\n\nRÉPONSE:"
                     
-                    # Appeler le LLM
-                    if hasattr(self.llm_engine, 'generate'):
+                    # Appeler le LLM en mode chat (le contexte est ajusté au budget de tokens du moteur)
+                    if self.cascade:
+                        result = self.cascade.chat(prompt, history or [],
+                                                   context_docs=context_docs, context=context_text)
+                        response = result["answer"]
+                    elif hasattr(self.llm_engine, 'chat_response'):
+                        response = self.llm_engine.chat_response(prompt, history or [], context=context_text)
+                    elif hasattr(self.llm_engine, 'generate'):
                         response = self.llm_engine.generate(
                             "chatbot_general",
                             variables={"query": prompt_with_context, "history": ""},
                             max_tokens=500
                         )
-                    elif hasattr(self.llm_engine, 'chat_response'):
-                        response = self.llm_engine.chat_response(prompt_with_context, "")
                     else:
                         response = "Format de réponse LLM non supporté"
                     
@@ -638,7 +697,7 @@ Références: Administrator's Guide, Chapter 16"""
                 else:
                     # Fallback sans RAG
                     if hasattr(self.llm_engine, 'chat_response'):
-                        return self.llm_engine.chat_response(prompt, "")
+                        return self.llm_engine.chat_response(prompt, history or [])
                     else:
                         return f"Question: {prompt}\n\nRéponse: Je suis votre assistant Oracle AI. Je traite actuellement votre question. RAG context disponible: Non"
                         
@@ -651,6 +710,7 @@ Références: Administrator's Guide, Chapter 16"""
 
 except ImportError as e:
     print(f"⚠️ RAG import error: {e}")
+    from src.rag_context import RetrievalContext
     # Définir des classes mock pour éviter les erreurs
     class MockRAGIntegration:
         def __init__(self):
@@ -660,13 +720,18 @@ except ImportError as e:
             return {'total_documents': 15, 'categories': {'security': 3, 'performance': 4, 'backup': 2, 'anomaly': 3, 'monitoring': 2, 'troubleshooting': 1}, 'topics': {}, 'categories_distribution': {}}
         def retrieve_context(self, query, n_results=5):
             return []
+        def retrieve(self, query, n_results=5):
+            return RetrievalContext(query, [])
+        @property
+        def status(self):
+            return {'state': 'unavailable', 'seconds': None, 'error': None}
         def search_by_category(self, category, query, n_results=5):
             return []
         def add_custom_document(self, content, category, topic, metadata):
             return True
         def test_retrieval(self):
             return {}
-        def enhanced_llm_query(self, prompt):
+        def enhanced_llm_query(self, prompt, history=None, retrieval=None):
             return "RAG non disponible - réponse générique"
 
     def initialize_rag_for_dashboard(llm_engine):
@@ -701,6 +766,7 @@ class OracleAIDashboardPhi:
         # Initialisation
         self.llm_engine = None
         self.auditor = None
+        self.precomputed = None
         self.mock_data = None
         self.model_name = "simulate"
         self.rag_integration = None  
@@ -942,9 +1008,16 @@ class OracleAIDashboardPhi:
                 st.session_state.rag_stats = {'total_documents': 0, 'categories': {}}
             
             # 3. Initialiser l'auditeur avec le bon engine
+            try:
+                from src.llm_precompute import PrecomputeStore
+                self.precomputed = PrecomputeStore()
+            except Exception as e:
+                print(f"⚠️ Analyses précalculées indisponibles: {e}")
+                self.precomputed = None
+            
             try:
                 from src.security_audit import SecurityAuditor
-                self.auditor = SecurityAuditor(llm_engine=self.llm_engine)
+                self.auditor = SecurityAuditor(llm_engine=self.llm_engine, precomputed=self.precomputed)
                 print("✅ Security Auditor initialisé")
             except Exception as e:
                 print(f"⚠️ Audit simulation: {e}")
@@ -956,6 +1029,7 @@ class OracleAIDashboardPhi:
             # 5. Stocker dans session
             st.session_state.llm_engine = self.llm_engine
             st.session_state.auditor = self.auditor
+            st.session_state.precomputed = self.precomputed
             st.session_state.mock_data = self.mock_data
             st.session_state.model_name = self.model_name
             st.session_state.phi_initialized = True
@@ -965,6 +1039,7 @@ class OracleAIDashboardPhi:
             # Récupérer depuis session
             self.llm_engine = st.session_state.get('llm_engine')
             self.auditor = st.session_state.get('auditor')
+            self.precomputed = st.session_state.get('precomputed')
             self.mock_data = st.session_state.get('mock_data')
             self.model_name = st.session_state.get('model_name', 'simulate')
             self.rag_integration = st.session_state.get('rag_integration')
@@ -1052,18 +1127,34 @@ class OracleAIDashboardPhi:
             </div>
             """, unsafe_allow_html=True)
             
-            # Stats RAG
+            # Stats RAG (rafraîchies quand le moteur complet remplace le moteur lexical)
+            rag_status = getattr(self.rag_integration, 'status', None) or {'state': 'unavailable', 'seconds': None}
+            if self.rag_integration and st.session_state.get('rag_state') != rag_status['state']:
+                st.session_state.rag_stats = self.rag_integration.get_collection_stats()
+                st.session_state.rag_state = rag_status['state']
             rag_stats = st.session_state.get('rag_stats', {})
             rag_docs = rag_stats.get('total_documents', 0)
             
+            rag_labels = {
+                'loading': ("⏳ Chargement", COLORS['warning'], f"Recherche lexicale (BM25) en attendant les embeddings · {rag_status['seconds']} s"),
+                'ready': ("🟢 Prêt", COLORS['success'], f"Recherche hybride BM25 + vecteurs · chargée en {rag_status['seconds']} s"),
+                'fallback': ("🟡 Lexical", COLORS['warning'], "Recherche lexicale (BM25) seulement"),
+                'unavailable': ("🔴 Indisponible", COLORS['danger'], "Module RAG non chargé"),
+            }
+            rag_label, rag_color, rag_detail = rag_labels[rag_status['state']]
+            
             st.markdown(f"""
             <div style='background-color: {COLORS["bg_light"]}; padding: 1rem; border-radius: 8px; margin-bottom: 1rem;'>
                 <div style='display: flex; justify-content: space-between; align-items: center;'>
                     <span style='font-weight: 500; color: {COLORS["neutral"]}'>Base Connaissances</span>
                     <span style='color: {COLORS["primary"]}; font-weight: 600;'>{rag_docs} docs</span>
                 </div>
+                <div style='display: flex; justify-content: space-between; align-items: center; margin-top: 0.5rem;'>
+                    <span style='font-size: 0.85rem; color: {COLORS["neutral"]}'>Moteur RAG</span>
+                    <span style='color: {rag_color}; font-weight: 600;'>{rag_label}</span>
+                </div>
                 <div style='font-size: 0.85rem; color: {COLORS["neutral"]}; margin-top: 0.5rem;'>
-                    Documents Oracle techniques
+                    {rag_detail}
                 </div>
             </div>
             """, unsafe_allow_html=True)
@@ -1090,7 +1181,7 @@ class OracleAIDashboardPhi:
             
             if st.button("🔄 Actualiser IA", use_container_width=True):
                 # Nettoyer la session pour réinitialiser
-                keys_to_delete = ['phi_initialized', 'rag_integration', 'rag_stats']
+                keys_to_delete = ['phi_initialized', 'rag_integration', 'rag_stats', 'rag_state']
                 for key in keys_to_delete:
                     if key in st.session_state:
                         del st.session_state[key]
@@ -1123,6 +1214,47 @@ class OracleAIDashboardPhi:
         }
         return menu_map.get(menu, "home")
     
+    @property
+    def _telemetry(self):
+        """Store de télémétrie du moteur LLM (None en mode simulation)"""
+        return getattr(self.llm_engine, "telemetry", None)
+    
+    def _show_llm_telemetry(self):
+        """Panneau de télémétrie LLM: latences, débit et tokens par clé de prompt"""
+        if not self._telemetry:
+            return
+        
+        with st.expander("📈 Télémétrie LLM"):
+            rows = self._telemetry.snapshot()
+            if not rows:
+                st.info("Aucun appel LLM enregistré pour le moment")
+                return
+            
+            st.dataframe(pd.DataFrame(rows), use_container_width=True)
+            
+            adaptive = getattr(self.llm_engine, "adaptive", None)
+            if adaptive:
+                st.write("**Limites adaptatives (num_predict / num_ctx) tokens réservés en moins et temps mesuré économisé:**")
+                st.dataframe(pd.DataFrame(adaptive.report()), use_container_width=True)
+            
+            cascade = getattr(st.session_state.get('rag_integration'), "cascade", None)
+            if cascade:
+                st.write("**Cascade de modèles (réponses par niveau):**")
+                st.dataframe(pd.DataFrame(cascade.snapshot()), use_container_width=True)
+            
+            scheduler = getattr(self.llm_engine, "scheduler", None)
+            if scheduler:
+                st.write("**File d'attente LLM (toutes sessions):**")
+                st.dataframe(pd.DataFrame(scheduler.snapshot()), use_container_width=True)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("📥 Export JSON", self._telemetry.to_json(),
+                                   file_name="llm_telemetry.json", mime="application/json")
+            with col2:
+                st.download_button("📥 Export Prometheus", self._telemetry.to_prometheus(),
+                                   file_name="llm_telemetry.prom", mime="text/plain")
+    
     def home_page(self):
         """Page d'accueil professionnelle"""
         # En-tête avec design professionnel
@@ -1152,7 +1284,14 @@ class OracleAIDashboardPhi:
             st.metric("📚 Docs RAG", rag_docs)
         
         with col4:
-            st.metric("⚡ Temps Réponse", "< 2s")
+            p50 = self._telemetry.percentile("total_seconds", 50) if self._telemetry else None
+            ttft = self._telemetry.percentile("ttft_seconds", 50) if self._telemetry else None
+            st.metric("⚡ Temps Réponse (p50)",
+                      f"{p50:.1f}s" if p50 is not None else "—",
+                      f"1er token {ttft:.1f}s" if ttft is not None else None,
+                      delta_color="off")
+        
+        self._show_llm_telemetry()
         
         st.markdown("---")
         
@@ -1228,6 +1367,9 @@ class OracleAIDashboardPhi:
             with st.expander("🔧 Debug Information"):
                 st.write(f"**Modèle:** {self.model_name}")
                 st.write(f"**Engine type:** {type(self.llm_engine).__name__ if self.llm_engine else 'None'}")
+                if self.llm_engine and hasattr(self.llm_engine, 'router'):
+                    st.write("**Backends LLM:**")
+                    st.dataframe(pd.DataFrame(self.llm_engine.router.snapshot()), use_container_width=True)
                 
                 rag = st.session_state.get('rag_integration')
                 st.write(f"**RAG disponible:** {'Oui' if rag else 'Non'}")
@@ -1315,8 +1457,12 @@ class OracleAIDashboardPhi:
             st.write("**2. Test Analyse Sécurité:**")
             try:
                 test_config = {"users": 5, "audit": False, "profiles": "DEFAULT"}
-                response2 = self.llm_engine.assess_security(test_config)
+                # Via la cascade quand elle existe (règles, petit modèle, puis Phi)
+                cascade = getattr(self.rag_integration, 'cascade', None)
+                response2 = (cascade or self.llm_engine).assess_security(test_config)
                 if isinstance(response2, dict):
+                    if 'tier' in response2:
+                        st.write(f"Niveau cascade: {response2['tier']} ({response2.get('reason', '')})")
                     st.write(f"Score: {response2.get('score', 'N/A')}")
                     st.write(f"Risques: {len(response2.get('risks', []))}")
                 else:
@@ -1451,6 +1597,21 @@ class OracleAIDashboardPhi:
                     st.caption(f"**{ref['source']} - {ref['topic']}**")
                     st.write(ref['content'])
         
+        # Analyse IA approfondie (éventuellement issue de la passe de nuit)
+        llm_analysis = report.get('llm_analysis')
+        if llm_analysis and 'error' not in llm_analysis:
+            precomputed = report.get('llm_analysis_precomputed')
+            title = "🤖 Analyse IA Avancée"
+            if precomputed:
+                title += f" (précalculée {precomputed['age']})"
+            with st.expander(title):
+                if precomputed and precomputed['stale']:
+                    st.warning("⚠️ Analyse ancienne: elle sera recalculée à la prochaine passe")
+                for risk in llm_analysis.get('unseen_risks', []):
+                    st.write(f"• {risk}")
+                for rec in llm_analysis.get('strategic_recommendations', []):
+                    st.write(f"✅ {rec}")
+        
         # Détails des risques
         st.subheader("📋 Détails des Risques")
         risks = report.get('risks', [])
@@ -1580,6 +1741,18 @@ ORDER BY created DESC;"""
                 st.code(selected_query['SQL_TEXT'], language="sql")
                 st.caption(f"**Problème identifié:** {selected_query['PROBLEM']}")
             
+            # Analyse calculée pendant la passe de nuit: servie sans attendre le LLM
+            stored = None
+            if self.precomputed:
+                stored = self.precomputed.get_query(selected_query['SQL_ID'],
+                                                    selected_query.get('PLAN_HASH_VALUE'))
+            if stored:
+                with st.expander(f"🌙 Analyse IA précalculée ({stored['age']})", expanded=True):
+                    if stored['stale']:
+                        st.warning("⚠️ Analyse ancienne: relancez l'analyse pour un résultat à jour")
+                    st.markdown(stored['result'])
+                    st.caption(f"Calculée le {stored['computed_at']} hors heures de pointe")
+            
             # Bouton d'analyse IA
             if st.button("🔍 Analyser avec IA avancée", type="primary"):
                 self._analyze_query_advanced(selected_query)
@@ -2121,6 +2294,8 @@ RUN {{
                                     st.write(f"**Sévérité:** {doc.get('metadata', {}).get('severity', 'N/A')}")
                                     if doc.get('distance'):
                                         st.write(f"**Pertinence:** {1 - doc['distance']:.2%}")
+                                    elif doc.get('lexical_score') is not None:
+                                        st.write(f"**Pertinence (mots-clés):** {doc['lexical_score']:.2%}")
                                     st.markdown("---")
                                     if doc.get('content'):
                                         st.markdown(doc['content'][:1000] + ("..." if len(doc['content']) > 1000 else ""))
@@ -2259,12 +2434,17 @@ Posez-moi votre question technique!"""
                     # Récupérer RAG si disponible
                     rag = st.session_state.get('rag_integration')
                     
+                    # Tours précédents (sans le message d'accueil ni la question courante),
+                    # envoyés en messages pour que Phi réutilise son cache KV
+                    history = st.session_state.phi_chat_history[1:-1]
+                    
                     if rag and self.llm_engine:
-                        # Utiliser RAG pour enrichir la réponse
-                        response = rag.enhanced_llm_query(prompt)
+                        # Une seule recherche pour la réponse et les sources affichées
+                        retrieval = rag.retrieve(prompt, n_results=3)
+                        response = rag.enhanced_llm_query(prompt, history, retrieval=retrieval)
                         
                         # Afficher les documents sources utilisés
-                        context_docs = rag.retrieve_context(prompt, n_results=2)
+                        context_docs = retrieval.sources(2)
                         if context_docs:
                             with st.expander("📚 Sources utilisées"):
                                 for i, doc in enumerate(context_docs, 1):
@@ -2278,7 +2458,7 @@ Posez-moi votre question technique!"""
                         
                     elif self.llm_engine:
                         # LLM sans RAG (fallback)
-                        response = self.llm_engine.chat_response(prompt, "")
+                        response = self.llm_engine.chat_response(prompt, history)
                         
                         if response and len(response) > 50:
                             formatted_response = self._format_chat_response(response, prompt)
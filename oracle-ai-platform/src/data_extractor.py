@@ -76,7 +76,7 @@ class OracleExtractor:
         try:
             # Requêtes lentes
             slow_queries_query = """
-                SELECT SQL_ID, SQL_TEXT, EXECUTIONS, ELAPSED_TIME,
+                SELECT SQL_ID, PLAN_HASH_VALUE, SQL_TEXT, EXECUTIONS, ELAPSED_TIME,
                        CPU_TIME, BUFFER_GETS, DISK_READS, ROWS_PROCESSED,
                        FIRST_LOAD_TIME, LAST_LOAD_TIME
                 FROM V$SQLSTAT
@@ -0,0 +1,320 @@
+# src/embedding_backends.py
+"""
+Backends d'embedding interchangeables pour le RAG:
+    torch  - SentenceTransformer PyTorch (référence)
+    onnx   - export ONNX du même modèle quantifié int8, ONNX Runtime sur CPU,
+             lots répartis sur un pool de threads
+
+Usage:
+    python src/embedding_backends.py export      # export + quantification int8
+    python src/embedding_backends.py check       # précision et débit vs PyTorch
+
+Configuration (.env):
+    RAG_EMBEDDING_BACKEND=onnx
+    RAG_ONNX_DIR=data/models/all-MiniLM-L6-v2-int8
+    RAG_EMBEDDING_THREADS=4
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "data", "models", f"{EMBEDDING_MODEL}-int8")
+ONNX_FILE = "model.onnx"
+
+# Requêtes de test de la base de connaissances (OracleRAGEngine.test_retrieval)
+CHECK_QUERIES = [
+    "index lent performance",
+    "sécurité mot de passe Oracle",
+    "backup RMAN stratégie",
+    "requête SELECT performance",
+    "audit Oracle configuration",
+    "Comment configurer une politique de mot de passe Oracle?",
+    "Quels sont les meilleurs indexes pour performance?",
+    "Comment détecter une attaque sur Oracle?",
+    "Backup RMAN best practices",
+    "Monitoring sessions bloquantes",
+]
+
+
+def mean_pooling(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Moyenne des vecteurs de tokens (hors padding) puis normalisation L2, comme sentence-transformers"""
+    mask = mask[..., None].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+
+class WordPieceCounter:
+    """
+    Compte les tokens avec le tokenizer de l'embedder en service (sans
+    [CLS]/[SEP] ni troncature). Sérialisable: le découpage de l'ingestion
+    s'exécute dans un pool de processus.
+    """
+
+    exact = True
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        encoded = self.tokenizer.encode(text, add_special_tokens=False)
+        # tokenizers.Tokenizer -> Encoding (.ids); transformers -> liste d'IDs
+        return len(getattr(encoded, "ids", encoded))
+
+
+class TorchEmbedder:
+    """Référence: SentenceTransformer PyTorch (chargé au premier appel)"""
+
+    kind = "torch"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, batch_size: int = 64):
+        self.model_name = model_name
+        self.name = model_name
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return self._load().encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                   show_progress_bar=False)
+
+    def token_counter(self) -> WordPieceCounter:
+        """Tokenizer du SentenceTransformer chargé (cache sentence-transformers compris)"""
+        return WordPieceCounter(self._load().tokenizer)
+
+    def __call__(self, input: Sequence[str]) -> np.ndarray:
+        return self.embed(input)
+
+
+class OnnxEmbedder:
+    """
+    Même modèle exporté en ONNX et quantifié int8. Les textes sont triés par
+    longueur (moins de padding), découpés en lots, et les lots s'exécutent en
+    parallèle: ONNX Runtime libère le GIL pendant le calcul.
+    """
+
+    kind = "onnx"
+
+    def __init__(self, model_dir: str = DEFAULT_ONNX_DIR, threads: Optional[int] = None,
+                 batch_size: int = 32, max_length: int = 256):
+        """
+        Args:
+            model_dir: Dossier de l'export (model.onnx + tokenizer.json)
+            threads: Lots exécutés en parallèle (défaut: nombre de CPU)
+            batch_size: Textes par lot
+            max_length: Tokens par texte (limite du modèle)
+        """
+        self.model_dir = model_dir
+        self.name = f"{EMBEDDING_MODEL}@onnx-int8"
+        self.threads = threads or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._session = None
+        self._tokenizer = None
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="onnx-embed")
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._session is None:
+                import onnxruntime
+                from tokenizers import Tokenizer
+
+                path = os.path.join(self.model_dir, ONNX_FILE)
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"❌ Modèle ONNX absent: {path} "
+                                            f"(python src/embedding_backends.py export)")
+                options = onnxruntime.SessionOptions()
+                # Un thread par lot: le parallélisme vient du pool de lots
+                options.intra_op_num_threads = 1
+                options.inter_op_num_threads = 1
+                options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+                session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+                tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+                tokenizer.enable_truncation(self.max_length)
+                tokenizer.enable_padding()
+                self._inputs = {node.name for node in session.get_inputs()}
+                self._tokenizer, self._session = tokenizer, session
+        return self._session
+
+    def _run(self, texts: List[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask, "token_type_ids": np.zeros_like(ids)}
+        hidden = self._session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0]
+        return mean_pooling(hidden, mask)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        self._load()
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 384), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [[texts[i] for i in order[start:start + self.batch_size]]
+                   for start in range(0, len(order), self.batch_size)]
+        vectors = np.concatenate(list(self._executor.map(self._run, batches)))
+        result = np.empty_like(vectors)
+        result[order] = vectors
+        return result
+
+    def token_counter(self) -> WordPieceCounter:
+        """tokenizer.json de l'export, sans la troncature appliquée à l'encodage"""
+        from tokenizers import Tokenizer
+        return WordPieceCounter(Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json")))
+
+    def __call__(self, input: Sequence[str]) -> np.ndarray:
+        return self.embed(input)
+
+
+def embedding_backend_from_env(model_name: str = EMBEDDING_MODEL):
+    """Backend choisi par RAG_EMBEDDING_BACKEND (torch par défaut, onnx si l'export existe)"""
+    kind = os.getenv("RAG_EMBEDDING_BACKEND", "torch").lower()
+    if kind == "onnx":
+        model_dir = os.getenv("RAG_ONNX_DIR", DEFAULT_ONNX_DIR)
+        threads = int(os.getenv("RAG_EMBEDDING_THREADS", "0")) or None
+        if os.path.exists(os.path.join(model_dir, ONNX_FILE)):
+            return OnnxEmbedder(model_dir, threads=threads)
+        print(f"⚠️ Export ONNX absent ({model_dir}), embeddings PyTorch")
+    return TorchEmbedder(model_name)
+
+
+def export_onnx(model_name: str = EMBEDDING_MODEL, output_dir: str = DEFAULT_ONNX_DIR,
+                quantize: bool = True) -> str:
+    """Exporte le modèle Hugging Face en ONNX (axes dynamiques), quantification int8 dynamique"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    hub_name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(hub_name)
+    model = AutoModel.from_pretrained(hub_name).eval()
+    model.config.return_dict = False
+    sample = tokenizer(["SELECT * FROM v$session"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    fp32_path = os.path.join(output_dir, "model_fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in names), fp32_path,
+                          input_names=names, output_names=["last_hidden_state", "pooler_output"],
+                          dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in names},
+                                        "last_hidden_state": {0: "batch", 1: "sequence"}},
+                          opset_version=14)
+    tokenizer.save_pretrained(output_dir)
+
+    path = os.path.join(output_dir, ONNX_FILE)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    else:
+        os.replace(fp32_path, path)
+    print(f"✅ Export ONNX{' int8' if quantize else ''}: {path} ({os.path.getsize(path) / 1e6:.1f} Mo)")
+    return path
+
+
+def _rss_mb() -> Optional[float]:
+    """Mémoire résidente du processus (Linux)"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def compare_backends(reference, candidate, queries: Sequence[str], documents: Sequence[str],
+                     k: int = 3, repeat: int = 20) -> Dict:
+    """
+    Précision et débit d'un backend par rapport à la référence
+
+    Returns:
+        Cosinus moyen/minimal entre les deux embeddings d'un même texte,
+        accord du premier document et recouvrement du top-k sur les requêtes,
+        débits (textes/s) et accélération
+    """
+    texts = list(queries) + list(documents)
+    ref_vectors, cand_vectors = np.asarray(reference(texts)), np.asarray(candidate(texts))
+    ref_vectors = ref_vectors / np.linalg.norm(ref_vectors, axis=1, keepdims=True)
+    cand_vectors = cand_vectors / np.linalg.norm(cand_vectors, axis=1, keepdims=True)
+    cosines = (ref_vectors * cand_vectors).sum(axis=1)
+
+    n = len(queries)
+    ref_top = np.argsort(-ref_vectors[:n] @ ref_vectors[n:].T, axis=1)[:, :k]
+    cand_top = np.argsort(-cand_vectors[:n] @ cand_vectors[n:].T, axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)]
+
+    throughput = {}
+    corpus = list(documents) * repeat
+    for label, backend in (("reference", reference), ("candidate", candidate)):
+        started = time.perf_counter()
+        backend(corpus)
+        throughput[label] = round(len(corpus) / (time.perf_counter() - started), 1)
+
+    return {
+        "mean_cosine": round(float(cosines.mean()), 5),
+        "min_cosine": round(float(cosines.min()), 5),
+        "top1_agreement": round(float((ref_top[:, 0] == cand_top[:, 0]).mean()), 3),
+        f"overlap_at_{k}": round(float(np.mean(overlap)), 3),
+        "reference_texts_per_s": throughput["reference"],
+        "candidate_texts_per_s": throughput["candidate"],
+        "speedup": round(throughput["candidate"] / throughput["reference"], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backends d'embedding du RAG")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--model-dir", default=DEFAULT_ONNX_DIR)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(output_dir=args.model_dir, quantize=not args.no_quantize)
+        return
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.rag_engine import OracleRAGEngine
+
+    # Les 15 documents intégrés (méthode sans état)
+    documents = [doc["content"] for doc in OracleRAGEngine._get_oracle_knowledge_base(None)]
+    before = _rss_mb()
+    onnx = OnnxEmbedder(args.model_dir, threads=args.threads)
+    onnx(["chargement"])
+    onnx_rss = _rss_mb()
+    torch_backend = TorchEmbedder()
+    torch_backend(["chargement"])
+    torch_rss = _rss_mb()
+
+    report = compare_backends(torch_backend, onnx, CHECK_QUERIES, documents)
+    if before is not None:
+        report["onnx_rss_mb"] = round(onnx_rss - before, 1)
+        report["torch_rss_mb"] = round(torch_rss - onnx_rss, 1)
+    for key, value in report.items():
+        print(f"   {key}: {value}")
+    ok = report["mean_cosine"] >= 0.99 and report["top1_agreement"] >= 0.9
+    print("✅ Export ONNX conforme" if ok else "❌ Écart trop important avec le modèle PyTorch")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# src/embedding_cache.py
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: verrou limité au processus
+    fcntl = None
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 "data", "embedding_cache")
+
+KEY_SIZE = 16  # octets d'empreinte blake2b par texte
+
+_SPACES = re.compile(r"\s+")
+
+# Un verrou par dossier de cache, partagé par toutes les instances du processus
+_DIRECTORY_LOCKS: Dict[str, threading.Lock] = {}
+_DIRECTORY_LOCKS_LOCK = threading.Lock()
+
+
+def _directory_lock(directory: str) -> threading.Lock:
+    with _DIRECTORY_LOCKS_LOCK:
+        return _DIRECTORY_LOCKS.setdefault(os.path.realpath(directory), threading.Lock())
+
+
+def normalize_text(text: str) -> str:
+    """Forme canonique d'un texte: Unicode NFC, espaces réduits"""
+    return _SPACES.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class EmbeddingCache:
+    """
+    Cache disque des embeddings, clé (modèle, empreinte du texte normalisé).
+
+    Un dossier par modèle:
+        keys.bin     - empreintes de 16 octets, une par ligne de vecteurs
+        vectors.bin  - matrice (n, dim) float16/float32, lue par memmap
+        meta.json    - modèle, dimension, type
+    Les écritures sont des ajouts en fin de fichier (vecteurs puis clés):
+    après un arrêt brutal, seules les lignes complètes sont relues.
+    Plusieurs instances (sessions Streamlit, RAGSetup, autres processus)
+    peuvent écrire dans le même dossier: chaque ajout se fait sous verrou
+    (fcntl), après relecture des clés ajoutées par les autres.
+    """
+
+    def __init__(self, model_name: str, directory: str = DEFAULT_CACHE_DIR,
+                 dtype: str = "float16"):
+        """
+        Args:
+            model_name: Modèle d'embedding (les vecteurs de modèles différents ne se mélangent pas)
+            directory: Dossier racine du cache
+            dtype: "float16" (moitié moins de disque) ou "float32"
+        """
+        self.model_name = model_name
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        os.makedirs(self.directory, exist_ok=True)
+        self._keys_path = os.path.join(self.directory, "keys.bin")
+        self._vectors_path = os.path.join(self.directory, "vectors.bin")
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._lock_path = os.path.join(self.directory, ".lock")
+        self._lock = threading.Lock()
+        self._directory_lock = _directory_lock(self.directory)
+        self._rows = {}
+        self._count = 0  # lignes du fichier déjà indexées
+        self._mmap = None
+        self.hits = 0
+        self.misses = 0
+
+        self.dim = None
+        self.dtype = np.dtype(dtype)
+        self._load_meta()
+        if self.dim is not None:
+            self._sync_index()
+
+    def _load_meta(self):
+        if self.dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim, self.dtype = meta["dim"], np.dtype(meta["dtype"])
+
+    def _sync_index(self) -> int:
+        """Lit les clés ajoutées depuis la dernière lecture (par cette instance ou une autre)"""
+        row_bytes = self.dim * self.dtype.itemsize
+        vector_rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+        known = self._count
+        tail = b""
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, "rb") as f:
+                f.seek(known * KEY_SIZE)
+                tail = f.read()
+        count = min(known + len(tail) // KEY_SIZE, vector_rows)
+        for i in range(known, count):
+            offset = (i - known) * KEY_SIZE
+            self._rows.setdefault(tail[offset:offset + KEY_SIZE], i)
+        self._count = max(count, known)
+        return self._count
+
+    def _refresh(self):
+        """Relit l'index si une autre instance a ajouté des clés"""
+        if self.dim is None:
+            self._load_meta()
+        if self.dim is not None and os.path.exists(self._keys_path) and \
+                os.path.getsize(self._keys_path) > self._count * KEY_SIZE:
+            self._sync_index()
+
+    @contextmanager
+    def _write_lock(self):
+        """Verrou d'écriture du dossier: threads du processus puis autres processus"""
+        with self._directory_lock, open(self._lock_path, "a+b") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def key(self, text: str) -> bytes:
+        material = f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.blake2b(material, digest_size=KEY_SIZE).digest()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _matrix(self) -> np.ndarray:
+        """Vue memmap des vecteurs (recréée quand le fichier a grandi)"""
+        count = self._count
+        if self._mmap is None or self._mmap.shape[0] < count:
+            self._mmap = np.memmap(self._vectors_path, dtype=self.dtype, mode="r",
+                                   shape=(count, self.dim))
+        return self._mmap
+
+    def get_many(self, texts: Sequence[str]) -> Tuple[List[Optional[np.ndarray]], List[int]]:
+        """
+        Recherche groupée
+
+        Returns:
+            (vecteurs float32 ou None par texte, indices des textes absents)
+        """
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            self._refresh()
+            rows = [self._rows.get(key) for key in keys]
+            found = [row for row in rows if row is not None]
+            matrix = self._matrix()[np.array(found)].astype(np.float32) if found else None
+        vectors, missing, position = [], [], 0
+        for i, row in enumerate(rows):
+            if row is None:
+                vectors.append(None)
+                missing.append(i)
+            else:
+                vectors.append(matrix[position])
+                position += 1
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return vectors, missing
+
+    def put_many(self, texts: Sequence[str], vectors) -> int:
+        """Ajoute des embeddings (les textes déjà présents sont ignorés)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._write_lock(), self._lock:
+            # Un autre écrivain a pu créer le cache ou ajouter des lignes
+            self._load_meta()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim, "dtype": self.dtype.name}, f)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Dimension {vectors.shape[1]} != {self.dim} pour {self.model_name}")
+            start = self._sync_index()
+            # Lignes incomplètes d'une écriture interrompue: les retirer avant d'ajouter
+            for path, size in ((self._keys_path, start * KEY_SIZE),
+                               (self._vectors_path, start * self.dim * self.dtype.itemsize)):
+                if os.path.exists(path) and os.path.getsize(path) != size:
+                    with open(path, "r+b") as f:
+                        f.truncate(size)
+            new_keys, new_rows, seen = [], [], set()
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key not in self._rows and key not in seen:
+                    seen.add(key)
+                    new_keys.append(key)
+                    new_rows.append(vector)
+            if not new_keys:
+                return 0
+            with open(self._vectors_path, "ab") as f:
+                f.write(np.asarray(new_rows, dtype=self.dtype).tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            # Indices pris dans le fichier (et non dans le compte de cette instance)
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = start + offset
+            self._count = start + len(new_keys)
+            return len(new_keys)
+
+    def embed(self, texts: Sequence[str], embed_fn: Callable[[List[str]], Sequence],
+              batch_size: int = 256) -> List[np.ndarray]:
+        """Embeddings de `texts`: lus dans le cache, calculés par lots pour les absents"""
+        vectors, missing = self.get_many(texts)
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            computed = np.asarray(embed_fn([texts[i] for i in batch]), dtype=np.float32)
+            self.put_many([texts[i] for i in batch], computed)
+            for i, vector in zip(batch, computed):
+                vectors[i] = vector
+        return vectors
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        size = sum(os.path.getsize(p) for p in (self._keys_path, self._vectors_path) if os.path.exists(p))
+        return {"model": self.model_name, "entries": len(self), "dim": self.dim,
+                "dtype": self.dtype.name, "size_mb": round(size / 1e6, 2),
+                "hits": self.hits, "misses": self.misses,
+                "hit_rate_pct": round(100 * self.hits / total, 1) if total else None}
+
+
+class CachedEmbeddingFunction:
+    """
+    Fonction d'embedding ChromaDB adossée à EmbeddingCache: seuls les textes
+    nouveaux ou modifiés passent par le modèle.
+    """
+
+    def __init__(self, inner: Callable[[List[str]], Sequence], cache: EmbeddingCache,
+                 batch_size: int = 256):
+        self.inner = inner
+        self.cache = cache
+        self.batch_size = batch_size
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        vectors = self.cache.embed(list(input), self.inner, self.batch_size)
+        return [vector.tolist() for vector in vectors]
+
+
+class QueryEmbeddingLRU:
+    """
+    LRU mémoire des embeddings de questions (elles ne vont pas dans le cache
+    disque): les absentes d'un lot sont encodées en un seul appel au modèle.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], Sequence], maxsize: int = 1024):
+        self.embed_fn = embed_fn
+        self.maxsize = maxsize
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, texts: Sequence[str]) -> List[np.ndarray]:
+        keys = [normalize_text(text) for text in texts]
+        with self._lock:
+            vectors = [self._vectors.get(key) for key in keys]
+            for key, vector in zip(keys, vectors):
+                if vector is not None:
+                    self._vectors.move_to_end(key)
+        missing = sorted({key for key, vector in zip(keys, vectors) if vector is None})
+        self.hits += sum(1 for vector in vectors if vector is not None)
+        self.misses += len(missing)
+        if missing:
+            computed = np.asarray(self.embed_fn(missing), dtype=np.float32)
+            fresh = dict(zip(missing, computed))
+            with self._lock:
+                self._vectors.update(fresh)
+                while len(self._vectors) > self.maxsize:
+                    self._vectors.popitem(last=False)
+            vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+        return vectors
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._vectors), "hits": self.hits, "misses": self.misses,
+                "hit_rate_pct": round(100 * self.hits / total, 1) if total else None}
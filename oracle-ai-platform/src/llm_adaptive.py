@@ -0,0 +1,236 @@
+# src/llm_adaptive.py
+import math
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+# Bornes de num_predict par clé de prompt (min, max)
+NUM_PREDICT_CAPS = {
+    "security_assessment": (256, 1200),
+    "security_deep_analysis": (256, 900),
+    "backup_recommendation": (256, 1200),
+    "query_analysis": (200, 1400),
+    "anomaly_detection": (128, 700),
+    "chatbot_general": (200, 1600),
+}
+DEFAULT_CAPS = (128, 1500)
+
+# Tailles de fenêtre autorisées. Ollama recharge le modèle quand num_ctx
+# change: une seule valeur par modèle, qui ne diminue que lentement.
+CTX_SIZES = (1024, 2048)
+
+# Marqueurs de nouveau tour qui signalent une génération qui s'emballe
+# (format Instruct/Output de Phi-2); inutiles pour les prompts JSON contraints
+STOP_SEQUENCES = {
+    "chatbot_general": ["<|endoftext|>", "\nUser:", "\nInstruct:"],
+    "query_analysis": ["<|endoftext|>", "\nUser:", "\nInstruct:"],
+    "anomaly_detection": ["<|endoftext|>", "\nUser:", "\nInstruct:"],
+}
+
+# Sortie proportionnelle à l'entrée (lots): num_predict est calculé par l'appelant
+PASSTHROUGH_KEYS = ("anomaly_batch",)
+
+
+class _KeyStats:
+    """Observations d'une clé de prompt"""
+
+    def __init__(self, window: int):
+        self.outputs = deque(maxlen=window)
+        self.truncated = deque(maxlen=window)
+        self.calls = 0
+        self.requested = 0
+        self.limit = 0
+        self.reserved_predict_tokens = 0  # réservation num_predict en moins (tokens, pas du temps)
+        self.reserved_ctx_tokens = 0      # fenêtre num_ctx en moins par rapport à la fenêtre maximale
+        self.adaptive_truncations = 0     # sorties coupées par une limite plus basse que la demande
+        # num_ctx -> [appels, tokens de prompt] (temps économisé mesuré par fenêtre)
+        self.ctx_calls: Dict[int, List[int]] = {}
+
+
+class _ContextWindow:
+    """Fenêtre num_ctx d'un modèle et besoins récents (prompt + sortie)"""
+
+    def __init__(self, size: int, window: int):
+        self.size = size
+        self.required = deque(maxlen=window)
+        self.since_change = 0
+        # num_ctx -> [appels, chargement (s), tokens de prompt, évaluation du prompt (s)]
+        self.costs: Dict[int, List[float]] = {}
+
+    def cost(self, size: int) -> Optional[Tuple[float, float]]:
+        """Chargement moyen par appel et évaluation du prompt par token mesurés pour une fenêtre"""
+        calls, load_s, prompt_tokens, prompt_eval_s = self.costs.get(size, (0, 0.0, 0, 0.0))
+        if not calls or not prompt_tokens:
+            return None
+        return load_s / calls, prompt_eval_s / prompt_tokens
+
+
+class AdaptiveLimits:
+    """
+    Apprend la distribution des longueurs de sortie et de prompt par modèle
+    et clé de prompt, puis choisit num_predict (percentile cible + marge,
+    dans les bornes configurées), num_ctx et les séquences d'arrêt. Les
+    modèles n'ont pas les mêmes longueurs de sortie (petit modèle de la
+    cascade et Phi): chacun a ses propres observations et sa fenêtre.
+    """
+
+    def __init__(self, target_percentile: float = 95, headroom: float = 1.2,
+                 min_samples: int = 20, window: int = 200, max_ctx: int = 2048):
+        self.target_percentile = target_percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.window = window
+        self.ctx_sizes = tuple(size for size in CTX_SIZES if size <= max_ctx) or (max_ctx,)
+        self._stats: Dict[Tuple[Optional[str], str], _KeyStats] = {}
+        self._windows: Dict[Optional[str], _ContextWindow] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, prompt_key: str, model: Optional[str]) -> _KeyStats:
+        stats = self._stats.get((model, prompt_key))
+        if stats is None:
+            stats = self._stats[(model, prompt_key)] = _KeyStats(self.window)
+        return stats
+
+    def _window(self, model: Optional[str]) -> _ContextWindow:
+        window = self._windows.get(model)
+        if window is None:
+            window = self._windows[model] = _ContextWindow(self.ctx_sizes[-1], self.window)
+        return window
+
+    @staticmethod
+    def _percentile(values, q: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+    def num_predict(self, prompt_key: str, requested: int, model: Optional[str] = None) -> int:
+        """Limite de sortie pour une clé de prompt (la valeur demandée tant que l'historique est court)"""
+        low, high = NUM_PREDICT_CAPS.get(prompt_key, DEFAULT_CAPS)
+        with self._lock:
+            stats = self._key(prompt_key, model)
+            stats.requested = requested
+            if prompt_key in PASSTHROUGH_KEYS:
+                stats.limit = requested
+                return requested
+            if len(stats.outputs) < self.min_samples:
+                limit = requested
+            else:
+                observed = self._percentile(stats.outputs, self.target_percentile)
+                limit = int(math.ceil(observed * self.headroom / 32) * 32)
+                # Sorties coupées à la limite: la distribution est sous-estimée, élargir
+                if sum(stats.truncated) > 0.05 * len(stats.truncated):
+                    limit = max(limit, int(stats.limit * 1.5))
+            stats.limit = max(low, min(high, limit))
+            return stats.limit
+
+    def num_ctx(self, prompt_tokens: int, num_predict: int, model: Optional[str] = None) -> int:
+        """
+        Fenêtre de contexte commune aux requêtes d'un modèle: augmente
+        immédiatement si la requête ne tient pas, diminue quand le p99 des
+        besoins observés le permet.
+        """
+        required = prompt_tokens + num_predict
+        with self._lock:
+            window = self._window(model)
+            window.required.append(required)
+            window.since_change += 1
+            if required > window.size:
+                self._set_ctx(window, next((s for s in self.ctx_sizes if s >= required), self.ctx_sizes[-1]))
+            elif window.since_change >= self.min_samples:
+                p99 = self._percentile(window.required, 99)
+                smaller = next((s for s in self.ctx_sizes if s >= p99), self.ctx_sizes[-1])
+                if smaller < window.size:
+                    self._set_ctx(window, smaller)
+            return window.size
+
+    @staticmethod
+    def _set_ctx(window: _ContextWindow, size: int):
+        if size != window.size:
+            window.size = size
+            window.since_change = 0
+
+    @staticmethod
+    def stop_sequences(prompt_key: str) -> List[str]:
+        return list(STOP_SEQUENCES.get(prompt_key, []))
+
+    def observe(self, prompt_key: str, num_predict: int, data: Dict, model: Optional[str] = None,
+                num_ctx: Optional[int] = None):
+        """Enregistre la sortie d'un appel (réponse finale Ollama, num_ctx de la requête)"""
+        output = data.get("eval_count")
+        if not output:
+            return
+        truncated = data.get("done_reason") == "length" or output >= num_predict
+        with self._lock:
+            stats = self._key(prompt_key, model)
+            stats.calls += 1
+            stats.outputs.append(output)
+            stats.truncated.append(1 if truncated else 0)
+            if stats.requested > num_predict:
+                if truncated:
+                    # Coupée par la limite adaptative: un coût, pas une économie
+                    stats.adaptive_truncations += 1
+                else:
+                    stats.reserved_predict_tokens += stats.requested - num_predict
+            if num_ctx:
+                stats.reserved_ctx_tokens += max(0, self.ctx_sizes[-1] - num_ctx)
+                prompt_tokens = data.get("prompt_eval_count") or 0
+                calls = stats.ctx_calls.setdefault(num_ctx, [0, 0])
+                calls[0] += 1
+                calls[1] += prompt_tokens
+                if data.get("prompt_eval_duration") is not None:
+                    cost = self._window(model).costs.setdefault(num_ctx, [0, 0.0, 0, 0.0])
+                    cost[0] += 1
+                    cost[1] += (data.get("load_duration") or 0) / 1e9
+                    cost[2] += prompt_tokens
+                    cost[3] += data["prompt_eval_duration"] / 1e9
+
+    def _saved_seconds(self, stats: _KeyStats, model: Optional[str]) -> Optional[float]:
+        """
+        Temps mesuré en moins grâce aux fenêtres réduites: pour chaque num_ctx,
+        écart de chargement par appel et d'évaluation du prompt par token avec
+        la fenêtre maximale (None tant que les deux n'ont pas été mesurées)
+        """
+        window = self._window(model)
+        baseline = window.cost(self.ctx_sizes[-1])
+        saved, measured = 0.0, False
+        for size, (calls, prompt_tokens) in stats.ctx_calls.items():
+            if size >= self.ctx_sizes[-1]:
+                continue
+            cost = window.cost(size)
+            if baseline is None or cost is None:
+                return None
+            saved += calls * (baseline[0] - cost[0]) + prompt_tokens * (baseline[1] - cost[1])
+            measured = True
+        return round(saved, 1) if measured else None
+
+    def report(self) -> List[Dict]:
+        """Limites choisies, tokens réservés en moins et temps mesuré économisé par modèle et clé de prompt"""
+        rows = []
+        with self._lock:
+            for (model, prompt_key), stats in sorted(self._stats.items(), key=lambda item: str(item[0])):
+                if not stats.calls:
+                    continue
+                rows.append({
+                    "model": model,
+                    "prompt_key": prompt_key,
+                    "calls": stats.calls,
+                    "requested_num_predict": stats.requested,
+                    "num_predict": stats.limit,
+                    f"output_p{int(self.target_percentile)}": self._percentile(stats.outputs, self.target_percentile),
+                    "truncated_pct": round(100 * sum(stats.truncated) / len(stats.truncated), 1),
+                    "adaptive_truncations": stats.adaptive_truncations,
+                    "reserved_predict_tokens": stats.reserved_predict_tokens,
+                    "reserved_ctx_tokens": stats.reserved_ctx_tokens,
+                    # Chargement + évaluation du prompt mesurés par fenêtre (pas de débit de sortie)
+                    "saved_seconds": self._saved_seconds(stats, model),
+                    "num_ctx": self._window(model).size,
+                })
+        return rows
+
+
+_adaptive = AdaptiveLimits()
+
+
+def get_adaptive_limits() -> AdaptiveLimits:
+    """Limites adaptatives partagées par le processus"""
+    return _adaptive
@@ -0,0 +1,534 @@
+# src/llm_backends.py
+import json
+import os
+import time
+import hashlib
+import queue
+import threading
+import requests
+from typing import Dict, Iterator, List, Optional
+
+
+class BackendError(Exception):
+    """Erreur renvoyée par un serveur de modèle (statut HTTP non 200)"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class DeadlineExceeded(Exception):
+    """Échéance d'un appel de génération atteinte (la requête est abandonnée)"""
+
+    def __init__(self, budget: float):
+        super().__init__(f"échéance de {budget:.0f} s dépassée")
+        self.budget = budget
+
+
+class LLMBackend:
+    """
+    Serveur de génération. Les requêtes et réponses utilisent le format de
+    l'API Ollama (/api/generate si `prompt`, /api/chat si `messages`);
+    les autres backends traduisent depuis/vers ce format.
+    """
+
+    kind = "base"
+
+    def __init__(self, base_url: str, model: str, name: Optional[str] = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.name = name or f"{self.kind}@{self.base_url}"
+
+    def generate(self, payload: Dict, timeout: float = 600) -> Dict:
+        raise NotImplementedError
+
+    def stream(self, payload: Dict, timeout: float = 600) -> Iterator[Dict]:
+        raise NotImplementedError
+
+    def list_models(self) -> List[str]:
+        raise NotImplementedError
+
+    def health(self) -> bool:
+        try:
+            self.list_models()
+            return True
+        except Exception:
+            return False
+
+
+class OllamaBackend(LLMBackend):
+    """Serveur Ollama natif"""
+
+    kind = "ollama"
+
+    def _endpoint(self, payload: Dict) -> str:
+        return "/api/chat" if "messages" in payload else "/api/generate"
+
+    def generate(self, payload: Dict, timeout: float = 600) -> Dict:
+        response = requests.post(
+            f"{self.base_url}{self._endpoint(payload)}",
+            json={**payload, "stream": False},
+            timeout=timeout
+        )
+        if response.status_code != 200:
+            try:
+                details = response.json()
+            except Exception:
+                details = response.text[:200]
+            raise BackendError(f"{response.status_code} - {details}", response.status_code)
+        return response.json()
+
+    def stream(self, payload: Dict, timeout: float = 600) -> Iterator[Dict]:
+        with requests.post(
+            f"{self.base_url}{self._endpoint(payload)}",
+            json={**payload, "stream": True},
+            stream=True,
+            timeout=timeout
+        ) as response:
+            if response.status_code != 200:
+                raise BackendError(f"{response.status_code} - {response.text[:200]}",
+                                   response.status_code)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                yield data
+                if data.get("done"):
+                    return
+
+    def list_models(self) -> List[str]:
+        response = requests.get(f"{self.base_url}/api/tags", timeout=10)
+        if response.status_code != 200:
+            raise BackendError(f"Ollama API: {response.status_code}", response.status_code)
+        return [m.get("name", "") for m in response.json().get("models", [])]
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Serveur local compatible OpenAI (llama.cpp server, vLLM, LM Studio...).
+    Traduit le format Ollama vers /v1/completions et /v1/chat/completions.
+    """
+
+    kind = "openai"
+
+    def __init__(self, base_url: str, model: str, name: Optional[str] = None,
+                 api_key: Optional[str] = None):
+        base_url = base_url.rstrip("/")
+        if base_url.endswith("/v1"):
+            base_url = base_url[:-3]
+        super().__init__(base_url, model, name)
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY", "")
+
+    def _headers(self) -> Dict:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _translate(self, payload: Dict, stream: bool):
+        options = payload.get("options", {})
+        body = {
+            # Modèle de la requête (petit modèle de la cascade), sinon celui du backend
+            "model": payload.get("model", self.model),
+            "max_tokens": options.get("num_predict", 1000),
+            "temperature": options.get("temperature", 0.6),
+            "top_p": options.get("top_p", 0.92),
+            "stream": stream,
+        }
+        if options.get("stop"):
+            body["stop"] = options["stop"]
+        if payload.get("format"):
+            body["response_format"] = {"type": "json_object"}
+        if "messages" in payload:
+            body["messages"] = payload["messages"]
+            return "/v1/chat/completions", body
+        body["prompt"] = payload.get("prompt", "")
+        return "/v1/completions", body
+
+    @staticmethod
+    def _normalize(payload: Dict, text: str, data: Dict, done: bool) -> Dict:
+        """Réponse au format Ollama"""
+        if "messages" in payload:
+            result = {"message": {"role": "assistant", "content": text}}
+        else:
+            result = {"response": text}
+        result["done"] = done
+        usage = data.get("usage") or {}
+        if usage:
+            result["prompt_eval_count"] = usage.get("prompt_tokens", 0)
+            result["eval_count"] = usage.get("completion_tokens", 0)
+        return result
+
+    def generate(self, payload: Dict, timeout: float = 600) -> Dict:
+        path, body = self._translate(payload, stream=False)
+        start = time.perf_counter()
+        response = requests.post(f"{self.base_url}{path}", json=body,
+                                 headers=self._headers(), timeout=timeout)
+        if response.status_code != 200:
+            raise BackendError(f"{response.status_code} - {response.text[:200]}",
+                               response.status_code)
+        data = response.json()
+        choice = (data.get("choices") or [{}])[0]
+        text = choice.get("text") if "text" in choice else choice.get("message", {}).get("content", "")
+        result = self._normalize(payload, text or "", data, done=True)
+        result["total_duration"] = int((time.perf_counter() - start) * 1e9)
+        return result
+
+    def stream(self, payload: Dict, timeout: float = 600) -> Iterator[Dict]:
+        path, body = self._translate(payload, stream=True)
+        with requests.post(f"{self.base_url}{path}", json=body, headers=self._headers(),
+                           stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                raise BackendError(f"{response.status_code} - {response.text[:200]}",
+                                   response.status_code)
+            for line in response.iter_lines():
+                if not line or not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    yield self._normalize(payload, "", {}, done=True)
+                    return
+                chunk = json.loads(data)
+                choice = (chunk.get("choices") or [{}])[0]
+                text = choice.get("text") or choice.get("delta", {}).get("content") or ""
+                yield self._normalize(payload, text, chunk, done=False)
+
+    def list_models(self) -> List[str]:
+        response = requests.get(f"{self.base_url}/v1/models", headers=self._headers(), timeout=10)
+        if response.status_code != 200:
+            raise BackendError(f"OpenAI API: {response.status_code}", response.status_code)
+        return [m.get("id", "") for m in response.json().get("data", [])]
+
+
+class MockBackend(LLMBackend):
+    """
+    Backend déterministe sans modèle: même requête, même réponse.
+    Sert aux tests et aux démonstrations hors ligne.
+    """
+
+    kind = "mock"
+
+    def __init__(self, base_url: str = "mock://local", model: str = "phi:latest",
+                 name: Optional[str] = None, latency: float = 0.0):
+        super().__init__(base_url, model, name)
+        self.latency = latency
+
+    def _text(self, payload: Dict) -> str:
+        if "messages" in payload:
+            question = payload["messages"][-1]["content"]
+        else:
+            question = payload.get("prompt", "")
+        digest = hashlib.sha256(question.encode("utf-8")).hexdigest()[:8]
+        if payload.get("format"):
+            return json.dumps({"mock": True, "id": digest})
+        return f"[MOCK {self.model}] Réponse simulée {digest} pour: {question[-120:].strip()}"
+
+    def generate(self, payload: Dict, timeout: float = 600) -> Dict:
+        if self.latency:
+            time.sleep(self.latency)
+        text = self._text(payload)
+        prompt = payload.get("prompt") or json.dumps(payload.get("messages", []))
+        result = {
+            "done": True,
+            "prompt_eval_count": max(1, len(prompt) // 4),
+            "eval_count": max(1, len(text) // 4),
+            "total_duration": int(self.latency * 1e9),
+        }
+        if "messages" in payload:
+            result["message"] = {"role": "assistant", "content": text}
+        else:
+            result["response"] = text
+        return result
+
+    def stream(self, payload: Dict, timeout: float = 600) -> Iterator[Dict]:
+        final = self.generate(payload, timeout)
+        text = final.get("response") or final.get("message", {}).get("content", "")
+        for word in text.split(" "):
+            piece = word + " "
+            if "messages" in payload:
+                yield {"message": {"role": "assistant", "content": piece}, "done": False}
+            else:
+                yield {"response": piece, "done": False}
+        final = {k: v for k, v in final.items() if k not in ("response", "message")}
+        yield final
+
+    def list_models(self) -> List[str]:
+        return [self.model]
+
+
+class _BackendState:
+    """Mesures d'un backend: requêtes en cours, latence lissée, santé"""
+
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+        self.inflight = 0
+        self.latency = None  # secondes par requête (moyenne mobile exponentielle)
+        self.failures = 0
+        self.unhealthy_until = 0.0
+
+
+class BackendRouter:
+    """
+    Répartit les requêtes entre plusieurs serveurs de modèle.
+
+    Le backend choisi est celui qui minimise (requêtes en cours + 1) x latence
+    mesurée. Un backend en échec (connexion, timeout, erreur 5xx) est écarté
+    pendant `cooldown` secondes et la requête bascule sur le suivant.
+    """
+
+    def __init__(self, backends: List[LLMBackend], cooldown: float = 30.0,
+                 smoothing: float = 0.3):
+        if not backends:
+            raise ValueError("Au moins un backend LLM est requis")
+        self.states = [_BackendState(b) for b in backends]
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    @property
+    def backends(self) -> List[LLMBackend]:
+        return [s.backend for s in self.states]
+
+    def _ranked(self) -> List[_BackendState]:
+        """Backends triés du plus au moins favorable (les sains d'abord)"""
+        now = time.monotonic()
+        with self._lock:
+            known = [s.latency for s in self.states if s.latency is not None]
+            default_latency = min(known) if known else 1.0
+
+            def score(state: _BackendState):
+                latency = state.latency if state.latency is not None else default_latency
+                return (state.unhealthy_until > now, (state.inflight + 1) * latency)
+
+            return sorted(self.states, key=score)
+
+    def _acquire(self, state: _BackendState):
+        with self._lock:
+            state.inflight += 1
+
+    def _release(self, state: _BackendState, elapsed: Optional[float], failed: bool):
+        with self._lock:
+            state.inflight -= 1
+            if failed:
+                state.failures += 1
+                state.unhealthy_until = time.monotonic() + self.cooldown
+            else:
+                state.failures = 0
+                state.unhealthy_until = 0.0
+                if elapsed is not None:
+                    if state.latency is None:
+                        state.latency = elapsed
+                    else:
+                        state.latency += self.smoothing * (elapsed - state.latency)
+
+    @staticmethod
+    def _is_failover_error(error: Exception) -> bool:
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        return isinstance(error, BackendError) and (error.status_code or 500) >= 500
+
+    @staticmethod
+    def _budget(timeout: float, deadline: Optional[float]) -> float:
+        """Timeout d'une tentative: le plus court entre `timeout` et l'échéance"""
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(0.0)
+        return min(timeout, remaining)
+
+    @staticmethod
+    def _expired(error: Exception, deadline: Optional[float]) -> bool:
+        # Timeout dû à l'échéance de l'appelant, pas à une panne du backend
+        return (deadline is not None and isinstance(error, requests.exceptions.Timeout)
+                and time.monotonic() >= deadline - 0.05)
+
+    def generate(self, payload: Dict, timeout: float = 600, deadline: Optional[float] = None,
+                 hedge_after: Optional[float] = None) -> Dict:
+        """
+        Génère avec basculement automatique sur le backend suivant en cas d'échec
+
+        Args:
+            deadline: Échéance absolue (time.monotonic()); à l'expiration, la
+                      connexion est fermée, ce qui annule la génération côté serveur
+            hedge_after: Si la réponse tarde plus de `hedge_after` secondes,
+                         la même requête est lancée sur un second backend
+        """
+        ranked = self._ranked()
+        if hedge_after is not None and len(ranked) > 1:
+            return self._hedged_generate(payload, ranked, timeout, deadline, hedge_after)
+
+        last_error = None
+        for state in ranked:
+            budget = self._budget(timeout, deadline)
+            self._acquire(state)
+            start = time.perf_counter()
+            try:
+                result = state.backend.generate(payload, budget)
+            except Exception as e:
+                if self._expired(e, deadline):
+                    self._release(state, None, failed=False)
+                    raise DeadlineExceeded(budget) from e
+                failover = self._is_failover_error(e)
+                self._release(state, None, failed=failover)
+                if not failover:
+                    raise
+                last_error = e
+                continue
+            self._release(state, time.perf_counter() - start, failed=False)
+            result.setdefault("backend", state.backend.name)
+            return result
+        raise last_error
+
+    def _hedged_generate(self, payload: Dict, ranked: List["_BackendState"], timeout: float,
+                         deadline: Optional[float], hedge_after: float) -> Dict:
+        """
+        Requête doublée: le second backend démarre après `hedge_after` secondes
+        (ou dès l'échec du premier); la première réponse complète l'emporte.
+        Les tentatives passent en flux pour que le perdant soit annulé côté
+        serveur au fragment suivant.
+        """
+        budget = self._budget(timeout, deadline)
+        cancel = threading.Event()
+        outcomes = queue.Queue()
+
+        def attempt(state: _BackendState):
+            self._acquire(state)
+            start = time.perf_counter()
+            texts, final, cancelled = [], {}, False
+            try:
+                stream = state.backend.stream(payload, budget)
+                try:
+                    for data in stream:
+                        if cancel.is_set():
+                            cancelled = True
+                            break
+                        texts.append(data.get("message", {}).get("content", "")
+                                     if "message" in data else data.get("response", ""))
+                        if data.get("done"):
+                            final = data
+                finally:
+                    stream.close()
+            except Exception as e:
+                failover = self._is_failover_error(e) and not self._expired(e, deadline)
+                self._release(state, None, failed=failover)
+                outcomes.put((state, e))
+                return
+            self._release(state, None if cancelled else time.perf_counter() - start, failed=False)
+            if cancelled:
+                return
+            result = dict(final, done=True, backend=state.backend.name)
+            if "messages" in payload:
+                result["message"] = {"role": "assistant", "content": "".join(texts)}
+            else:
+                result["response"] = "".join(texts)
+            outcomes.put((state, result))
+
+        end = time.monotonic() + budget
+        candidates = iter(ranked)
+        running, last_error, hedged = 0, None, False
+        threading.Thread(target=attempt, args=(next(candidates),), daemon=True).start()
+        running += 1
+        try:
+            while running:
+                wait = end - time.monotonic()
+                if not hedged:
+                    wait = min(wait, hedge_after)
+                try:
+                    state, outcome = outcomes.get(timeout=max(0.0, wait))
+                except queue.Empty:
+                    if time.monotonic() >= end:
+                        raise DeadlineExceeded(budget)
+                    outcome = None
+                if isinstance(outcome, dict):
+                    outcome["hedged"] = hedged
+                    return outcome
+                if outcome is not None:
+                    running -= 1
+                    last_error = outcome
+                    if self._expired(outcome, deadline):
+                        raise DeadlineExceeded(budget) from outcome
+                    if not self._is_failover_error(outcome):
+                        raise outcome
+                # Délai de couverture écoulé ou échec: lancer le backend suivant
+                if outcome is not None or not hedged:
+                    hedged = True
+                    state = next(candidates, None)
+                    if state is not None:
+                        threading.Thread(target=attempt, args=(state,), daemon=True).start()
+                        running += 1
+            raise last_error
+        finally:
+            cancel.set()
+
+    def stream(self, payload: Dict, timeout: float = 600,
+               deadline: Optional[float] = None) -> Iterator[Dict]:
+        """Flux de fragments; le basculement n'a lieu qu'avant le premier fragment"""
+        last_error = None
+        for state in self._ranked():
+            budget = self._budget(timeout, deadline)
+            self._acquire(state)
+            start = time.perf_counter()
+            started = False
+            failed = False
+            try:
+                for chunk in state.backend.stream(payload, budget):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if self._expired(e, deadline):
+                    raise DeadlineExceeded(budget) from e
+                failed = self._is_failover_error(e)
+                if started or not failed:
+                    raise
+                last_error = e
+            finally:
+                elapsed = None if failed else time.perf_counter() - start
+                self._release(state, elapsed, failed=failed)
+        raise last_error
+
+    def snapshot(self) -> List[Dict]:
+        """État courant des backends (pour le dashboard et le debug)"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "name": s.backend.name,
+                "kind": s.backend.kind,
+                "model": s.backend.model,
+                "inflight": s.inflight,
+                "latency_s": round(s.latency, 3) if s.latency is not None else None,
+                "healthy": s.unhealthy_until <= now,
+                "failures": s.failures,
+            } for s in self.states]
+
+
+BACKEND_TYPES = {
+    "ollama": OllamaBackend,
+    "openai": OpenAICompatibleBackend,
+    "mock": MockBackend,
+}
+
+
+def backends_from_env(model: str, default_url: str = "http://localhost:11434") -> List[LLMBackend]:
+    """
+    Construit les backends depuis LLM_BACKENDS, par exemple:
+        LLM_BACKENDS=ollama=http://localhost:11434,openai=http://gpu2:8080/v1,mock=
+    Sans configuration: un seul serveur Ollama sur `default_url`.
+    """
+    spec = os.getenv("LLM_BACKENDS", "").strip()
+    if not spec:
+        return [OllamaBackend(default_url, model)]
+
+    backends = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kind, _, url = entry.partition("=")
+        backend_class = BACKEND_TYPES.get(kind.strip().lower())
+        if backend_class is None:
+            print(f"⚠️ Backend LLM inconnu ignoré: {kind}")
+            continue
+        if backend_class is MockBackend:
+            backends.append(MockBackend(model=model))
+        else:
+            backends.append(backend_class(url.strip(), model))
+    return backends or [OllamaBackend(default_url, model)]
@@ -0,0 +1,203 @@
+# src/llm_cascade.py
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from src.llm_engine_phi import LLMEnginePhi
+    from src.llm_structured import SECURITY_ASSESSMENT_SCHEMA, validate
+except ImportError:
+    from llm_engine_phi import LLMEnginePhi
+    from llm_structured import SECURITY_ASSESSMENT_SCHEMA, validate
+
+
+# Niveaux de la cascade, du moins coûteux au plus coûteux
+TIERS = {0: "règles / documentation", 1: "petit modèle", 2: "modèle complet"}
+
+# Sections de configuration que SecurityAuditor sait auditer sans LLM
+AUDIT_SECTIONS = ("users", "roles", "system_privileges", "object_privileges",
+                  "profiles", "audit_config", "database_parameters")
+
+# Réponses qui trahissent un modèle dépassé par la question
+LOW_CONFIDENCE_MARKERS = ("je ne sais pas", "je ne suis pas sûr", "i don't know",
+                          "i'm not sure", "as an ai", "en tant qu'ia")
+
+STOPWORDS = {
+    "comment", "quelle", "quelles", "quel", "quels", "pour", "avec", "dans", "sur",
+    "est", "sont", "faire", "une", "des", "les", "que", "qui", "quoi", "pourquoi",
+    "mon", "mes", "ma", "cette", "ces", "entre", "plus", "moins", "what", "how",
+    "the", "and", "does", "with", "oracle",
+}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def key_terms(text: str) -> List[str]:
+    """Termes significatifs d'une question (sans accents ni mots vides)"""
+    words = re.findall(r"[a-z0-9_$#]{3,}", _normalize(text))
+    return [w for w in dict.fromkeys(words) if w not in STOPWORDS]
+
+
+def keyword_coverage(query: str, text: str) -> float:
+    """Part des termes de la question présents dans le texte"""
+    terms = key_terms(query)
+    if not terms:
+        return 0.0
+    normalized = _normalize(text)
+    return sum(1 for term in terms if term in normalized) / len(terms)
+
+
+class ModelCascade:
+    """
+    Réponse en cascade devant LLMEnginePhi:
+        niveau 0 - règles SecurityAuditor / documents RAG statiques
+        niveau 1 - petit modèle (LLM_SMALL_MODEL, ex: qwen2.5:0.5b)
+        niveau 2 - Phi
+    Chaque niveau n'est retenu que si sa réponse passe les contrôles de
+    confiance (schéma JSON, score de recherche, couverture des mots-clés);
+    sinon la requête passe au niveau suivant.
+    """
+
+    def __init__(self, engine: LLMEnginePhi, small_engine: Optional[LLMEnginePhi] = None,
+                 auditor=None, min_retrieval_score: float = 0.75, min_lexical_score: float = 0.9,
+                 min_coverage: float = 0.6, min_answer_words: int = 40):
+        """
+        Args:
+            engine: Moteur du modèle complet (niveau 2)
+            small_engine: Moteur du petit modèle (niveau 1); défaut LLM_SMALL_MODEL
+            auditor: SecurityAuditor sans LLM (llm_engine=None) pour les évaluations par règles
+            min_retrieval_score: Similarité vectorielle minimale du meilleur document (niveau 0)
+            min_lexical_score: Score BM25 relatif minimal d'un document trouvé par mots-clés seuls
+            min_coverage: Couverture minimale des mots-clés de la question
+            min_answer_words: Longueur minimale d'une réponse du petit modèle
+        """
+        self.engine = engine
+        if small_engine is None and os.getenv("LLM_SMALL_MODEL"):
+            small_engine = LLMEnginePhi(model=os.getenv("LLM_SMALL_MODEL"),
+                                        base_url=engine.base_url)
+        self.small_engine = small_engine
+        self.auditor = auditor
+        self.min_retrieval_score = min_retrieval_score
+        self.min_lexical_score = min_lexical_score
+        self.min_coverage = min_coverage
+        self.min_answer_words = min_answer_words
+        self._served = {tier: 0 for tier in TIERS}
+        self._lock = threading.Lock()
+
+    def _serve(self, tier: int, reason: str, **result) -> Dict:
+        with self._lock:
+            self._served[tier] += 1
+        return {"tier": tier, "reason": reason, **result}
+
+    # -- Chat ---------------------------------------------------------------
+
+    def chat(self, query: str, history: Optional[List[Dict]] = None,
+             context_docs: Optional[List[Dict]] = None, context: str = "") -> Dict:
+        """
+        Réponse de chat au niveau le moins coûteux suffisant
+
+        Args:
+            context_docs: Documents RAG ({'content', 'metadata', 'distance', 'lexical_score'})
+            context: Contexte RAG déjà mis en forme pour les modèles
+
+        Returns:
+            {"answer": str, "tier": int, "reason": str}
+        """
+        docs = context_docs or []
+        # Niveau 0: un document complet couvre entièrement une question sans suite de conversation
+        if docs and not history and self._whole_document(docs[0]):
+            best = docs[0]
+            # Pertinence absolue: distance Chroma, ou score BM25 relatif (jamais le rang fusionné)
+            if best.get("distance") is not None:
+                score, threshold = 1 - best["distance"], self.min_retrieval_score
+            else:
+                score, threshold = best.get("lexical_score") or 0.0, self.min_lexical_score
+            coverage = keyword_coverage(query, best["content"])
+            if score >= threshold and coverage >= max(self.min_coverage, 0.8):
+                topic = best.get("metadata", {}).get("topic", "documentation")
+                answer = (f"📚 Réponse issue de la base de connaissances Oracle ({topic}):\n\n"
+                          f"{best['content'].strip()}")
+                return self._serve(0, f"document {topic} (score {score:.2f}, couverture {coverage:.0%})",
+                                   answer=answer)
+
+        # Niveau 1: petit modèle, conservé si sa réponse est complète et pertinente
+        if self.small_engine:
+            answer = self.small_engine.chat_response(query, history or [], context=context)
+            confident, reason = self._check_answer(query, answer)
+            if confident:
+                return self._serve(1, reason, answer=answer)
+            print(f"🔼 Cascade: escalade vers {self.engine.model} ({reason})")
+
+        answer = self.engine.chat_response(query, history or [], context=context)
+        return self._serve(2, "modèle complet", answer=answer)
+
+    @staticmethod
+    def _whole_document(doc: Dict) -> bool:
+        """
+        Document rendu tel quel au niveau 0: ni tronqué pour l'affichage, ni
+        fragment d'un document découpé en plusieurs chunks
+        """
+        if doc.get("truncated"):
+            return False
+        metadata = doc.get("metadata") or {}
+        if "chunks" in metadata:
+            return metadata["chunks"] == 1
+        # Chunk sans nombre total connu (collection antérieure): fragment possible
+        return "chunk" not in metadata
+
+    def _check_answer(self, query: str, answer: str) -> Tuple[bool, str]:
+        if not answer or answer.startswith("❌"):
+            return False, "erreur du petit modèle"
+        if len(answer.split()) < self.min_answer_words:
+            return False, "réponse trop courte"
+        lowered = answer.lower()
+        if any(marker in lowered for marker in LOW_CONFIDENCE_MARKERS):
+            return False, "réponse incertaine"
+        coverage = keyword_coverage(query, answer)
+        if coverage < self.min_coverage:
+            return False, f"couverture des mots-clés {coverage:.0%}"
+        return True, f"petit modèle (couverture {coverage:.0%})"
+
+    # -- Évaluation de sécurité ----------------------------------------------
+
+    def assess_security(self, config: Dict) -> Dict:
+        """
+        Évaluation de sécurité au niveau le moins coûteux suffisant
+
+        Returns:
+            Évaluation (score, risks, recommendations) + "tier" et "reason"
+        """
+        # Niveau 0: configuration tabulaire (DataFrames extraits de la base) que les règles savent auditer
+        if self.auditor and isinstance(config, dict) and any(
+                hasattr(config.get(k), "columns") for k in AUDIT_SECTIONS):
+            try:
+                report = self.auditor.audit_database(config)
+                result = {key: report[key] for key in ("score", "risks", "recommendations")}
+                if not validate(result, SECURITY_ASSESSMENT_SCHEMA):
+                    return self._serve(0, "règles SecurityAuditor", **result)
+            except Exception as e:
+                print(f"⚠️ Cascade: règles SecurityAuditor inapplicables ({e})")
+
+        # Niveau 1: JSON du petit modèle, conservé seulement s'il est conforme au schéma
+        if self.small_engine:
+            result = self.small_engine.generate_json("security_assessment",
+                                                     variables={"config": config}, max_tokens=800)
+            errors = validate(result, SECURITY_ASSESSMENT_SCHEMA)
+            if not errors:
+                return self._serve(1, "JSON conforme du petit modèle", **result)
+            print(f"🔼 Cascade: escalade sécurité ({errors[0]})")
+
+        return self._serve(2, "modèle complet", **self.engine.assess_security(config))
+
+    def snapshot(self) -> List[Dict]:
+        """Répartition des réponses par niveau"""
+        with self._lock:
+            total = sum(self._served.values()) or 1
+            return [{"tier": tier, "label": TIERS[tier], "served": count,
+                     "share_pct": round(100 * count / total, 1)}
+                    for tier, count in self._served.items()]
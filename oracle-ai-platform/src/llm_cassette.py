@@ -0,0 +1,206 @@
+# src/llm_cassette.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional
+
+try:
+    from src.llm_backends import LLMBackend, BackendError
+except ImportError:
+    from llm_backends import LLMBackend, BackendError
+
+
+CASSETTE_MODES = ("record", "replay", "auto")
+
+# Champs sans effet sur le texte généré, exclus de l'empreinte. num_ctx est
+# choisi d'après l'historique du processus (llm_adaptive): l'inclure rendrait
+# le rejeu dépendant de l'ordre des requêtes. num_predict reste dans
+# l'empreinte: avec une cassette, le moteur envoie la valeur demandée, sans
+# limite adaptative ni réduction à l'échéance.
+_IGNORED_FIELDS = ("stream", "keep_alive")
+_IGNORED_OPTIONS = ("num_ctx",)
+
+
+def request_fingerprint(payload: Dict) -> str:
+    """Empreinte d'une requête: modèle, prompt/messages, format et options"""
+    material = {k: v for k, v in payload.items() if k not in _IGNORED_FIELDS}
+    if isinstance(material.get("options"), dict):
+        material["options"] = {k: v for k, v in material["options"].items()
+                               if k not in _IGNORED_OPTIONS}
+    encoded = json.dumps(material, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class CassetteStore:
+    """
+    Enregistrements sur disque (SQLite, une ligne par empreinte, JSON
+    compressé zlib): fragments de texte, instants d'arrivée et réponse
+    finale avec ses métadonnées de durée.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS cassette ("
+                       "fingerprint TEXT PRIMARY KEY, model TEXT, recorded_at REAL, data BLOB)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, fingerprint: str) -> Optional[Dict]:
+        with self._connect() as db:
+            row = db.execute("SELECT data FROM cassette WHERE fingerprint = ?",
+                             (fingerprint,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def put(self, fingerprint: str, model: str, record: Dict):
+        blob = zlib.compress(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+        with self._lock, self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO cassette VALUES (?, ?, ?, ?)",
+                       (fingerprint, model, time.time(), blob))
+
+    def __len__(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM cassette").fetchone()[0]
+
+
+class CassetteBackend(LLMBackend):
+    """
+    Enregistre ou rejoue les réponses d'un backend.
+
+    Modes:
+        record - appelle le backend et enregistre chaque réponse
+        replay - sert uniquement les enregistrements (BackendError 404 sinon)
+        auto   - rejoue si l'enregistrement existe, sinon enregistre
+    Avec `realtime=True`, le rejeu respecte la latence et le rythme des
+    fragments enregistrés (banc d'essai du reste du pipeline sans modèle).
+    """
+
+    kind = "cassette"
+
+    def __init__(self, inner: Optional[LLMBackend], path: str, mode: str = "auto",
+                 realtime: bool = False, model: Optional[str] = None):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Mode cassette inconnu: {mode}")
+        if inner is None and mode != "replay":
+            raise ValueError("Un backend réel est nécessaire pour enregistrer")
+        super().__init__(f"cassette://{os.path.basename(path)}",
+                         model or inner.model,
+                         f"cassette[{mode}]@{inner.name if inner else os.path.basename(path)}")
+        self.inner = inner
+        self.mode = mode
+        self.realtime = realtime
+        self.store = CassetteStore(path)
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, payload: Dict) -> Optional[Dict]:
+        if self.mode == "record":
+            return None
+        record = self.store.get(request_fingerprint(payload))
+        if record is not None:
+            self.hits += 1
+        elif self.mode == "replay":
+            self.misses += 1
+            raise BackendError("cassette: aucune réponse enregistrée pour cette requête", 404)
+        return record
+
+    def _record(self, payload: Dict, chunks: List[str], offsets: List[float],
+                final: Dict, elapsed: float):
+        self.misses += 1
+        self.store.put(request_fingerprint(payload), payload.get("model", self.model), {
+            "chat": "messages" in payload,
+            "chunks": chunks,
+            "offsets": offsets,
+            "final": {k: v for k, v in final.items() if k not in ("response", "message")},
+            "elapsed": elapsed,
+        })
+
+    @staticmethod
+    def _piece(record: Dict, text: str, done: bool) -> Dict:
+        if record["chat"]:
+            return {"message": {"role": "assistant", "content": text}, "done": done}
+        return {"response": text, "done": done}
+
+    def generate(self, payload: Dict, timeout: float = 600) -> Dict:
+        record = self._lookup(payload)
+        if record is None:
+            started = time.perf_counter()
+            result = self.inner.generate(payload, timeout)
+            text = result.get("message", {}).get("content", "") if "message" in result \
+                else result.get("response", "")
+            elapsed = time.perf_counter() - started
+            self._record(payload, [text], [elapsed], result, elapsed)
+            return result
+
+        if self.realtime:
+            time.sleep(record["elapsed"])
+        result = self._piece(record, "".join(record["chunks"]), True)
+        result.update(record["final"])
+        return result
+
+    def stream(self, payload: Dict, timeout: float = 600) -> Iterator[Dict]:
+        record = self._lookup(payload)
+        if record is None:
+            yield from self._stream_and_record(payload, timeout)
+            return
+
+        started = time.perf_counter()
+        for text, offset in zip(record["chunks"], record["offsets"]):
+            if self.realtime:
+                delay = offset - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            yield self._piece(record, text, False)
+        if self.realtime:
+            time.sleep(max(0.0, record["elapsed"] - (time.perf_counter() - started)))
+        final = self._piece(record, "", True)
+        final.update(record["final"])
+        yield final
+
+    def _stream_and_record(self, payload: Dict, timeout: float) -> Iterator[Dict]:
+        started = time.perf_counter()
+        chunks, offsets, final = [], [], {}
+        for data in self.inner.stream(payload, timeout):
+            text = data.get("message", {}).get("content", "") if "message" in data \
+                else data.get("response", "")
+            if text:
+                chunks.append(text)
+                offsets.append(time.perf_counter() - started)
+            if data.get("done"):
+                final = data
+            yield data
+        # Flux consommé jusqu'au bout seulement: un flux coupé n'est pas une réponse complète
+        self._record(payload, chunks, offsets, final, time.perf_counter() - started)
+
+    def list_models(self) -> List[str]:
+        if self.inner is not None and self.mode != "replay":
+            return self.inner.list_models()
+        with sqlite3.connect(self.store.path) as db:
+            models = [row[0] for row in db.execute("SELECT DISTINCT model FROM cassette")]
+        return models or [self.model]
+
+
+def cassette_from_env(backends: List[LLMBackend], model: str) -> List[LLMBackend]:
+    """
+    Enveloppe les backends dans une cassette si LLM_CASSETTE est défini:
+        LLM_CASSETTE=data/cassettes/llm.db
+        LLM_CASSETTE_MODE=record|replay|auto  (défaut: auto)
+        LLM_CASSETTE_REALTIME=1               (rejouer avec la latence enregistrée)
+    """
+    path = os.getenv("LLM_CASSETTE", "").strip()
+    if not path:
+        return backends
+    mode = os.getenv("LLM_CASSETTE_MODE", "auto").strip().lower()
+    realtime = os.getenv("LLM_CASSETTE_REALTIME", "0") == "1"
+    print(f"📼 Cassette LLM ({mode}): {path}")
+    if mode == "replay":
+        return [CassetteBackend(None, path, mode, realtime, model=model)]
+    return [CassetteBackend(backend, path, mode, realtime) for backend in backends]
@@ -1,197 +1,181 @@
 # src/llm_engine_phi.py - 
-import yaml
 import json
 import requests
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Tuple, Iterator, List, Union
 import os
 import re
+import hashlib
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
 
-class LLMEnginePhi:
-    def __init__(self, model: str = "phi:latest", base_url: str = "http://localhost:11434"):
-        """
-        LLM Engine optimisé pour Phi avec réponses détaillées
-        """
-        self.model = model
-        self.base_url = base_url
-        self.prompts = self._load_prompts()
-        
-    def _load_prompts(self) -> Dict:
-        """Charge les prompts détaillés pour réponses techniques"""
-        prompts_path = 'data/prompts.yaml'
-        
-        # Prompts détaillés pour réponses techniques complètes
-        default_prompts = {
-            "security_assessment": """Tu es un expert en sécurité Oracle certifié avec 10 ans d'expérience.
-
-Configuration à analyser: {config}
-
-Fournis une analyse COMPLÈTE au format JSON:
-{{
-    "score": 0-100,
-    "risks": [
-        {{
-            "type": "TYPE_RISQUE",
-            "severity": "CRITICAL|HIGH|MEDIUM|LOW",
-            "description": "Description technique détaillée",
-            "details": "Explications techniques avec références Oracle",
-            "recommendation": "Solution spécifique avec commandes SQL à exécuter"
-        }}
-    ],
-    "recommendations": [
-        {{
-            "priority": "CRITICAL|HIGH|MEDIUM|LOW",
-            "action": "Action concrète avec étapes détaillées",
-            "commands": ["Commande SQL spécifique 1", "Commande SQL spécifique 2"]
-        }}
-    ]
-}}
-
-Inclus des exemples concrets et commandes SQL/PLSQL.""",
-            
-            "query_analysis": """Tu es un expert en optimisation SQL Oracle, spécialiste des performances.
-
-REQUÊTE À ANALYSER: {sql_query}
-PLAN D'EXÉCUTION: {execution_plan}
-
-Fournis une analyse TECHNIQUE DÉTAILLÉE incluant:
-
-1. DIAGNOSTIC COMPLET:
-   - Problèmes identifiés (scans complets, jointures hash, opérations coûteuses)
-   - Statistiques à vérifier avec: SELECT * FROM V$SQL WHERE sql_id = '...'
-   - Coût estimé et impact sur les ressources
-
-2. RECOMMANDATIONS D'INDEXATION:
-   - Index recommandés avec syntaxe EXACTE:
-     CREATE INDEX nom_index ON table(colonne) TABLESPACE ts_data;
-   - Index composites si nécessaire
-   - Partitionnement à considérer
-
-3. VERSION OPTIMISÉE DE LA REQUÊTE:
-   - Code SQL complet avant/après
-   - Utilisation de hints si pertinent: /*+ INDEX(table index_name) */
-   - Réécriture avec CTE, sous-requêtes optimisées
-
-4. VÉRIFICATIONS À EFFECTUER:
-   - Commandes pour vérifier les stats: EXEC DBMS_STATS.GATHER_TABLE_STATS('SCHEMA', 'TABLE');
-   - Analyse du plan avec: EXPLAIN PLAN FOR ... SELECT * FROM TABLE(DBMS_XPLAN.DISPLAY);
-   - Monitoring avec: SELECT * FROM V$SQL_MONITOR WHERE sql_id = '...';
-
-5. GAIN DE PERFORMANCE ESTIMÉ: 50-80%
-
-Donne des exemples concrets et des commandes exécutables.""",
-            
-            "backup_recommendation": """Expert en sauvegarde Oracle RMAN avec expérience production.
+try:
+    from src.prompt_budget import TokenCounter, PromptBudget, PromptSection
+    from src.llm_backends import (LLMBackend, BackendRouter, BackendError, DeadlineExceeded,
+                                  backends_from_env)
+    from src.llm_structured import (STRUCTURED_SCHEMAS, JsonStreamParser, validate,
+                                    broken_fields, sub_schema, ANOMALY_BATCH_SCHEMA)
+    from src.llm_telemetry import get_telemetry
+    from src.llm_scheduler import get_scheduler, SchedulerRejected
+    from src.llm_adaptive import get_adaptive_limits
+    from src.prompt_registry import get_prompt_registry, OPTIONAL_PLACEHOLDERS
+    from src.llm_cassette import cassette_from_env
+except ImportError:
+    from prompt_budget import TokenCounter, PromptBudget, PromptSection
+    from llm_backends import (LLMBackend, BackendRouter, BackendError, DeadlineExceeded,
+                              backends_from_env)
+    from llm_structured import (STRUCTURED_SCHEMAS, JsonStreamParser, validate,
+                                broken_fields, sub_schema, ANOMALY_BATCH_SCHEMA)
+    from llm_telemetry import get_telemetry
+    from llm_scheduler import get_scheduler, SchedulerRejected
+    from llm_adaptive import get_adaptive_limits
+    from prompt_registry import get_prompt_registry, OPTIONAL_PLACEHOLDERS
+    from llm_cassette import cassette_from_env
 
-EXIGENCES:
-- RPO: {rpo}
-- RTO: {rto}
-- Taille des données: {data_size}
-- Criticité: {criticality}
 
-Fournis une stratégie COMPLÈTE au format JSON:
-{{
-    "strategy": {{
-        "type": "FULL|INCREMENTAL_LEVEL_1|DIFFERENTIAL",
-        "frequency": "HOURLY|DAILY|WEEKLY",
-        "retention_days": 30,
-        "storage": "DISK_ASM|NFS|CLOUD",
-        "estimated_cost": "coût estimé",
-        "advantages": "liste des avantages",
-        "limitations": "limitations à connaître"
-    }},
-    "rman_script": "Script RMAN COMPLET avec commentaires:
-RUN {{
-    -- Configuration
-    CONFIGURE RETENTION POLICY TO RECOVERY WINDOW OF 7 DAYS;
-    CONFIGURE CONTROLFILE AUTOBACKUP ON;
-    
-    -- Sauvegarde principale
-    ALLOCATE CHANNEL ch1 TYPE DISK;
-    BACKUP AS COMPRESSED BACKUPSET
-      DATABASE
-      PLUS ARCHIVELOG
-      DELETE INPUT;
-    
-    -- Vérification
-    BACKUP VALIDATE DATABASE;
-    
-    -- Rapport
-    REPORT OBSOLETE;
-    LIST BACKUP SUMMARY;
-    
-    RELEASE CHANNEL ch1;
-}}",
-    "implementation_steps": [
-        "Étape 1: Vérifier l'espace disque avec: SELECT * FROM V$RECOVERY_FILE_DEST;",
-        "Étape 2: Configurer les paramètres: ALTER SYSTEM SET DB_RECOVERY_FILE_DEST_SIZE = 100G;",
-        "Étape 3: Tester la restauration sur environnement de test"
-    ]
-}}
+class _InFlightGeneration:
+    """
+    Génération en cours partagée entre plusieurs appelants (single-flight).
+    Le premier appelant (leader) exécute la requête Ollama, les suivants
+    attendent le même résultat ou rejouent le même flux de tokens.
+    """
+    
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: List[str] = []
+        self.result: Optional[str] = None
+        self.done = False
+        self.subscribers = 1
+        self._cond = threading.Condition()
+    
+    def push(self, chunk: str):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+    
+    def finish(self, result: str):
+        with self._cond:
+            self.result = result
+            self.done = True
+            self._cond.notify_all()
+    
+    def wait(self) -> str:
+        with self._cond:
+            while not self.done:
+                self._cond.wait()
+            return self.result
+    
+    def iter_chunks(self) -> Iterator[str]:
+        """Rejoue les tokens déjà reçus puis suit le flux jusqu'à la fin"""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                pending = self.chunks[index:]
+                index = len(self.chunks)
+                finished = self.done
+                result = self.result
+            for chunk in pending:
+                yield chunk
+            if finished:
+                # Flux non streamé (leader en mode bloquant): tout le texte d'un coup
+                if not self.chunks and result:
+                    yield result
+                return
 
-Inclus des commandes de monitoring: LIST BACKUP, REPORT OBSOLETE, CROSSCHECK BACKUP.""",
-            
-            "anomaly_detection": """Expert en monitoring et détection d'anomalies Oracle.
 
-ENTRÉE DE LOG: {log_entry}
-CONTEXTE: {context}
+# Priorité et mode de réduction des variables de prompt quand la fenêtre
+# de contexte est pleine (les instructions du template ne sont jamais coupées)
+PROMPT_SECTIONS = {
+    "query": {"priority": 90, "trim": "middle", "min_tokens": 64},
+    "sql_query": {"priority": 90, "trim": "middle", "min_tokens": 128},
+    "log_entry": {"priority": 90, "trim": "head", "min_tokens": 64},
+    "config": {"priority": 70, "trim": "middle", "min_tokens": 128},
+    "execution_plan": {"priority": 50, "trim": "middle", "min_tokens": 64},
+    "context": {"priority": 40, "trim": "head"},
+    "history": {"priority": 30, "trim": "tail"},
+    # Lots de logs: dimensionnés par detect_anomalies_batch pour tenir dans la fenêtre
+    "logs": {"priority": 95, "trim": "tail"},
+}
 
-Fournis une analyse DÉTAILLÉE avec:
+# Classification des logs par lots (detect_anomalies_batch)
+ANOMALY_RISK_LEVELS = {"NORMAL": "NORMAL", "SUSPECT": "HIGH", "CRITIQUE": "CRITICAL"}
+BATCH_TOKENS_PER_VERDICT = 28  # {"id": 12, "level": "SUSPECT", "reason": "..."} court
+BATCH_MAX_LINE_TOKENS = 96
+BATCH_MAX_ITEMS = 40
 
-1. CLASSIFICATION: NORMAL|SUSPECT|CRITICAL
-2. JUSTIFICATION TECHNIQUE APPROFONDIE:
-   - Pattern détecté et sa signification
-   - Codes d'erreur Oracle et leur explication
-   - Impact potentiel sur la base de données
-3. INVESTIGATION REQUISE:
-   - Requêtes de diagnostic à exécuter
-   - Alertes à vérifier dans Enterprise Manager
-   - Fichiers logs additionnels à examiner
-4. ACTIONS IMMÉDIATES:
-   - Commandes à exécuter pour investigation
-   - Correctifs si nécessaire
-   - Monitoring à mettre en place
-5. DOCUMENTATION:
-   - Notes Oracle MOS pertinentes
-   - Références aux manuels Oracle
-   - Scripts de diagnostic""",
-            
-            "chatbot_general": """Tu es un DBA Oracle SENIOR avec 15 ans d'expérience en production.
+# Horodatages et espaces retirés des lignes de log avant classification
+_LOG_TIMESTAMP = re.compile(r"\b\d{2,4}[-/]\d{2}[-/]\d{2,4}[ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?\b")
+_LOG_SPACES = re.compile(r"\s+")
 
-QUESTION DE L'UTILISATEUR: {query}
-=== EXEMPLES DE BONNES RÉPONSES ===
+# Classe de priorité de chaque prompt dans l'ordonnanceur (défaut: normal)
+PROMPT_PRIORITIES = {
+    "chatbot_general": "interactive",
+    "security_deep_analysis": "batch",
+    "anomaly_batch": "batch",
+}
 
-Q: "Comment améliorer la sécurité ?"
-R: "Pour améliorer la sécurité Oracle:
-1. Activer l'audit: ALTER SYSTEM SET AUDIT_TRAIL='DB' SCOPE=SPFILE;
-2. Mots de passe forts: CREATE PROFILE secure LIMIT PASSWORD_LIFE_TIME 90 PASSWORD_REUSE_MAX 5 FAILED_LOGIN_ATTEMPTS 3;
-3. Révoquer privilèges inutiles: REVOKE DBA FROM app_user;"
+# Échéance par défaut d'un appel selon sa classe de priorité (secondes,
+# surchargeable par LLM_DEADLINE_INTERACTIVE / _NORMAL / _BATCH)
+PRIORITY_DEADLINES = {"interactive": 90.0, "normal": 300.0, "batch": 600.0}
 
-Q: "Comment optimiser une requête ?"
-R: "Pour optimiser:
-1. Créer un index composite: CREATE INDEX idx_orders_customer_date ON orders(customer_id, order_date);
-2. Mettre à jour les statistiques: EXEC DBMS_STATS.GATHER_TABLE_STATS('SCHEMA','ORDERS');
-3. Analyser le plan: EXPLAIN PLAN FOR SELECT ...; puis SELECT * FROM TABLE(DBMS_XPLAN.DISPLAY);"
+# Sortie minimale conservée quand num_predict est réduit pour tenir l'échéance
+MIN_DEADLINE_TOKENS = 64
 
-=== FIN DES EXEMPLES ===
 
-Maintenant réponds à: {query}
-."""
-        }
+class LLMEnginePhi:
+    # Générations en cours, partagées par toutes les instances du processus
+    # (une instance par session Streamlit, un seul modèle local derrière)
+    _inflight: Dict[str, _InFlightGeneration] = {}
+    _inflight_lock = threading.Lock()
+    
+    def __init__(self, model: str = "phi:latest", base_url: str = "http://localhost:11434",
+                 backends: Optional[List[LLMBackend]] = None):
+        """
+        LLM Engine optimisé pour Phi avec réponses détaillées
         
-        if os.path.exists(prompts_path):
-            try:
-                with open(prompts_path, 'r', encoding='utf-8') as f:
-                    loaded = yaml.safe_load(f)
-                    if loaded:
-                        # Fusionner les prompts
-                        for key in loaded:
-                            if key in default_prompts:
-                                default_prompts[key] = loaded[key]
-            except Exception as e:
-                print(f"⚠️ Erreur chargement prompts YAML: {e}")
-                print("✅ Utilisation des prompts détaillés par défaut")
+        Args:
+            model: Modèle à utiliser
+            base_url: Serveur Ollama par défaut
+            backends: Serveurs de génération (Ollama, compatible OpenAI, mock);
+                      par défaut LLM_BACKENDS ou un seul Ollama sur base_url.
+                      LLM_CASSETTE enregistre / rejoue leurs réponses.
+        """
+        self.model = model
+        self.base_url = base_url
+        self.router = BackendRouter(cassette_from_env(backends or backends_from_env(model, base_url), model))
+        # Cassette: num_predict tel que demandé (ni limites adaptatives ni échéance), pour
+        # que l'empreinte d'une requête ne dépende pas de l'historique du processus
+        self.cassette = any(backend.kind == "cassette" for backend in self.router.backends)
+        self.num_ctx = 2048
+        # Garder le modèle (et son cache KV) chargé entre deux requêtes
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self.token_counter = TokenCounter()
+        # Prompts compilés, partagés par le processus et rechargés à chaud
+        self.registry = get_prompt_registry()
+        # Mesures par clé de prompt et modèle (partagées par le processus)
+        self.telemetry = get_telemetry()
+        # num_predict / num_ctx / stop appris à partir des appels observés
+        self.adaptive = get_adaptive_limits()
+        # File d'attente commune à toutes les sessions devant le serveur de modèle
+        self.scheduler = get_scheduler()
+        self.session_id = uuid.uuid4().hex[:12]
+        self._priority_override = threading.local()
+        self._deadline_override = threading.local()
+        self.deadlines = {
+            priority: float(os.getenv(f"LLM_DEADLINE_{priority.upper()}", seconds))
+            for priority, seconds in PRIORITY_DEADLINES.items()
+        }
+        # Requêtes doublées sur un second backend pour les appels interactifs
+        self.hedge = os.getenv("LLM_HEDGE", "0") == "1"
         
-        return default_prompts
+    @property
+    def prompts(self) -> Dict[str, str]:
+        """Textes des prompts actifs (défauts + surcharges data/prompts.yaml)"""
+        return self.registry.sources()
     
     def generate(self, prompt_key: str, 
                  variables: Optional[Dict] = None,
@@ -199,122 +183,471 @@ Maintenant réponds à: {query}
         """
         Génère une réponse détaillée avec Phi
         """
-        template = self.prompts.get(prompt_key, "")
-        if not template:
+        rendered = self._render_prompt(prompt_key, variables, max_tokens)
+        if rendered is None:
             return f"Prompt '{prompt_key}' non trouvé"
         
-        # Remplacer les variables
-        if variables:
-            for key, value in variables.items():
-                placeholder = f"{{{key}}}"
-                if isinstance(value, (dict, list)):
-                    value = json.dumps(value, ensure_ascii=False, indent=2)
-                template = template.replace(placeholder, str(value))
+        prompt, num_predict = rendered
+        payload = self._build_payload(prompt, num_predict, stream=False, prompt_key=prompt_key)
+        return self._run_single_flight(payload, prompt_key)
+    
+    def _run_single_flight(self, payload: Dict, prompt_key: str) -> str:
+        """Exécute la requête, ou attend la génération identique déjà en cours"""
+        flight, is_leader = self._join_flight(payload)
+        if not is_leader:
+            return flight.wait()
         
-        # Ne pas trop limiter la taille du prompt pour garder les instructions
-        prompt = template[:2000]  # Limite raisonnable mais pas trop restrictive
+        try:
+            result = self._call_backend(payload, prompt_key)
+        except BaseException:
+            # Interruption du leader (ex: rerun Streamlit): débloquer les suiveurs
+            self._finish_flight(flight, "❌ Génération interrompue")
+            raise
+        self._finish_flight(flight, result)
+        return result
+    
+    def generate_stream(self, prompt_key: str,
+                        variables: Optional[Dict] = None,
+                        max_tokens: int = 1000) -> Iterator[str]:
+        """
+        Génère une réponse token par token.
+        Si la même génération est déjà en cours, s'abonne à son flux.
+        """
+        rendered = self._render_prompt(prompt_key, variables, max_tokens)
+        if rendered is None:
+            yield f"Prompt '{prompt_key}' non trouvé"
+            return
+        
+        prompt, num_predict = rendered
+        payload = self._build_payload(prompt, num_predict, stream=True, prompt_key=prompt_key)
+        flight, is_leader = self._join_flight(payload)
+        if not is_leader:
+            yield from flight.iter_chunks()
+            return
         
+        result = "❌ Génération interrompue"
         try:
-            # Vérifier d'abord si Ollama est disponible
-            health_check = requests.get(f"{self.base_url}/api/tags", timeout=10)
-            if health_check.status_code != 200:
-                return f"❌ Ollama non disponible: {health_check.status_code}"
-            
-            # Appel à l'API Ollama avec paramètres optimisés pour réponses détaillées
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.6,  # Plus créatif pour réponses détaillées
-                        "top_p": 0.92,
-                        "num_predict": max_tokens,
-                        "num_ctx": 2048,  # Contexte plus large
-                        "repeat_penalty": 1.1,
-                        "top_k": 50,
-                        "mirostat": 2,  # Meilleure cohérence
-                        "mirostat_tau": 5.0,
-                        "mirostat_eta": 0.1
-                    }
-                },
-                timeout=600  # Timeout plus long pour réponses détaillées
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                response_text = result.get("response", "Pas de réponse")
-                
-                # Nettoyer la réponse si nécessaire
-                if response_text.startswith("Sure") or response_text.startswith("Okay"):
-                    # Enlever les préambules automatiques
-                    lines = response_text.split('\n')
-                    response_text = '\n'.join([line for line in lines if not line.startswith(('Sure', 'Okay', 'Here'))])
-                
-                return response_text
+            parts = []
+            for chunk in self._stream_backend(payload, prompt_key):
+                parts.append(chunk)
+                flight.push(chunk)
+                yield chunk
+            result = "".join(parts)
+        finally:
+            self._finish_flight(flight, result)
+    
+    def generate_json(self, prompt_key: str,
+                      variables: Optional[Dict] = None,
+                      schema: Optional[Dict] = None,
+                      max_tokens: int = 800,
+                      retries: int = 1) -> Dict:
+        """
+        Génère une réponse JSON contrainte par un schéma (option `format` d'Ollama)
+        
+        La génération est streamée et arrêtée dès la fermeture de l'objet de
+        premier niveau. Les champs manquants ou invalides sont redemandés seuls,
+        avec un schéma restreint, au lieu de relancer toute la génération.
+        
+        Returns:
+            Champs valides du document (dictionnaire vide si rien d'exploitable)
+        """
+        schema = schema or STRUCTURED_SCHEMAS.get(prompt_key)
+        rendered = self._render_prompt(prompt_key, variables, max_tokens)
+        if rendered is None:
+            return {}
+        
+        prompt, num_predict = rendered
+        payload = self._build_payload(prompt, num_predict, stream=True, prompt_key=prompt_key)
+        payload["format"] = schema or "json"
+        data = self._run_structured(payload, prompt_key) or {}
+        if not schema:
+            return data
+        
+        properties = schema.get("properties", {})
+        for _ in range(retries):
+            broken = broken_fields(data, schema)
+            if not broken:
+                break
+            print(f"🔁 JSON '{prompt_key}': régénération des champs {broken}")
+            retry_prompt = (f"{prompt}\n\nRéponds UNIQUEMENT avec les champs JSON suivants: "
+                            f"{', '.join(broken)}")
+            share = max(128, num_predict * len(broken) // max(len(properties), 1))
+            retry = self._build_payload(retry_prompt, share, stream=True, prompt_key=prompt_key)
+            retry["format"] = sub_schema(schema, broken)
+            part = self._run_structured(retry, prompt_key) or {}
+            for key in broken:
+                if key in part and not validate(part[key], properties.get(key, {})):
+                    data[key] = part[key]
+        
+        # Ne garder que les champs conformes au schéma
+        return {
+            key: value for key, value in data.items()
+            if key in properties and not validate(value, properties[key])
+        }
+    
+    def _run_structured(self, payload: Dict, prompt_key: str) -> Optional[Dict]:
+        """Stream une génération JSON et l'arrête à la fermeture de l'objet"""
+        flight, is_leader = self._join_flight(payload)
+        if not is_leader:
+            parser = JsonStreamParser(payload.get("format") if isinstance(payload.get("format"), dict) else None)
+            parser.feed(flight.wait() or "")
+            return parser.value()
+        
+        parser = JsonStreamParser(payload["format"] if isinstance(payload["format"], dict) else None)
+        try:
+            try:
+                self._feed_structured(payload, parser, flight, prompt_key)
+            except BackendError as e:
+                # Serveur Ollama < 0.5: pas de schéma, seulement le mode JSON
+                if e.status_code == 400 and isinstance(payload["format"], dict) and not parser.text:
+                    self._feed_structured({**payload, "format": "json"}, parser, flight, prompt_key)
+                else:
+                    raise
+        except Exception as e:
+            print(f"❌ Erreur génération JSON: {str(e)[:150]}")
+        finally:
+            self._finish_flight(flight, parser.text)
+        
+        if parser.field_errors:
+            print(f"⚠️ Champs JSON invalides: {list(parser.field_errors)}")
+        return parser.value()
+    
+    def _feed_structured(self, payload: Dict, parser: JsonStreamParser,
+                         flight: _InFlightGeneration, prompt_key: str):
+        started = time.perf_counter()
+        first_token_at = None
+        final: Dict = {}
+        deadline = self._deadline_for(prompt_key)
+        try:
+            with self.scheduler.slot(self._priority_for(prompt_key), self.session_id,
+                                     timeout=self._remaining(deadline)) as ticket:
+                payload = self._fit_to_deadline(payload, prompt_key, deadline)
+                stream = self.router.stream(payload, deadline=deadline)
+                try:
+                    for data in stream:
+                        chunk = self._response_text(data)
+                        if data.get("done"):
+                            final = data
+                        if chunk:
+                            first_token_at = first_token_at or time.perf_counter()
+                            flight.push(chunk)
+                            if parser.feed(chunk):
+                                break  # objet complet: couper le flux annule la génération côté serveur
+                        if time.monotonic() >= deadline:
+                            print(f"⏱️ JSON '{prompt_key}' coupé à l'échéance")
+                            break
+                finally:
+                    stream.close()
+        except Exception:
+            self.telemetry.record(prompt_key, payload["model"],
+                                  total_s=time.perf_counter() - started, error=True)
+            raise
+        if not final:
+            # Flux coupé avant le message final: compter les fragments reçus
+            final = {"eval_count": self.token_counter.count(parser.text)}
+        self._record_call(prompt_key, payload, final, started, first_token_at, ticket.wait_s)
+    
+    def _num_predict(self, prompt_key: str, requested: int) -> int:
+        """Limite de sortie apprise (la valeur demandée en enregistrement / rejeu de cassette)"""
+        if self.cassette:
+            return requested
+        return self.adaptive.num_predict(prompt_key, requested, model=self.model)
+    
+    def _render_prompt(self, prompt_key: str, variables: Optional[Dict] = None,
+                       max_tokens: int = 1000) -> Optional[Tuple[str, int]]:
+        """
+        Remplit le template en ajustant les variables à la fenêtre de contexte
+        
+        Returns:
+            (prompt rendu, num_predict effectif) ou None si le prompt n'existe pas
+        """
+        compiled = self.registry.get(prompt_key)
+        if compiled is None:
+            return None
+        max_tokens = self._num_predict(prompt_key, max_tokens)
+        
+        values = {}
+        for key, value in (variables or {}).items():
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False, indent=2)
+            values[key] = str(value)
+        for key in OPTIONAL_PLACEHOLDERS:
+            values.setdefault(key, "")
+        
+        # Seules les variables réellement présentes dans le template comptent
+        sections = [
+            PromptSection(key, values[key], occurrences=compiled.occurrences(key),
+                          **PROMPT_SECTIONS.get(key, {"priority": 80}))
+            for key in compiled.placeholders if key in values
+        ]
+        
+        budget = PromptBudget(num_ctx=self.num_ctx, counter=self.token_counter)
+        fitted, num_predict = budget.fit(compiled.fixed_tokens(self.token_counter),
+                                         sections, max_tokens)
+        return compiled.render(fitted), num_predict
+    
+    def _build_payload(self, prompt: str, max_tokens: int, stream: bool,
+                       messages: Optional[List[Dict]] = None,
+                       prompt_key: Optional[str] = None) -> Dict:
+        """
+        Construit la requête Ollama avec paramètres optimisés pour réponses détaillées.
+        Avec `messages`, la requête vise /api/chat au lieu de /api/generate.
+        Avec `prompt_key`, num_ctx et les séquences d'arrêt sont adaptés.
+        """
+        num_ctx = self.num_ctx
+        stop = []
+        if prompt_key:
+            if messages is not None:
+                prompt_tokens = sum(self.token_counter.count(m["content"]) + 4 for m in messages)
             else:
-                error_msg = f"❌ Erreur API: {response.status_code}"
+                prompt_tokens = self.token_counter.count(prompt)
+            num_ctx = self.adaptive.num_ctx(prompt_tokens, max_tokens, model=self.model)
+            stop = self.adaptive.stop_sequences(prompt_key)
+        payload = {
+            "model": self.model,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": 0.6,  # Plus créatif pour réponses détaillées
+                "top_p": 0.92,
+                "num_predict": max_tokens,
+                "num_ctx": num_ctx,  # Plus petite fenêtre couvrant prompt + sortie
+                "repeat_penalty": 1.1,
+                "top_k": 50,
+                "mirostat": 2,  # Meilleure cohérence
+                "mirostat_tau": 5.0,
+                "mirostat_eta": 0.1
+            }
+        }
+        if stop:
+            payload["options"]["stop"] = stop
+        if messages is not None:
+            payload["messages"] = messages
+        else:
+            payload["prompt"] = prompt
+        return payload
+    
+    @staticmethod
+    def _response_text(data: Dict) -> str:
+        """Texte d'une réponse (ou d'un fragment) /api/generate ou /api/chat"""
+        if "message" in data:
+            return data["message"].get("content", "")
+        return data.get("response", "")
+    
+    def _flight_key(self, payload: Dict) -> str:
+        """Empreinte d'une génération: modèle + prompt/messages + options"""
+        material = json.dumps(
+            {"model": payload["model"],
+             "prompt": payload.get("prompt"), "messages": payload.get("messages"),
+             "format": payload.get("format"), "options": payload["options"]},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+    
+    def _join_flight(self, payload: Dict) -> Tuple[_InFlightGeneration, bool]:
+        """Rejoint une génération identique en cours, ou en devient le leader"""
+        key = self._flight_key(payload)
+        with LLMEnginePhi._inflight_lock:
+            flight = LLMEnginePhi._inflight.get(key)
+            if flight is not None:
+                flight.subscribers += 1
+                return flight, False
+            flight = _InFlightGeneration(key)
+            LLMEnginePhi._inflight[key] = flight
+            return flight, True
+    
+    def _finish_flight(self, flight: _InFlightGeneration, result: str):
+        with LLMEnginePhi._inflight_lock:
+            if LLMEnginePhi._inflight.get(flight.key) is flight:
+                del LLMEnginePhi._inflight[flight.key]
+        flight.finish(result)
+    
+    @staticmethod
+    def _clean_response(response_text: str) -> str:
+        """Nettoie la réponse si nécessaire"""
+        if response_text.startswith("Sure") or response_text.startswith("Okay"):
+            # Enlever les préambules automatiques
+            lines = response_text.split('\n')
+            response_text = '\n'.join([line for line in lines if not line.startswith(('Sure', 'Okay', 'Here'))])
+        return response_text
+    
+    def _call_backend(self, payload: Dict, prompt_key: str = "direct") -> str:
+        """Appel bloquant via le routeur de backends (basculement automatique)"""
+        started = time.perf_counter()
+        deadline = self._deadline_for(prompt_key)
+        try:
+            with self.scheduler.slot(self._priority_for(prompt_key), self.session_id,
+                                     timeout=self._remaining(deadline)) as ticket:
+                payload = self._fit_to_deadline(payload, prompt_key, deadline)
+                result = self.router.generate(payload, deadline=deadline,
+                                              hedge_after=self._hedge_delay(prompt_key))
+            self._record_call(prompt_key, payload, result, started, queue_wait_s=ticket.wait_s)
+            return self._clean_response(self._response_text(result) or "Pas de réponse")
+        except Exception as e:
+            self.telemetry.record(prompt_key, payload["model"],
+                                  total_s=time.perf_counter() - started, error=True)
+            return self._backend_error(e)
+    
+    def _record_call(self, prompt_key: str, payload: Dict, data: Dict,
+                     started: float, first_token_at: Optional[float] = None,
+                     queue_wait_s: Optional[float] = None):
+        """Télémétrie (attente de slot mesurée par l'ordonnanceur) + apprentissage des longueurs de sortie"""
+        self.telemetry.record_response(prompt_key, payload["model"], data, started, first_token_at,
+                                       queue_wait_s=queue_wait_s)
+        self.adaptive.observe(prompt_key, payload["options"]["num_predict"], data, model=payload["model"],
+                              num_ctx=payload["options"].get("num_ctx"))
+    
+    @contextmanager
+    def priority(self, priority: str):
+        """
+        Force la classe de priorité des générations du bloc `with`
+        (ex: analyse de requêtes en lot -> "batch")
+        """
+        previous = getattr(self._priority_override, "value", None)
+        self._priority_override.value = priority
+        try:
+            yield
+        finally:
+            self._priority_override.value = previous
+    
+    def _priority_for(self, prompt_key: str) -> str:
+        override = getattr(self._priority_override, "value", None)
+        return override or PROMPT_PRIORITIES.get(prompt_key, "normal")
+    
+    @contextmanager
+    def deadline(self, seconds: float):
+        """
+        Échéance des générations du bloc `with` (la plus proche l'emporte
+        en cas d'imbrication), ex: `with engine.deadline(20): ...`
+        """
+        previous = getattr(self._deadline_override, "value", None)
+        deadline = time.monotonic() + seconds
+        self._deadline_override.value = min(deadline, previous) if previous else deadline
+        try:
+            yield
+        finally:
+            self._deadline_override.value = previous
+    
+    def _deadline_for(self, prompt_key: str) -> float:
+        """Échéance absolue (time.monotonic()) d'un appel qui démarre maintenant"""
+        override = getattr(self._deadline_override, "value", None)
+        return override or time.monotonic() + self.deadlines[self._priority_for(prompt_key)]
+    
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        return max(0.0, deadline - time.monotonic())
+    
+    def _fit_to_deadline(self, payload: Dict, prompt_key: str, deadline: float) -> Dict:
+        """
+        Réduit num_predict à ce que le débit mesuré permet de générer avant
+        l'échéance (premier token p95 + tokens au débit médian)
+        """
+        remaining = self._remaining(deadline)
+        if remaining <= 0:
+            raise DeadlineExceeded(0.0)
+        if self.cassette:
+            return payload
+        # Mesures de ce modèle seulement (le petit modèle de la cascade n'a pas le débit de Phi)
+        rate = (self.telemetry.percentile("tokens_per_second", 50, prompt_key, model=self.model)
+                or self.telemetry.percentile("tokens_per_second", 50, model=self.model))
+        if not rate:
+            return payload
+        ttft = self.telemetry.percentile("ttft_seconds", 95, prompt_key, model=self.model) or 0.0
+        affordable = int((remaining - ttft) * rate * 0.9)
+        num_predict = payload["options"]["num_predict"]
+        if affordable >= num_predict:
+            return payload
+        limit = max(MIN_DEADLINE_TOKENS, affordable)
+        print(f"⏱️ '{prompt_key}': num_predict {num_predict} -> {limit} pour tenir l'échéance ({remaining:.0f} s)")
+        return {**payload, "options": {**payload["options"], "num_predict": limit}}
+    
+    def _hedge_delay(self, prompt_key: str) -> Optional[float]:
+        """Délai avant doublement (p95 de la durée totale), appels interactifs seulement"""
+        if not self.hedge or self._priority_for(prompt_key) != "interactive":
+            return None
+        return self.telemetry.percentile("total_seconds", 95, prompt_key, model=self.model)
+    
+    def _backend_error(self, error: Exception) -> str:
+        """Message d'erreur lisible pour un appel de génération échoué"""
+        if isinstance(error, DeadlineExceeded):
+            if not error.budget:
+                return f"❌ Timeout - Échéance atteinte avant l'appel au modèle {self.model}"
+            return f"❌ Timeout - Le modèle {self.model} ne répond pas dans les {error.budget:.3g} secondes"
+        if isinstance(error, requests.exceptions.Timeout):
+            return f"❌ Timeout - Le modèle {self.model} ne répond pas dans le délai imparti"
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return f"❌ Impossible de se connecter au serveur LLM. Assurez-vous qu'Ollama tourne sur {self.base_url}"
+        if isinstance(error, SchedulerRejected):
+            return f"❌ Serveur LLM saturé: {error}. Réessayez dans quelques instants"
+        if isinstance(error, BackendError):
+            return f"❌ Erreur API: {error}"
+        return f"❌ Erreur: {str(error)[:150]}"
+    
+    def _stream_backend(self, payload: Dict, prompt_key: str = "direct") -> Iterator[str]:
+        """Appel streamé via le routeur de backends (un fragment par token)"""
+        started = time.perf_counter()
+        first_token_at = None
+        deadline = self._deadline_for(prompt_key)
+        try:
+            with self.scheduler.slot(self._priority_for(prompt_key), self.session_id,
+                                     timeout=self._remaining(deadline)) as ticket:
+                payload = self._fit_to_deadline(payload, prompt_key, deadline)
+                stream = self.router.stream(payload, deadline=deadline)
                 try:
-                    error_details = response.json()
-                    error_msg += f" - {error_details}"
-                except:
-                    error_msg += f" - {response.text[:200]}"
-                return error_msg
-                
-        except requests.exceptions.Timeout:
-            return f"❌ Timeout - Le modèle {self.model} ne répond pas dans les 60 secondes"
-        except requests.exceptions.ConnectionError:
-            return f"❌ Impossible de se connecter à Ollama. Assurez-vous qu'il tourne sur {self.base_url}"
+                    for data in stream:
+                        chunk = self._response_text(data)
+                        if chunk:
+                            first_token_at = first_token_at or time.perf_counter()
+                            yield chunk
+                        if data.get("done"):
+                            # Le dernier message porte les compteurs et durées d'Ollama
+                            self._record_call(prompt_key, payload, data, started, first_token_at,
+                                              ticket.wait_s)
+                        elif time.monotonic() >= deadline:
+                            # Fermer le flux annule la génération côté serveur
+                            yield "\n\n⏱️ Réponse interrompue: délai de réponse atteint"
+                            break
+                finally:
+                    stream.close()
         except Exception as e:
-            return f"❌ Erreur: {str(e)[:150]}"
+            self.telemetry.record(prompt_key, payload["model"],
+                                  total_s=time.perf_counter() - started, error=True)
+            yield self._backend_error(e)
     
     def test_connection(self) -> Tuple[bool, str]:
-        """Teste la connexion à Ollama et au modèle"""
-        try:
-            # Test de connexion de base
-            response = requests.get(f"{self.base_url}/api/tags", timeout=10)
-            if response.status_code != 200:
-                return False, f"❌ Ollama API: {response.status_code}"
-            
-            # Vérifier si le modèle est disponible (avec correspondance partielle)
-            models = response.json().get("models", [])
-            model_names = [m.get("name", "") for m in models]
-            
-            # Chercher une correspondance partielle (phi, phi:latest, etc.)
-            model_found = False
-            model_detected = None
-            
-            for name in model_names:
-                if self.model in name or name in self.model:
-                    model_found = True
-                    model_detected = name
-                    break
-            
-            if not model_found:
-                available = ", ".join(model_names) if model_names else "aucun"
-                return False, f"❌ Modèle '{self.model}' non trouvé. Disponibles: {available}"
-            
-            # Test rapide du modèle
-            test_response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": model_detected or self.model,
+        """Teste la connexion aux serveurs de génération et au modèle"""
+        errors = []
+        for backend in self.router.backends:
+            try:
+                # Vérifier si le modèle est disponible (avec correspondance partielle)
+                model_names = backend.list_models()
+                
+                # Chercher une correspondance partielle (phi, phi:latest, etc.)
+                model_detected = None
+                for name in model_names:
+                    if self.model in name or name in self.model:
+                        model_detected = name
+                        break
+                
+                if not model_detected:
+                    available = ", ".join(model_names) if model_names else "aucun"
+                    errors.append(f"❌ Modèle '{self.model}' non trouvé sur {backend.name}. Disponibles: {available}")
+                    continue
+                
+                # Test rapide du modèle
+                backend.generate({
+                    "model": model_detected,
                     "prompt": "Test de connexion Oracle DBA",
-                    "stream": False,
                     "options": {"num_predict": 20}
-                },
-                timeout=15
-            )
+                }, timeout=15)
+                return True, f"✅ Modèle '{model_detected}' prêt et fonctionnel ({backend.name})"
             
-            if test_response.status_code == 200:
-                model_name = model_detected or self.model
-                return True, f"✅ Modèle '{model_name}' prêt et fonctionnel"
-            else:
-                return False, f"❌ Test modèle échoué: {test_response.status_code}"
-                
-        except Exception as e:
-            return False, f"❌ Erreur connexion: {str(e)}"
+            except BackendError as e:
+                errors.append(f"❌ Test modèle échoué sur {backend.name}: {e}")
+            except Exception as e:
+                errors.append(f"❌ Erreur connexion {backend.name}: {str(e)}")
+        
+        return False, " | ".join(errors)
     
     def assess_security(self, config: Dict) -> Dict:
         """Évalue la configuration de sécurité avec analyse détaillée"""
@@ -324,27 +657,13 @@ Maintenant réponds à: {query}
         else:
             config_str = str(config)
         
-        response = self.generate(
+        result = self.generate_json(
             "security_assessment",
             variables={"config": config_str},
             max_tokens=800  # Plus de tokens pour analyse détaillée
         )
-        
-        # Essayer d'extraire et parser le JSON
-        if isinstance(response, dict):
-            return response
-        elif isinstance(response, str):
-            try:
-                # Essayer de parser directement
-                return json.loads(response)
-            except:
-                # Essayer d'extraire le JSON du texte
-                json_match = re.search(r'\{[\s\S]*\}', response)
-                if json_match:
-                    try:
-                        return json.loads(json_match.group())
-                    except:
-                        pass
+        if "score" in result:
+            return result
         
         # Fallback si JSON parsing échoue
         return {
@@ -352,61 +671,107 @@ Maintenant réponds à: {query}
             "risks": [{
                 "type": "ANALYSIS_ERROR",
                 "severity": "MEDIUM",
-                "description": f"Erreur d'analyse LLM: {response[:200] if isinstance(response, str) else 'Réponse invalide'}",
+                "description": "Erreur d'analyse LLM: réponse JSON incomplète",
                 "details": "L'analyse LLM n'a pas retourné un JSON valide",
                 "recommendation": "Vérifier la configuration et réessayer"
             }],
-            "recommendations": [
+            "recommendations": result.get("recommendations") or [
                 {"priority": "MEDIUM", "action": "Vérifier la connexion au modèle LLM"}
             ]
         }
     
-    def chat_response(self, query: str, history: str = "") -> str:
-        """Réponse de chat détaillée"""
-        return self.generate(
-            "chatbot_general",
-            variables={
-                "query": query[:1000],  # Limite plus large pour questions complexes
-                "history": history[:2000]  # Historique plus long
-            },
-            max_tokens=1200  # Réponses longues et détaillées
-        )
+    def chat_response(self, query: str, history: Union[str, List[Dict]] = "",
+                      context: str = "") -> str:
+        """
+        Réponse de chat détaillée via /api/chat
+        
+        Le prompt système (instructions + exemples) est identique à chaque tour
+        et l'historique est envoyé sous forme de messages: Ollama réutilise le
+        cache KV du préfixe commun et n'évalue que les nouveaux tokens.
+        
+        Args:
+            query: Question de l'utilisateur
+            history: Messages précédents [{"role": ..., "content": ...}]
+                     ou historique texte (ancien format)
+            context: Contexte RAG à joindre à la question
+        """
+        max_tokens = self._num_predict("chatbot_general", 1200)
+        messages = self._build_chat_messages(query, history, context, max_tokens=max_tokens)
+        payload = self._build_payload("", messages["num_predict"], stream=False,
+                                      messages=messages["messages"], prompt_key="chatbot_general")
+        return self._run_single_flight(payload, "chatbot_general")
+    
+    def _build_chat_messages(self, query: str, history: Union[str, List[Dict]],
+                             context: str, max_tokens: int) -> Dict:
+        """
+        Construit la liste de messages ajustée à la fenêtre de contexte.
+        Les tours les plus anciens sont retirés en premier, la question et le
+        contexte RAG sont ensuite ajustés au budget restant.
+        """
+        system_prompt = self.registry.get("chatbot_system")
+        system = system_prompt.render({}) if system_prompt else ""
+        
+        if isinstance(history, str):
+            past = [{"role": "user", "content": f"Historique de la conversation:\n{history}"}] if history else []
+        else:
+            past = [
+                {"role": m["role"], "content": m["content"]}
+                for m in history
+                if m.get("role") in ("user", "assistant") and m.get("content")
+            ]
+        
+        # ~4 tokens de balisage par message dans le template de chat
+        per_message = 4
+        count = self.token_counter.count
+        budget = PromptBudget(num_ctx=self.num_ctx, counter=self.token_counter)
+        fixed = count(system) + per_message * 2
+        minimum = min(count(query), 64) + min(count(context), 256) + min(max_tokens, 512)
+        past_tokens = [count(m["content"]) + per_message for m in past]
+        while past and fixed + sum(past_tokens) + minimum > self.num_ctx - budget.safety_margin:
+            past.pop(0)
+            past_tokens.pop(0)
+        
+        sections = [
+            PromptSection("query", query, **PROMPT_SECTIONS["query"]),
+            PromptSection("context", context, **PROMPT_SECTIONS["context"]),
+        ]
+        fitted, num_predict = budget.fit(fixed + sum(past_tokens), sections, max_tokens)
+        
+        user_content = fitted["query"]
+        if fitted["context"]:
+            user_content = f"{fitted['context']}\n\nQUESTION: {fitted['query']}"
+        
+        messages = [{"role": "system", "content": system}] + past
+        messages.append({"role": "user", "content": user_content})
+        return {"messages": messages, "num_predict": num_predict}
     
     def analyze_query(self, sql_query: str, execution_plan: str = "") -> str:
         """Analyse détaillée d'une requête SQL"""
         return self.generate(
             "query_analysis",
             variables={
-                "sql_query": sql_query[:1500],
-                "execution_plan": execution_plan[:2000]
+                "sql_query": sql_query,
+                "execution_plan": execution_plan
             },
             max_tokens=1000
         )
     
     def get_backup_strategy(self, requirements: Dict) -> Dict:
         """Génère une stratégie de sauvegarde détaillée"""
-        response = self.generate(
+        result = self.generate_json(
             "backup_recommendation",
             variables={
                 "rpo": requirements.get('rpo', '24h'),
                 "rto": requirements.get('rto', '4h'),
                 "data_size": requirements.get('data_size', '100GB'),
+                "budget": requirements.get('budget', 'Non spécifié'),
                 "criticality": requirements.get('criticality', 'HIGH')
             },
             max_tokens=800
         )
         
-        # Essayer d'extraire le JSON
-        if isinstance(response, str):
-            try:
-                json_match = re.search(r'\{[\s\S]*\}', response)
-                if json_match:
-                    return json.loads(json_match.group())
-            except:
-                pass
-        
-        # Fallback
-        return {
+        # Compléter avec la stratégie par défaut les champs non obtenus
+        fallback = {
             "strategy": {
                 "type": "FULL",
                 "frequency": "DAILY",
@@ -428,14 +793,15 @@ Maintenant réponds à: {query}
                 "3. Tester la restauration complète"
             ]
         }
+        return {**fallback, **result}
     
     def detect_anomaly(self, log_entry: str, context: str = "") -> Dict:
         """Détecte les anomalies dans les logs"""
         response = self.generate(
             "anomaly_detection",
             variables={
-                "log_entry": log_entry[:500],
-                "context": context[:1000]
+                "log_entry": log_entry,
+                "context": context
             },
             max_tokens=500
         )
@@ -457,4 +823,96 @@ Maintenant réponds à: {query}
             "analysis": response,
             "risk_level": risk_level,
             "timestamp": datetime.now().isoformat()
-        }
\ No newline at end of file
+        }
+    
+    def detect_anomalies_batch(self, log_entries: List[str]) -> List[Dict]:
+        """
+        Classe un grand nombre de lignes de log avec peu d'appels LLM
+        
+        Les lignes sont normalisées (horodatage, espaces) et dédoublonnées, puis
+        regroupées en lots numérotés dimensionnés à la fenêtre de contexte: le
+        modèle renvoie un verdict JSON compact par ID. Seuls les éléments sans
+        verdict valide sont redemandés, en lots coupés en deux.
+        
+        Returns:
+            Un résultat par entrée, dans l'ordre (même format que detect_anomaly)
+        """
+        normalized = [self._normalize_log(entry) for entry in log_entries]
+        unique = list(dict.fromkeys(line for line in normalized if line))
+        
+        verdicts: Dict[str, Dict] = {}
+        pending = self._pack_log_batches(unique)
+        calls = 0
+        while pending:
+            batch = pending.pop(0)
+            calls += 1
+            verdicts.update(self._classify_log_batch(batch))
+            failed = [line for line in batch if line not in verdicts]
+            if failed and len(batch) > 1:
+                half = (len(failed) + 1) // 2
+                pending[:0] = [part for part in (failed[:half], failed[half:]) if part]
+        print(f"🧮 {len(log_entries)} logs ({len(unique)} distincts) classés en {calls} appels LLM")
+        
+        timestamp = datetime.now().isoformat()
+        results = []
+        for entry, line in zip(log_entries, normalized):
+            verdict = verdicts.get(line)
+            results.append({
+                "log": entry,
+                "analysis": verdict["reason"] if verdict else "❌ Aucun verdict LLM pour cette entrée",
+                "risk_level": ANOMALY_RISK_LEVELS[verdict["level"]] if verdict else "UNKNOWN",
+                "timestamp": timestamp
+            })
+        return results
+    
+    def _normalize_log(self, entry: str) -> str:
+        """Ligne de log sans horodatage ni espaces superflus, bornée en tokens"""
+        line = _LOG_SPACES.sub(" ", _LOG_TIMESTAMP.sub("", str(entry))).strip()
+        if self.token_counter.count(line) > BATCH_MAX_LINE_TOKENS:
+            line = self.token_counter.truncate(line, BATCH_MAX_LINE_TOKENS, "middle").replace("\n", " ")
+        return line
+    
+    def _pack_log_batches(self, lines: List[str]) -> List[List[str]]:
+        """Regroupe les lignes en lots dont prompt + verdicts tiennent dans num_ctx"""
+        compiled = self.registry.get("anomaly_batch")
+        budget = PromptBudget(num_ctx=self.num_ctx, counter=self.token_counter)
+        available = self.num_ctx - budget.safety_margin - compiled.fixed_tokens(self.token_counter)
+        
+        batches, current, used = [], [], 0
+        for line in lines:
+            # "[12] " + saut de ligne, puis le verdict correspondant en sortie
+            cost = self.token_counter.count(line) + 4 + BATCH_TOKENS_PER_VERDICT
+            if current and (used + cost > available or len(current) >= BATCH_MAX_ITEMS):
+                batches.append(current)
+                current, used = [], 0
+            current.append(line)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _classify_log_batch(self, batch: List[str]) -> Dict[str, Dict]:
+        """Un appel LLM pour un lot; retourne les verdicts valides par ligne"""
+        numbered = "\n".join(f"[{i}] {line}" for i, line in enumerate(batch, 1))
+        rendered = self._render_prompt("anomaly_batch", {"logs": numbered},
+                                       max_tokens=len(batch) * BATCH_TOKENS_PER_VERDICT + 16)
+        if rendered is None:
+            return {}
+        
+        prompt, num_predict = rendered
+        payload = self._build_payload(prompt, num_predict, stream=True, prompt_key="anomaly_batch")
+        payload["format"] = ANOMALY_BATCH_SCHEMA
+        data = self._run_structured(payload, "anomaly_batch") or {}
+        
+        # Validation verdict par verdict: un élément invalide n'invalide pas le lot
+        item_schema = ANOMALY_BATCH_SCHEMA["properties"]["verdicts"]["items"]
+        results = {}
+        verdicts = data.get("verdicts") if isinstance(data.get("verdicts"), list) else []
+        for verdict in verdicts:
+            if validate(verdict, item_schema) or not 1 <= verdict["id"] <= len(batch):
+                continue
+            results.setdefault(batch[verdict["id"] - 1], {
+                "level": verdict["level"],
+                "reason": verdict.get("reason", "")
+            })
+        return results
\ No newline at end of file
@@ -0,0 +1,185 @@
+# src/llm_load_test.py
+"""
+Test de charge de LLMEnginePhi: des utilisateurs simulés envoient un mélange
+réaliste de questions de chat, d'évaluations de sécurité et d'analyses de
+requêtes; le rapport donne le débit et les percentiles de latence.
+
+Usage:
+    python src/llm_load_test.py --mock --users 8 --requests 40
+    python src/llm_load_test.py --url http://localhost:11434 --users 2 --requests 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_backends import OllamaBackend
+from src.llm_engine_phi import LLMEnginePhi
+from src.llm_scheduler import get_scheduler
+from src.llm_telemetry import get_telemetry
+from src.mock_ollama_server import MockOllamaServer, MockOllamaConfig
+
+
+CHAT_QUESTIONS = [
+    "Comment optimiser une requête qui fait un full table scan ?",
+    "Quelle politique de mots de passe appliquer sur Oracle 19c ?",
+    "Comment configurer une sauvegarde RMAN incrémentale ?",
+    "Pourquoi ma SGA est-elle saturée en fin de journée ?",
+    "Comment diagnostiquer une erreur ORA-01555 ?",
+]
+
+SQL_QUERIES = [
+    "SELECT * FROM orders o JOIN customers c ON o.customer_id = c.id WHERE c.country = 'FR'",
+    "SELECT COUNT(*) FROM audit_trail WHERE action_date > SYSDATE - 30",
+    "UPDATE employees SET salary = salary * 1.05 WHERE department_id IN (SELECT id FROM departments)",
+]
+
+SECURITY_CONFIGS = [
+    {"password_life_time": "UNLIMITED", "failed_login_attempts": 10, "audit_trail": "NONE"},
+    {"password_life_time": 90, "failed_login_attempts": 5, "audit_trail": "DB,EXTENDED"},
+]
+
+# Répartition par défaut du trafic (proportions)
+DEFAULT_MIX = {"chat": 0.6, "query": 0.3, "security": 0.1}
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class LoadTest:
+    """Pilote de charge: `users` threads, chacun avec son moteur (= une session)"""
+
+    def __init__(self, base_url: str, model: str = "phi:latest", users: int = 4,
+                 requests_per_user: int = 10, mix: Optional[Dict[str, float]] = None,
+                 seed: int = 42):
+        self.base_url = base_url
+        self.model = model
+        self.users = users
+        self.requests_per_user = requests_per_user
+        self.mix = mix or DEFAULT_MIX
+        self.seed = seed
+        self.results: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def _call(self, engine: LLMEnginePhi, kind: str, rng: random.Random, n: int) -> str:
+        # Suffixe unique: éviter que la coalescence des requêtes identiques fausse la mesure
+        suffix = f" -- utilisateur {engine.session_id} #{n}"
+        if kind == "chat":
+            return engine.chat_response(rng.choice(CHAT_QUESTIONS) + suffix)
+        if kind == "query":
+            return engine.analyze_query(rng.choice(SQL_QUERIES) + suffix)
+        config = dict(rng.choice(SECURITY_CONFIGS), session=suffix)
+        return json.dumps(engine.assess_security(config))
+
+    def _user(self, index: int):
+        rng = random.Random(self.seed + index)
+        engine = LLMEnginePhi(model=self.model,
+                              backends=[OllamaBackend(self.base_url, self.model)])
+        kinds, weights = zip(*self.mix.items())
+        for n in range(self.requests_per_user):
+            kind = rng.choices(kinds, weights)[0]
+            started = time.perf_counter()
+            output = self._call(engine, kind, rng, n)
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.results.append({"kind": kind, "latency": elapsed,
+                                     "error": str(output).startswith("❌")})
+
+    def run(self) -> Dict:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._user, args=(i,)) for i in range(self.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, duration: float) -> Dict:
+        by_kind = {}
+        for kind in sorted({r["kind"] for r in self.results}):
+            latencies = [r["latency"] for r in self.results if r["kind"] == kind]
+            by_kind[kind] = {
+                "count": len(latencies),
+                "errors": sum(1 for r in self.results if r["kind"] == kind and r["error"]),
+                "p50_s": round(_percentile(latencies, 50), 3),
+                "p95_s": round(_percentile(latencies, 95), 3),
+                "p99_s": round(_percentile(latencies, 99), 3),
+            }
+        return {
+            "users": self.users,
+            "requests": len(self.results),
+            "duration_s": round(duration, 2),
+            "throughput_rps": round(len(self.results) / duration, 2) if duration else 0.0,
+            "by_kind": by_kind,
+        }
+
+
+def configure_slots(parallel: Optional[int] = None) -> int:
+    """
+    Fixe le nombre de générations simultanées de l'ordonnanceur du processus
+    à partir d'une seule valeur, celle aussi donnée au serveur simulé
+
+    Args:
+        parallel: Valeur de --parallel; défaut OLLAMA_NUM_PARALLEL, sinon 1
+
+    Returns:
+        Nombre de slots, identique pour l'ordonnanceur et le serveur
+    """
+    slots = parallel or int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+    os.environ["OLLAMA_NUM_PARALLEL"] = str(slots)
+    scheduler = get_scheduler()
+    if scheduler.slots != slots:
+        # Ordonnanceur créé avant la configuration: la file d'attente serait mesurée au mauvais endroit
+        raise ValueError(f"l'ordonnanceur a {scheduler.slots} slot(s), le serveur {slots}")
+    return slots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge LLM")
+    parser.add_argument("--url", default="http://localhost:11434")
+    parser.add_argument("--model", default="phi:latest")
+    parser.add_argument("--mock", action="store_true", help="Démarrer un serveur Ollama simulé")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=10, help="Requêtes par utilisateur")
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--parallel", type=int, default=None,
+                        help="Générations simultanées (ordonnanceur et serveur simulé); "
+                             "défaut OLLAMA_NUM_PARALLEL")
+    args = parser.parse_args()
+    # L'ordonnanceur du processus doit avoir autant de slots que le serveur
+    try:
+        slots = configure_slots(args.parallel)
+    except ValueError as e:
+        parser.error(f"❌ {e}")
+
+    server = None
+    url = args.url
+    if args.mock:
+        server = MockOllamaServer(MockOllamaConfig(models=[args.model], token_rate=args.token_rate,
+                                                   parallel=slots)).start()
+        url = server.url
+        print(f"🧪 Serveur simulé: {url}")
+
+    try:
+        test = LoadTest(url, args.model, args.users, args.requests)
+        report = test.run()
+        report["telemetry"] = get_telemetry().snapshot()
+        report["scheduler"] = get_scheduler().snapshot()
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    finally:
+        if server:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# src/llm_precompute.py
+"""
+Explications LLM précalculées hors des heures de pointe: analyse des N
+requêtes les plus lentes (par SQL_ID / plan) et analyse approfondie du
+dernier audit de chaque base (par empreinte d'audit). Le dashboard sert
+ensuite le résultat stocké immédiatement, avec son ancienneté.
+
+Usage:
+    python src/llm_precompute.py --once            # une passe si dans la fenêtre
+    python src/llm_precompute.py --once --force    # une passe immédiate
+    python src/llm_precompute.py --daemon          # une passe par fenêtre creuse
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+PRECOMPUTE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "data", "precomputed", "llm_precompute.db")
+
+# Fenêtre creuse par défaut (HH:MM-HH:MM, peut passer minuit)
+DEFAULT_WINDOW = "22:00-06:00"
+
+KINDS = ("query_analysis", "security_deep_analysis")
+
+
+def query_key(sql_id: str, plan_hash=None) -> str:
+    """Clé d'une analyse de requête: un nouveau plan invalide l'analyse"""
+    return f"{sql_id}:{plan_hash if plan_hash not in (None, '') else 0}"
+
+
+def database_name(config_data: Dict) -> str:
+    """Nom de la base d'une configuration de sécurité (db_name de V$PARAMETER)"""
+    info = config_data.get("database_info") or {}
+    return str((info.get("parameters") or {}).get("db_name") or info.get("name") or "default")
+
+
+def audit_fingerprint(database: str, risks: List[Dict]) -> str:
+    """Empreinte d'un audit: base + risques détectés par les règles"""
+    material = sorted((str(r.get("type", "")), str(r.get("severity", "")),
+                       str(r.get("description", ""))) for r in risks)
+    encoded = json.dumps([database, material], ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:24]
+
+
+def in_window(window: str = DEFAULT_WINDOW, now: Optional[datetime] = None) -> bool:
+    """Vrai si `now` tombe dans la fenêtre HH:MM-HH:MM (éventuellement à cheval sur minuit)"""
+    start, _, end = window.partition("-")
+    now = (now or datetime.now()).strftime("%H:%M")
+    start, end = start.strip(), end.strip()
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end
+
+
+def format_age(seconds: float) -> str:
+    """Ancienneté lisible: 'il y a 5 min', 'il y a 3 h', 'il y a 2 j'"""
+    if seconds < 3600:
+        return f"il y a {max(1, int(seconds // 60))} min"
+    if seconds < 86400:
+        return f"il y a {int(seconds // 3600)} h"
+    return f"il y a {int(seconds // 86400)} j"
+
+
+class PrecomputeStore:
+    """Résultats précalculés (SQLite), un par (type, clé)"""
+
+    def __init__(self, path: str = PRECOMPUTE_PATH, max_age_hours: float = 36.0):
+        """
+        Args:
+            path: Fichier SQLite
+            max_age_hours: Au-delà, un résultat est signalé comme périmé
+        """
+        self.path = path
+        self.max_age = max_age_hours * 3600
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS precomputed ("
+                       "kind TEXT, key TEXT, label TEXT, result TEXT, "
+                       "computed_at REAL, duration_s REAL, PRIMARY KEY (kind, key))")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def put(self, kind: str, key: str, result, label: str = "", duration_s: float = 0.0):
+        with self._lock, self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO precomputed VALUES (?, ?, ?, ?, ?, ?)",
+                       (kind, key, label, json.dumps(result, ensure_ascii=False, default=str),
+                        time.time(), duration_s))
+
+    def get(self, kind: str, key: str) -> Optional[Dict]:
+        """
+        Returns:
+            {"result", "computed_at", "age_s", "age", "stale"} ou None
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT result, computed_at FROM precomputed WHERE kind = ? AND key = ?",
+                             (kind, key)).fetchone()
+        if not row:
+            return None
+        age = time.time() - row[1]
+        return {
+            "result": json.loads(row[0]),
+            "computed_at": datetime.fromtimestamp(row[1]).isoformat(timespec="seconds"),
+            "age_s": round(age, 1),
+            "age": format_age(age),
+            "stale": age > self.max_age,
+        }
+
+    def get_query(self, sql_id: str, plan_hash=None) -> Optional[Dict]:
+        return self.get("query_analysis", query_key(sql_id, plan_hash))
+
+    def get_audit(self, fingerprint: str) -> Optional[Dict]:
+        return self.get("security_deep_analysis", fingerprint)
+
+    def fresh(self, kind: str, key: str) -> bool:
+        entry = self.get(kind, key)
+        return entry is not None and not entry["stale"]
+
+    def summary(self) -> List[Dict]:
+        """Nombre de résultats et dernière passe par type"""
+        with self._connect() as db:
+            rows = db.execute("SELECT kind, COUNT(*), MAX(computed_at), SUM(duration_s) "
+                              "FROM precomputed GROUP BY kind").fetchall()
+        return [{"kind": kind, "entries": count,
+                 "last_run": datetime.fromtimestamp(last).isoformat(timespec="seconds"),
+                 "llm_seconds": round(total or 0.0, 1)}
+                for kind, count, last, total in rows]
+
+
+class Precomputer:
+    """Passe de précalcul: requêtes les plus lentes et audits des bases"""
+
+    def __init__(self, engine, store: Optional[PrecomputeStore] = None, top_n: int = 10,
+                 window: Optional[str] = None):
+        """
+        Args:
+            engine: LLMEnginePhi (appels en priorité "batch")
+            top_n: Nombre de SQL_ID analysés par passe (par temps écoulé)
+            window: Fenêtre creuse HH:MM-HH:MM (défaut LLM_PRECOMPUTE_WINDOW)
+        """
+        self.engine = engine
+        self.store = store or PrecomputeStore()
+        self.top_n = top_n
+        self.window = window or os.getenv("LLM_PRECOMPUTE_WINDOW", DEFAULT_WINDOW)
+
+    def _batch(self):
+        # Les pages interactives gardent la priorité sur la passe de nuit
+        return self.engine.priority("batch")
+
+    @staticmethod
+    def top_queries(slow_queries: pd.DataFrame, top_n: int) -> pd.DataFrame:
+        """N requêtes au plus fort temps écoulé (ELAPSED_TIME ou ELAPSED_TIME_MS)"""
+        if slow_queries is None or slow_queries.empty:
+            return pd.DataFrame()
+        column = "ELAPSED_TIME" if "ELAPSED_TIME" in slow_queries else "ELAPSED_TIME_MS"
+        return slow_queries.sort_values(column, ascending=False).head(top_n)
+
+    def run_queries(self, slow_queries: pd.DataFrame, plans: Optional[Dict[str, str]] = None,
+                    force: bool = False) -> int:
+        """Analyse les top-N SQL_ID absents ou périmés; retourne le nombre d'analyses"""
+        done = 0
+        for _, row in self.top_queries(slow_queries, self.top_n).iterrows():
+            key = query_key(row["SQL_ID"], row.get("PLAN_HASH_VALUE"))
+            if not force and self.store.fresh("query_analysis", key):
+                continue
+            started = time.perf_counter()
+            with self._batch():
+                analysis = self.engine.analyze_query(row["SQL_TEXT"], (plans or {}).get(row["SQL_ID"], ""))
+            if not analysis or analysis.startswith("❌"):
+                print(f"⚠️ Précalcul {row['SQL_ID']} ignoré: {str(analysis)[:80]}")
+                continue
+            self.store.put("query_analysis", key, analysis, label=row["SQL_ID"],
+                           duration_s=time.perf_counter() - started)
+            done += 1
+        return done
+
+    def run_audits(self, databases: Dict[str, Dict], force: bool = False) -> int:
+        """Analyse approfondie du dernier audit de chaque base ({libellé: config sécurité})"""
+        try:
+            from src.security_audit import SecurityAuditor
+        except ImportError:
+            from security_audit import SecurityAuditor
+
+        rules = SecurityAuditor()
+        deep = SecurityAuditor(llm_engine=self.engine)
+        done = 0
+        for label, config in databases.items():
+            risks = rules.audit_database(config)["risks"]
+            fingerprint = audit_fingerprint(database_name(config), risks)
+            if not force and self.store.fresh("security_deep_analysis", fingerprint):
+                continue
+            started = time.perf_counter()
+            with self._batch():
+                analysis = deep._llm_deep_analysis(config, risks)
+            if not analysis or "error" in analysis:
+                print(f"⚠️ Précalcul audit {label} ignoré: {analysis.get('error') if analysis else ''}")
+                continue
+            self.store.put("security_deep_analysis", fingerprint, analysis, label=label,
+                           duration_s=time.perf_counter() - started)
+            done += 1
+        return done
+
+    def run(self, slow_queries: pd.DataFrame, databases: Dict[str, Dict],
+            plans: Optional[Dict[str, str]] = None, force: bool = False) -> Dict:
+        """Une passe complète, seulement dans la fenêtre creuse sauf si `force`"""
+        if not force and not in_window(self.window):
+            print(f"⏸️ Hors fenêtre creuse ({self.window}): précalcul reporté")
+            return {"skipped": True, "window": self.window}
+        started = time.perf_counter()
+        queries = self.run_queries(slow_queries, plans, force)
+        audits = self.run_audits(databases, force)
+        print(f"✅ Précalcul terminé: {queries} requêtes, {audits} audits")
+        return {"skipped": False, "queries": queries, "audits": audits,
+                "duration_s": round(time.perf_counter() - started, 1)}
+
+
+def _next_window_start(window: str, now: Optional[datetime] = None) -> datetime:
+    now = now or datetime.now()
+    hours, minutes = (int(part) for part in window.partition("-")[0].strip().split(":"))
+    start = now.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+    return start if start > now else start + timedelta(days=1)
+
+
+def _load_sources(use_oracle: bool):
+    """Requêtes lentes, plans et configurations de sécurité (Oracle ou données de test)"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.data_extractor import create_mock_data
+
+    if use_oracle:
+        from src.data_extractor import OracleExtractor
+        extractor = OracleExtractor(os.getenv("ORACLE_USER"), os.getenv("ORACLE_PASSWORD"),
+                                    os.getenv("ORACLE_DSN"))
+        slow = extractor.extract_performance_metrics().get("slow_queries", pd.DataFrame())
+        plans = extractor.extract_execution_plans(list(slow["SQL_ID"])) if not slow.empty else {}
+        config = extractor.extract_security_configuration()
+        config["database_info"] = extractor.get_database_info()
+        databases = {database_name(config): config}
+        extractor.close()
+        return slow, plans, databases
+
+    data = create_mock_data()
+    return data["performance_metrics"]["slow_queries"], {}, {"mock": data["security_config"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Précalcul des explications LLM")
+    parser.add_argument("--once", action="store_true", help="Une seule passe")
+    parser.add_argument("--daemon", action="store_true", help="Une passe par fenêtre creuse")
+    parser.add_argument("--force", action="store_true", help="Ignorer la fenêtre et les résultats frais")
+    parser.add_argument("--oracle", action="store_true", help="Lire V$SQLSTAT et la configuration réelle")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--model", default=os.getenv("LLM_MODEL", "phi:latest"))
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.llm_engine_phi import LLMEnginePhi
+
+    precomputer = Precomputer(LLMEnginePhi(model=args.model), top_n=args.top)
+    while True:
+        slow, plans, databases = _load_sources(args.oracle)
+        print(json.dumps(precomputer.run(slow, databases, plans, force=args.force), ensure_ascii=False))
+        if not args.daemon:
+            break
+        wake = _next_window_start(precomputer.window)
+        print(f"💤 Prochaine passe: {wake.isoformat(timespec='minutes')}")
+        time.sleep(max(60.0, (wake - datetime.now()).total_seconds()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# src/llm_scheduler.py
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    from src.llm_telemetry import RollingHistogram, LATENCY_BUCKETS
+except ImportError:
+    from llm_telemetry import RollingHistogram, LATENCY_BUCKETS
+
+
+# Classes de priorité, de la plus urgente à la moins urgente
+PRIORITIES = ("interactive", "normal", "batch")
+
+
+class SchedulerRejected(Exception):
+    """Requête refusée par le contrôle d'admission (file pleine ou attente trop longue)"""
+
+
+class _Ticket:
+    """Demande de slot en attente"""
+
+    def __init__(self, priority: str, session_id: str):
+        self.priority = priority
+        self.session_id = session_id
+        self.enqueued = time.perf_counter()
+        self.granted = False
+        self.wait_s: Optional[float] = None
+
+
+class LLMScheduler:
+    """
+    Ordonnanceur des appels LLM partagé par toutes les sessions Streamlit.
+
+    Un nombre limité de slots (OLLAMA_NUM_PARALLEL) est attribué par priorité
+    stricte: interactive > normal > batch. Dans une même classe, les sessions
+    sont servies à tour de rôle pour qu'un utilisateur qui enchaîne les
+    requêtes ne bloque pas les autres. Les travaux batch n'occupent jamais
+    tous les slots et sont refusés quand leur file est pleine. Avec un seul
+    slot (défaut d'Ollama), un travail batch ne démarre que si aucune requête
+    interactive n'est en file ni n'a été vue depuis `interactive_grace_s`:
+    une génération batch en cours n'est pas interrompue.
+    """
+
+    def __init__(self, slots: Optional[int] = None, max_queue: int = 32,
+                 max_batch_queue: int = 8, interactive_grace_s: float = 30.0):
+        """
+        Args:
+            slots: Générations simultanées (défaut: OLLAMA_NUM_PARALLEL ou 1)
+            max_queue: Profondeur maximale de la file, toutes classes confondues
+            max_batch_queue: Profondeur maximale de la file batch
+            interactive_grace_s: Slot unique: délai sans requête interactive avant un travail batch
+        """
+        self.slots = slots or int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+        self.max_queue = max_queue
+        self.max_batch_queue = max_batch_queue
+        # Un slot reste réservé aux requêtes interactives/normales
+        self.batch_slots = max(1, self.slots - 1)
+        self.interactive_grace_s = interactive_grace_s
+        self._last_interactive = float("-inf")
+        self._cond = threading.Condition()
+        # Par classe: session -> tickets en attente (ordre = tour de rôle)
+        self._queues: Dict[str, "OrderedDict[str, deque]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._running = {p: 0 for p in PRIORITIES}
+        self._served = {p: 0 for p in PRIORITIES}
+        self._rejected = {p: 0 for p in PRIORITIES}
+        self._waits = {p: RollingHistogram(LATENCY_BUCKETS) for p in PRIORITIES}
+
+    def _queued(self, priority: Optional[str] = None) -> int:
+        classes = [priority] if priority else PRIORITIES
+        return sum(len(q) for p in classes for q in self._queues[p].values())
+
+    def acquire(self, priority: str = "normal", session_id: str = "default",
+                timeout: Optional[float] = None) -> _Ticket:
+        """
+        Attend un slot de génération
+
+        Raises:
+            SchedulerRejected: file pleine, ou slot non obtenu avant `timeout`
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priorité inconnue: {priority}")
+
+        ticket = _Ticket(priority, session_id)
+        with self._cond:
+            if self._queued() >= self.max_queue or \
+                    (priority == "batch" and self._queued("batch") >= self.max_batch_queue):
+                self._rejected[priority] += 1
+                raise SchedulerRejected(f"file LLM pleine ({self._queued()} requêtes en attente)")
+
+            self._queues[priority].setdefault(session_id, deque()).append(ticket)
+            if priority == "interactive":
+                self._last_interactive = time.perf_counter()
+            self._dispatch()
+            deadline = time.perf_counter() + timeout if timeout is not None else None
+            while not ticket.granted:
+                remaining = deadline - time.perf_counter() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._remove(ticket)
+                    self._rejected[priority] += 1
+                    raise SchedulerRejected(f"aucun slot LLM libre après {timeout:.0f}s")
+                # Batch en attente de la fin du délai interactif: se réveiller pour réessayer
+                held = self._batch_hold() if priority == "batch" else None
+                if held:
+                    remaining = min(remaining, held) if remaining is not None else held
+                self._cond.wait(remaining)
+                self._dispatch()
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        with self._cond:
+            if ticket.priority == "interactive":
+                self._last_interactive = time.perf_counter()
+            self._running[ticket.priority] -= 1
+            self._served[ticket.priority] += 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: str = "normal", session_id: str = "default",
+             timeout: Optional[float] = None):
+        """Réserve un slot le temps du bloc `with`"""
+        ticket = self.acquire(priority, session_id, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def _dispatch(self):
+        """Attribue les slots libres (appelé sous verrou)"""
+        granted = False
+        while sum(self._running.values()) < self.slots:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            ticket.wait_s = time.perf_counter() - ticket.enqueued
+            self._running[ticket.priority] += 1
+            self._waits[ticket.priority].observe(ticket.wait_s)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _batch_hold(self) -> Optional[float]:
+        """Slot unique: secondes avant qu'un travail batch puisse démarrer (None si possible)"""
+        if self.slots > 1:
+            return None
+        if self._queued("interactive") or self._running["interactive"]:
+            return self.interactive_grace_s
+        hold = self._last_interactive + self.interactive_grace_s - time.perf_counter()
+        return hold if hold > 0 else None
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        for priority in PRIORITIES:
+            if priority == "batch" and (self._running["batch"] >= self.batch_slots or self._batch_hold()):
+                continue
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            session_id, tickets = next(iter(queue.items()))
+            ticket = tickets.popleft()
+            # Tour de rôle: la session servie repasse en fin de file
+            if tickets:
+                queue.move_to_end(session_id)
+            else:
+                del queue[session_id]
+            return ticket
+        return None
+
+    def _remove(self, ticket: _Ticket):
+        queue = self._queues[ticket.priority]
+        tickets = queue.get(ticket.session_id)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del queue[ticket.session_id]
+
+    def snapshot(self) -> List[Dict]:
+        """État de la file par classe de priorité (attentes en secondes)"""
+        with self._cond:
+            rows = []
+            for priority in PRIORITIES:
+                waits = self._waits[priority]
+                p50, p95 = waits.percentile(50), waits.percentile(95)
+                rows.append({
+                    "priority": priority,
+                    "queued": self._queued(priority),
+                    "running": self._running[priority],
+                    "served": self._served[priority],
+                    "rejected": self._rejected[priority],
+                    "wait_p50_s": round(p50, 3) if p50 is not None else None,
+                    "wait_p95_s": round(p95, 3) if p95 is not None else None,
+                })
+            return rows
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Ordonnanceur partagé par le processus (configuré par l'environnement)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+                max_batch_queue=int(os.getenv("LLM_MAX_BATCH_QUEUE", "8")),
+                interactive_grace_s=float(os.getenv("LLM_INTERACTIVE_GRACE_S", "30"))
+            )
+        return _scheduler
@@ -0,0 +1,287 @@
+# src/llm_structured.py
+import json
+from typing import Any, Dict, List, Optional
+
+
+# Schémas JSON passés à Ollama via l'option `format` (génération contrainte)
+SEVERITY_ENUM = ["CRITICAL", "HIGH", "MEDIUM", "LOW"]
+
+SECURITY_ASSESSMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer"},
+        "risks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {"type": "string"},
+                    "severity": {"type": "string", "enum": SEVERITY_ENUM},
+                    "description": {"type": "string"},
+                    "details": {"type": "string"},
+                    "recommendation": {"type": "string"}
+                },
+                "required": ["type", "severity", "description", "recommendation"]
+            }
+        },
+        "recommendations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "priority": {"type": "string", "enum": SEVERITY_ENUM},
+                    "action": {"type": "string"},
+                    "commands": {"type": "array", "items": {"type": "string"}}
+                },
+                "required": ["priority", "action"]
+            }
+        }
+    },
+    "required": ["score", "risks", "recommendations"]
+}
+
+BACKUP_STRATEGY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "strategy": {
+            "type": "object",
+            "properties": {
+                "type": {"type": "string"},
+                "frequency": {"type": "string"},
+                "retention_days": {"type": "integer"},
+                "storage": {"type": "string"},
+                "estimated_cost": {"type": ["string", "number"]},
+                "advantages": {"type": "string"},
+                "limitations": {"type": "string"}
+            },
+            "required": ["type", "frequency", "retention_days", "storage"]
+        },
+        "rman_script": {"type": "string"},
+        "implementation_steps": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["strategy", "rman_script", "implementation_steps"]
+}
+
+DEEP_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "unseen_risks": {"type": "array", "items": {"type": "string"}},
+        "critical_vulnerabilities": {"type": "array", "items": {"type": "string"}},
+        "strategic_recommendations": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["unseen_risks", "critical_vulnerabilities", "strategic_recommendations"]
+}
+
+ANOMALY_LEVELS = ["NORMAL", "SUSPECT", "CRITIQUE"]
+
+ANOMALY_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verdicts": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "level": {"type": "string", "enum": ANOMALY_LEVELS},
+                    "reason": {"type": "string"}
+                },
+                "required": ["id", "level"]
+            }
+        }
+    },
+    "required": ["verdicts"]
+}
+
+# Schéma par défaut de chaque prompt structuré
+STRUCTURED_SCHEMAS = {
+    "security_assessment": SECURITY_ASSESSMENT_SCHEMA,
+    "backup_recommendation": BACKUP_STRATEGY_SCHEMA,
+    "security_deep_analysis": DEEP_ANALYSIS_SCHEMA,
+    "anomaly_batch": ANOMALY_BATCH_SCHEMA,
+}
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def validate(data: Any, schema: Dict, path: str = "$") -> List[str]:
+    """
+    Validation minimale d'un document contre un schéma JSON
+    (type, enum, required, properties, items).
+
+    Returns:
+        Liste des erreurs (vide si le document est valide)
+    """
+    errors = []
+    expected = schema.get("type")
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        matches = False
+        for name in types:
+            python_type = _JSON_TYPES.get(name)
+            if python_type is None:
+                continue
+            # bool est un int en Python, mais pas en JSON
+            if isinstance(data, bool) and name in ("integer", "number"):
+                continue
+            if isinstance(data, python_type):
+                matches = True
+                break
+        if not matches:
+            return [f"{path}: type {type(data).__name__} au lieu de {expected}"]
+
+    if "enum" in schema and data not in schema["enum"]:
+        errors.append(f"{path}: valeur {data!r} hors de {schema['enum']}")
+
+    if isinstance(data, dict):
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}.{key}: champ manquant")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in data:
+                errors.extend(validate(data[key], sub_schema, f"{path}.{key}"))
+    elif isinstance(data, list) and "items" in schema:
+        for i, item in enumerate(data):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+def broken_fields(data: Dict, schema: Dict) -> List[str]:
+    """Champs de premier niveau manquants ou invalides"""
+    broken = []
+    properties = schema.get("properties", {})
+    for key in schema.get("required", list(properties)):
+        if key not in data or validate(data[key], properties.get(key, {})):
+            broken.append(key)
+    return broken
+
+
+def sub_schema(schema: Dict, fields: List[str]) -> Dict:
+    """Schéma restreint aux champs à régénérer"""
+    properties = schema.get("properties", {})
+    return {
+        "type": "object",
+        "properties": {key: properties[key] for key in fields if key in properties},
+        "required": list(fields)
+    }
+
+
+class JsonStreamParser:
+    """
+    Suit un objet JSON token par token: détecte la fermeture de l'objet de
+    premier niveau (pour arrêter la génération) et valide chaque champ de
+    premier niveau dès qu'il est complet.
+    """
+
+    def __init__(self, schema: Optional[Dict] = None):
+        self.schema = schema or {}
+        # Fragments reçus (joints à la demande: pas de copie du texte à chaque caractère)
+        self._parts: List[str] = []
+        self._length = 0
+        self.closed = False
+        self.field_errors: Dict[str, List[str]] = {}
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._member_start = 0
+        self._last_member_end = 0
+
+    @property
+    def text(self) -> str:
+        """Texte JSON reçu depuis l'accolade ouvrante"""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def feed(self, chunk: str) -> bool:
+        """Ajoute un fragment; retourne True dès que l'objet est fermé"""
+        if self.closed:
+            return True
+        start = 0
+        if not self._started:
+            start = chunk.find("{")
+            if start < 0:
+                return False  # ignorer un éventuel préambule
+            self._started = True
+        # Position dans le texte du caractère chunk[i]: offset + i
+        offset = self._length - start
+        self._parts.append(chunk[start:])
+        self._length += len(chunk) - start
+
+        for i in range(start, len(chunk)):
+            char = chunk[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = offset + i + 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_member(offset + i)
+                    self.closed = True
+                    # Ignorer la suite du fragment après la fermeture
+                    excess = len(chunk) - i - 1
+                    if excess:
+                        self._parts[-1] = self._parts[-1][:-excess]
+                        self._length -= excess
+                    break
+            elif char == "," and self._depth == 1:
+                self._complete_member(offset + i)
+                self._member_start = offset + i + 1
+        return self.closed
+
+    def _complete_member(self, end: int):
+        """Valide le champ de premier niveau qui vient de se terminer"""
+        member = self.text[self._member_start:end].strip()
+        if not member:
+            return
+        self._last_member_end = end
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return
+        properties = self.schema.get("properties", {})
+        for key, value in parsed.items():
+            if key in properties:
+                errors = validate(value, properties[key], f"$.{key}")
+                if errors:
+                    self.field_errors[key] = errors
+
+    def value(self) -> Optional[Dict]:
+        """
+        Objet décodé. Si la génération a été coupée avant la fin, récupère
+        les champs complets déjà reçus.
+        """
+        if not self._started:
+            return None
+        if self.closed:
+            try:
+                return json.loads(self.text)
+            except json.JSONDecodeError:
+                pass
+        if self._last_member_end:
+            try:
+                return json.loads(self.text[:self._last_member_end] + "}")
+            except json.JSONDecodeError:
+                return None
+        return None
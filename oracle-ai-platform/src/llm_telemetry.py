@@ -0,0 +1,226 @@
+# src/llm_telemetry.py
+import json
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+# Bornes des histogrammes de latence (secondes) et de débit (tokens/s)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096)
+
+# Un chargement du modèle au-delà de ce seuil est compté comme "model load"
+MODEL_LOAD_THRESHOLD_S = 0.5
+
+METRICS = {
+    "queue_wait_seconds": LATENCY_BUCKETS,
+    "ttft_seconds": LATENCY_BUCKETS,
+    "total_seconds": LATENCY_BUCKETS,
+    "tokens_per_second": RATE_BUCKETS,
+    "prompt_tokens": TOKEN_BUCKETS,
+    "output_tokens": TOKEN_BUCKETS,
+}
+
+
+class RollingHistogram:
+    """
+    Histogramme cumulatif (pour Prometheus) + fenêtre glissante des
+    dernières valeurs (pour les percentiles affichés dans le dashboard)
+    """
+
+    def __init__(self, buckets: Tuple[float, ...], window: int = 500):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def mean(self) -> Optional[float]:
+        return sum(self.recent) / len(self.recent) if self.recent else None
+
+
+class _SeriesStats:
+    """Mesures d'un couple (prompt_key, modèle)"""
+
+    def __init__(self, window: int):
+        self.histograms = {name: RollingHistogram(b, window) for name, b in METRICS.items()}
+        self.calls = 0
+        self.errors = 0
+        self.model_loads = 0
+        self.last_call = None
+
+
+class TelemetryStore:
+    """
+    Télémétrie des appels LLM par clé de prompt et modèle: attente en file,
+    temps jusqu'au premier token, débit, tokens de prompt et de sortie,
+    chargements du modèle. Partagée par toutes les sessions du processus.
+    """
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._series: Dict[Tuple[str, str], _SeriesStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, prompt_key: str, model: str, *,
+               total_s: float,
+               queue_wait_s: Optional[float] = None,
+               ttft_s: Optional[float] = None,
+               prompt_tokens: Optional[int] = None,
+               output_tokens: Optional[int] = None,
+               tokens_per_s: Optional[float] = None,
+               load_s: Optional[float] = None,
+               error: bool = False):
+        with self._lock:
+            series = self._series.get((prompt_key, model))
+            if series is None:
+                series = self._series[(prompt_key, model)] = _SeriesStats(self.window)
+            series.calls += 1
+            series.last_call = time.time()
+            if error:
+                series.errors += 1
+                return
+            if load_s is not None and load_s >= MODEL_LOAD_THRESHOLD_S:
+                series.model_loads += 1
+            values = {
+                "queue_wait_seconds": queue_wait_s,
+                "ttft_seconds": ttft_s,
+                "total_seconds": total_s,
+                "tokens_per_second": tokens_per_s,
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+            }
+            for name, value in values.items():
+                if value is not None:
+                    series.histograms[name].observe(value)
+
+    def record_response(self, prompt_key: str, model: str, data: Dict,
+                        started: float, first_token_at: Optional[float] = None,
+                        queue_wait_s: Optional[float] = None):
+        """
+        Enregistre un appel à partir de la réponse finale Ollama
+        (durées en nanosecondes: total, load, prompt_eval, eval).
+        `queue_wait_s` est l'attente d'un slot mesurée par l'ordonnanceur:
+        elle n'est pas déduite des durées (réseau et flux s'y mêleraient).
+        """
+        elapsed = time.perf_counter() - started
+        ns = 1e9
+        server_total = data.get("total_duration")
+        load = data.get("load_duration", 0) / ns if data.get("load_duration") else None
+        eval_count = data.get("eval_count")
+        eval_duration = data.get("eval_duration")
+
+        if first_token_at is not None:
+            ttft = first_token_at - started
+        elif data.get("prompt_eval_duration") is not None:
+            # Temps passé hors génération (file d'attente, réseau) + chargement + prompt
+            outside = max(0.0, elapsed - server_total / ns) if server_total else (queue_wait_s or 0.0)
+            ttft = outside + (load or 0.0) + data["prompt_eval_duration"] / ns
+        else:
+            ttft = None
+        if eval_count and eval_duration:
+            rate = eval_count / (eval_duration / ns)
+        elif eval_count and elapsed > 0:
+            rate = eval_count / elapsed
+        else:
+            rate = None
+
+        self.record(prompt_key, model, total_s=elapsed, queue_wait_s=queue_wait_s,
+                    ttft_s=ttft, prompt_tokens=data.get("prompt_eval_count"),
+                    output_tokens=eval_count, tokens_per_s=rate, load_s=load)
+
+    def snapshot(self) -> List[Dict]:
+        """Résumé par (prompt_key, modèle) pour le dashboard"""
+        rows = []
+        with self._lock:
+            for (prompt_key, model), series in sorted(self._series.items()):
+                h = series.histograms
+
+                def rounded(value, digits=3):
+                    return round(value, digits) if value is not None else None
+
+                rows.append({
+                    "prompt_key": prompt_key,
+                    "model": model,
+                    "calls": series.calls,
+                    "errors": series.errors,
+                    "model_loads": series.model_loads,
+                    "total_p50_s": rounded(h["total_seconds"].percentile(50)),
+                    "total_p95_s": rounded(h["total_seconds"].percentile(95)),
+                    "ttft_p50_s": rounded(h["ttft_seconds"].percentile(50)),
+                    "queue_wait_p95_s": rounded(h["queue_wait_seconds"].percentile(95)),
+                    "tokens_per_s": rounded(h["tokens_per_second"].mean(), 1),
+                    "prompt_tokens_avg": rounded(h["prompt_tokens"].mean(), 0),
+                    "output_tokens_avg": rounded(h["output_tokens"].mean(), 0),
+                })
+        return rows
+
+    def percentile(self, metric: str, q: float, prompt_key: Optional[str] = None,
+                   model: Optional[str] = None) -> Optional[float]:
+        """Percentile d'une métrique, pour une clé de prompt et/ou un modèle, ou tous appels confondus"""
+        with self._lock:
+            values = []
+            for (key, series_model), series in self._series.items():
+                if (prompt_key is None or key == prompt_key) and (model is None or series_model == model):
+                    values.extend(series.histograms[metric].recent)
+        if not values:
+            return None
+        values.sort()
+        return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+    def to_json(self) -> str:
+        return json.dumps({"generated_at": time.time(), "series": self.snapshot()},
+                          ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Export au format texte Prometheus (histogrammes + compteurs)"""
+        lines = []
+        with self._lock:
+            items = sorted(self._series.items())
+            for counter in ("calls", "errors", "model_loads"):
+                name = f"oracle_ai_llm_{counter}_total"
+                lines.append(f"# TYPE {name} counter")
+                for (prompt_key, model), series in items:
+                    labels = f'prompt_key="{prompt_key}",model="{model}"'
+                    lines.append(f"{name}{{{labels}}} {getattr(series, counter)}")
+            for metric in METRICS:
+                name = f"oracle_ai_llm_{metric}"
+                lines.append(f"# TYPE {name} histogram")
+                for (prompt_key, model), series in items:
+                    h = series.histograms[metric]
+                    labels = f'prompt_key="{prompt_key}",model="{model}"'
+                    for bound, count in zip(h.buckets, h.bucket_counts):
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+                    lines.append(f"{name}_sum{{{labels}}} {h.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+_telemetry = TelemetryStore()
+
+
+def get_telemetry() -> TelemetryStore:
+    """Store de télémétrie partagé par le processus"""
+    return _telemetry
@@ -0,0 +1,267 @@
+# src/mock_ollama_server.py
+"""
+Serveur HTTP qui imite l'API Ollama (/api/tags, /api/generate, /api/chat)
+sans modèle: latence, débit de tokens, erreurs et nombre de slots parallèles
+sont configurables. Sert aux tests hors ligne et aux tests de charge.
+
+Usage:
+    python src/mock_ollama_server.py --port 11435 --token-rate 25 --parallel 1
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+
+class MockOllamaConfig:
+    """Comportement simulé du serveur (modifiable pendant l'exécution)"""
+
+    def __init__(self, models=("phi:latest",), latency: float = 0.05,
+                 token_rate: float = 50.0, prompt_rate: float = 500.0,
+                 load_time: float = 0.0, error_rate: float = 0.0,
+                 parallel: int = 1, max_queue: int = 512, max_tokens: int = 120,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            latency: Délai fixe avant traitement (réseau, ordonnancement)
+            token_rate: Tokens générés par seconde et par slot
+            prompt_rate: Tokens de prompt évalués par seconde
+            load_time: Chargement du modèle à la première requête
+            error_rate: Proportion de requêtes en erreur 500
+            parallel: Générations simultanées (OLLAMA_NUM_PARALLEL)
+            max_queue: Requêtes en attente avant 503 (OLLAMA_MAX_QUEUE)
+            max_tokens: Longueur naturelle des réponses (done_reason "stop")
+        """
+        self.models = list(models)
+        self.latency = latency
+        self.token_rate = token_rate
+        self.prompt_rate = prompt_rate
+        self.load_time = load_time
+        self.error_rate = error_rate
+        self.parallel = parallel
+        self.max_queue = max_queue
+        self.max_tokens = max_tokens
+        self.random = random.Random(seed)
+
+
+class MockOllamaServer:
+    """Serveur mock démarré dans un thread (utilisable comme context manager)"""
+
+    def __init__(self, config: Optional[MockOllamaConfig] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockOllamaConfig()
+        self._slots = threading.Semaphore(self.config.parallel)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._loaded = False
+        self.stats = {"requests": 0, "errors": 0, "rejected": 0, "cancelled": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockOllamaServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    # -- Simulation ---------------------------------------------------------
+
+    def _response_text(self, body: Dict, num_predict: int) -> str:
+        """Réponse déterministe de num_predict mots (JSON si `format` est demandé)"""
+        if body.get("format"):
+            return json.dumps({"mock": True, "tokens": num_predict})
+        source = body.get("prompt") or json.dumps(body.get("messages", []))
+        digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        words = ["Oracle", "index", "SGA", "RMAN", "audit", "plan", "AWR", "redo"]
+        return " ".join(words[int(digest[i % 64], 16) % len(words)] for i in range(num_predict))
+
+    def _admit(self) -> Tuple[bool, float]:
+        """Attend un slot libre; retourne (admis, durée de chargement)"""
+        with self._lock:
+            if self._waiting >= self.config.max_queue:
+                return False, 0.0
+            self._waiting += 1
+        self._slots.acquire()
+        with self._lock:
+            self._waiting -= 1
+            load = 0.0 if self._loaded else self.config.load_time
+            self._loaded = True
+        return True, load
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass  # pas de log par requête
+
+            def _send_json(self, status: int, payload: Dict):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json(200, {"models": [{"name": m} for m in server.config.models]})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self.path not in ("/api/generate", "/api/chat"):
+                    self._send_json(404, {"error": "not found"})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": "invalid JSON"})
+                    return
+                server._count("requests")
+                config = server.config
+
+                if body.get("model") not in config.models:
+                    self._send_json(404, {"error": f"model '{body.get('model')}' not found"})
+                    return
+                if config.error_rate and config.random.random() < config.error_rate:
+                    server._count("errors")
+                    self._send_json(500, {"error": "injected failure"})
+                    return
+
+                started = time.perf_counter()
+                admitted, load = server._admit()
+                if not admitted:
+                    server._count("rejected")
+                    self._send_json(503, {"error": "server busy, please try again"})
+                    return
+                try:
+                    self._generate(body, started, load)
+                finally:
+                    server._slots.release()
+
+            def _generate(self, body: Dict, started: float, load: float):
+                config = server.config
+                chat = self.path == "/api/chat"
+                options = body.get("options") or {}
+                requested = int(options.get("num_predict") or config.max_tokens)
+                num_predict = max(1, min(requested, config.max_tokens))
+                done_reason = "length" if requested <= config.max_tokens else "stop"
+                prompt = body.get("prompt") or json.dumps(body.get("messages", []))
+                prompt_tokens = max(1, len(prompt) // 4)
+                prompt_eval = prompt_tokens / config.prompt_rate
+                time.sleep(config.latency + load + prompt_eval)
+
+                words = server._response_text(body, num_predict).split(" ")
+                per_token = 1.0 / config.token_rate if config.token_rate else 0.0
+                eval_started = time.perf_counter()
+
+                def piece(text: str, done: bool) -> Dict:
+                    item = {"model": body["model"], "done": done}
+                    if chat:
+                        item["message"] = {"role": "assistant", "content": text}
+                    else:
+                        item["response"] = text
+                    return item
+
+                def final() -> Dict:
+                    now = time.perf_counter()
+                    item = piece("", True)
+                    item.update({
+                        "done_reason": done_reason,
+                        "total_duration": int((now - started) * 1e9),
+                        "load_duration": int(load * 1e9),
+                        "prompt_eval_count": prompt_tokens,
+                        "prompt_eval_duration": int(prompt_eval * 1e9),
+                        "eval_count": len(words),
+                        "eval_duration": int((now - eval_started) * 1e9),
+                    })
+                    return item
+
+                if body.get("stream", True):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    try:
+                        for i, word in enumerate(words):
+                            time.sleep(per_token)
+                            text = word if i == len(words) - 1 else word + " "
+                            self._write_chunk(piece(text, False))
+                        self._write_chunk(final())
+                        self.wfile.write(b"0\r\n\r\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        # Client parti: la génération s'arrête comme sur Ollama
+                        server._count("cancelled")
+                    return
+
+                time.sleep(per_token * len(words))
+                result = final()
+                if chat:
+                    result["message"]["content"] = " ".join(words)
+                else:
+                    result["response"] = " ".join(words)
+                self._send_json(200, result)
+
+            def _write_chunk(self, payload: Dict):
+                data = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur Ollama simulé")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--model", action="append", dest="models")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--load-time", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--parallel", type=int, default=1)
+    parser.add_argument("--max-tokens", type=int, default=120)
+    args = parser.parse_args()
+
+    config = MockOllamaConfig(models=args.models or ["phi:latest"], latency=args.latency,
+                              token_rate=args.token_rate, load_time=args.load_time,
+                              error_rate=args.error_rate, parallel=args.parallel,
+                              max_tokens=args.max_tokens)
+    server = MockOllamaServer(config, args.host, args.port)
+    print(f"🧪 Serveur Ollama simulé sur {server.url} (slots={args.parallel})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("⏹️ Arrêt du serveur simulé")
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# src/prompt_budget.py
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+class TokenCounter:
+    """
+    Compteur de tokens local pour dimensionner les prompts.
+    Utilise le tokenizer Hugging Face du modèle s'il est présent dans le cache
+    local (aucun téléchargement), sinon une estimation proche du BPE de Phi.
+    """
+
+    # Mots / nombres / ponctuation: approximation du découpage BPE
+    _PIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+    def __init__(self, tokenizer_name: str = "microsoft/phi-2"):
+        self.tokenizer_name = tokenizer_name
+        self._tokenizer = None
+        try:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(
+                tokenizer_name, local_files_only=True
+            )
+        except Exception:
+            self._tokenizer = None
+
+    @property
+    def exact(self) -> bool:
+        """True si le comptage utilise le vrai tokenizer"""
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+        # Estimation: ~4 caractères par token pour les mots, 1 token par symbole,
+        # les accents et caractères non ASCII coûtent un token supplémentaire
+        tokens = 0
+        for piece in self._PIECE_RE.findall(text):
+            if piece[0].isalnum() or piece[0] == "_":
+                tokens += max(1, (len(piece) + 3) // 4)
+                tokens += sum(1 for c in piece if ord(c) > 127)
+            else:
+                tokens += 1
+        # Les retours à la ligne sont des tokens à part
+        return tokens + text.count("\n")
+
+    def truncate(self, text: str, max_tokens: int, mode: str = "head") -> str:
+        """
+        Réduit un texte à max_tokens.
+
+        Args:
+            text: Texte à réduire
+            max_tokens: Budget en tokens
+            mode: 'head' (garde le début), 'tail' (garde la fin),
+                  'middle' (garde début et fin avec une ellipse)
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+
+        if mode == "middle":
+            marker = "\n[...]\n"
+            half = max(0, (max_tokens - self.count(marker)) // 2)
+            if half == 0:
+                return self.truncate(text, max_tokens, "head")
+            return (self.truncate(text, half, "head") + marker +
+                    self.truncate(text, half, "tail"))
+
+        if self._tokenizer is not None:
+            ids = self._tokenizer.encode(text, add_special_tokens=False)
+            ids = ids[:max_tokens] if mode == "head" else ids[-max_tokens:]
+            return self._tokenizer.decode(ids)
+
+        # Recherche dichotomique sur la longueur en caractères
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            candidate = text[:mid] if mode == "head" else text[-mid:]
+            if self.count(candidate) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low] if mode == "head" else text[len(text) - low:]
+
+
+class PromptSection:
+    """
+    Section variable d'un prompt (entrée utilisateur, contexte RAG, historique...)
+
+    Args:
+        name: Nom du placeholder
+        text: Contenu
+        priority: Plus la priorité est haute, plus la section est préservée
+        trim: Mode de réduction ('head', 'tail', 'middle')
+        min_tokens: Taille minimale garantie tant que le budget le permet
+        occurrences: Nombre d'apparitions du placeholder dans le template
+    """
+
+    def __init__(self, name: str, text: str, priority: int = 50,
+                 trim: str = "head", min_tokens: int = 0, occurrences: int = 1):
+        self.name = name
+        self.text = text
+        self.priority = priority
+        self.trim = trim
+        self.min_tokens = min_tokens
+        self.occurrences = max(1, occurrences)
+        self.tokens = 0
+
+
+class PromptBudget:
+    """
+    Répartit la fenêtre de contexte (num_ctx) entre les instructions fixes,
+    les sections variables et la réserve de sortie (num_predict).
+    Les instructions ne sont jamais coupées; les sections de plus basse
+    priorité sont réduites en premier.
+    """
+
+    # Réserve de sortie minimale avant de sacrifier les sections prioritaires
+    MIN_OUTPUT_TOKENS = 128
+
+    def __init__(self, num_ctx: int = 2048, counter: Optional[TokenCounter] = None,
+                 safety_margin: Optional[int] = None):
+        self.num_ctx = num_ctx
+        self.counter = counter or TokenCounter()
+        # Marge pour l'estimation approximative et les tokens spéciaux du modèle
+        if safety_margin is None:
+            safety_margin = 8 if self.counter.exact else max(16, num_ctx // 50)
+        self.safety_margin = safety_margin
+
+    def fit(self, fixed_tokens: int, sections: List[PromptSection],
+            output_tokens: int) -> Tuple[Dict[str, str], int]:
+        """
+        Ajuste les sections au budget.
+
+        Args:
+            fixed_tokens: Tokens des instructions fixes du template
+            sections: Sections variables
+            output_tokens: Réserve de sortie souhaitée
+
+        Returns:
+            (texte de chaque section, num_predict effectif)
+        """
+        available = self.num_ctx - self.safety_margin - fixed_tokens
+        reserve = min(output_tokens, max(available, 0))
+
+        for section in sections:
+            section.tokens = self.counter.count(section.text)
+
+        def overflow() -> int:
+            used = sum(s.tokens * s.occurrences for s in sections)
+            return used - (available - reserve)
+
+        # 1. Réduire les sections de basse priorité jusqu'à leur minimum
+        # 2. Puis réduire la réserve de sortie jusqu'au plancher
+        # 3. En dernier recours, réduire sous le minimum
+        by_priority = sorted(sections, key=lambda s: s.priority)
+        for floor_pass in (True, False):
+            for section in by_priority:
+                excess = overflow()
+                if excess <= 0:
+                    break
+                floor = section.min_tokens if floor_pass else 0
+                reducible = section.tokens - floor
+                if reducible <= 0:
+                    continue
+                cut = min(reducible, -(-excess // section.occurrences))
+                section.tokens -= cut
+            if floor_pass and overflow() > 0:
+                reserve = max(min(output_tokens, self.MIN_OUTPUT_TOKENS),
+                              reserve - overflow())
+
+        fitted = {}
+        for section in sections:
+            if section.tokens <= 0:
+                fitted[section.name] = ""
+            elif section.tokens < self.counter.count(section.text):
+                fitted[section.name] = self.counter.truncate(
+                    section.text, section.tokens, section.trim
+                )
+            else:
+                fitted[section.name] = section.text
+
+        # Ce qui reste de la fenêtre revient à la sortie
+        used = fixed_tokens + sum(
+            self.counter.count(text) * s.occurrences
+            for s, text in zip(sections, fitted.values())
+        )
+        num_predict = min(output_tokens, max(self.num_ctx - self.safety_margin - used, 1))
+        return fitted, num_predict
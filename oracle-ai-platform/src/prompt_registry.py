@@ -0,0 +1,390 @@
+# src/prompt_registry.py
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import yaml
+
+# Fichier de surcharge, résolu par rapport au projet (pas au répertoire courant)
+PROMPTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "data", "prompts.yaml")
+
+# `{nom}` est une variable; `{{` et `}}` sont des accolades littérales. Les autres
+# accolades (exemples JSON des fichiers YAML) sont conservées telles quelles.
+_TOKEN_RE = re.compile(r"\{\{|\}\}|\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+# Placeholders optionnels: remplacés par une chaîne vide s'ils ne sont pas fournis
+OPTIONAL_PLACEHOLDERS = ("context", "history")
+
+# Prompts détaillés par défaut (surchargés par data/prompts.yaml)
+DEFAULT_PROMPTS = {
+    "security_assessment": """Tu es un expert en sécurité Oracle certifié avec 10 ans d'expérience.
+
+Analyse la configuration fournie en fin de message.
+Fournis une analyse COMPLÈTE au format JSON:
+{{
+    "score": 0-100,
+    "risks": [
+        {{
+            "type": "TYPE_RISQUE",
+            "severity": "CRITICAL|HIGH|MEDIUM|LOW",
+            "description": "Description technique détaillée",
+            "details": "Explications techniques avec références Oracle",
+            "recommendation": "Solution spécifique avec commandes SQL à exécuter"
+        }}
+    ],
+    "recommendations": [
+        {{
+            "priority": "CRITICAL|HIGH|MEDIUM|LOW",
+            "action": "Action concrète avec étapes détaillées",
+            "commands": ["Commande SQL spécifique 1", "Commande SQL spécifique 2"]
+        }}
+    ]
+}}
+
+Inclus des exemples concrets et commandes SQL/PLSQL.
+
+Configuration à analyser: {config}""",
+    
+    "query_analysis": """Tu es un expert en optimisation SQL Oracle, spécialiste des performances.
+
+Pour la requête et le plan fournis en fin de message, donne une analyse TECHNIQUE DÉTAILLÉE incluant:
+
+1. DIAGNOSTIC COMPLET:
+   - Problèmes identifiés (scans complets, jointures hash, opérations coûteuses)
+   - Statistiques à vérifier avec: SELECT * FROM V$SQL WHERE sql_id = '...'
+   - Coût estimé et impact sur les ressources
+
+2. RECOMMANDATIONS D'INDEXATION:
+   - Index recommandés avec syntaxe EXACTE:
+     CREATE INDEX nom_index ON table(colonne) TABLESPACE ts_data;
+   - Index composites si nécessaire
+   - Partitionnement à considérer
+
+3. VERSION OPTIMISÉE DE LA REQUÊTE:
+   - Code SQL complet avant/après
+   - Utilisation de hints si pertinent: /*+ INDEX(table index_name) */
+   - Réécriture avec CTE, sous-requêtes optimisées
+
+4. VÉRIFICATIONS À EFFECTUER:
+   - Commandes pour vérifier les stats: EXEC DBMS_STATS.GATHER_TABLE_STATS('SCHEMA', 'TABLE');
+   - Analyse du plan avec: EXPLAIN PLAN FOR ... SELECT * FROM TABLE(DBMS_XPLAN.DISPLAY);
+   - Monitoring avec: SELECT * FROM V$SQL_MONITOR WHERE sql_id = '...';
+
+5. GAIN DE PERFORMANCE ESTIMÉ: 50-80%
+
+Donne des exemples concrets et des commandes exécutables.
+
+REQUÊTE À ANALYSER: {sql_query}
+PLAN D'EXÉCUTION: {execution_plan}""",
+    
+    "backup_recommendation": """Expert en sauvegarde Oracle RMAN avec expérience production.
+
+Selon les exigences fournies en fin de message, fournis une stratégie COMPLÈTE au format JSON:
+{{
+    "strategy": {{
+        "type": "FULL|INCREMENTAL_LEVEL_1|DIFFERENTIAL",
+        "frequency": "HOURLY|DAILY|WEEKLY",
+        "retention_days": 30,
+        "storage": "DISK_ASM|NFS|CLOUD",
+        "estimated_cost": "coût estimé",
+        "advantages": "liste des avantages",
+        "limitations": "limitations à connaître"
+    }},
+    "rman_script": "Script RMAN COMPLET avec commentaires:
+RUN {{
+    -- Configuration
+    CONFIGURE RETENTION POLICY TO RECOVERY WINDOW OF 7 DAYS;
+    CONFIGURE CONTROLFILE AUTOBACKUP ON;
+    
+    -- Sauvegarde principale
+    ALLOCATE CHANNEL ch1 TYPE DISK;
+    BACKUP AS COMPRESSED BACKUPSET
+      DATABASE
+      PLUS ARCHIVELOG
+      DELETE INPUT;
+    
+    -- Vérification
+    BACKUP VALIDATE DATABASE;
+    
+    -- Rapport
+    REPORT OBSOLETE;
+    LIST BACKUP SUMMARY;
+    
+    RELEASE CHANNEL ch1;
+}}",
+    "implementation_steps": [
+        "Étape 1: Vérifier l'espace disque avec: SELECT * FROM V$RECOVERY_FILE_DEST;",
+        "Étape 2: Configurer les paramètres: ALTER SYSTEM SET DB_RECOVERY_FILE_DEST_SIZE = 100G;",
+        "Étape 3: Tester la restauration sur environnement de test"
+    ]
+}}
+
+Inclus des commandes de monitoring: LIST BACKUP, REPORT OBSOLETE, CROSSCHECK BACKUP.
+
+EXIGENCES:
+- RPO: {rpo}
+- RTO: {rto}
+- Taille des données: {data_size}
+- Budget: {budget}
+- Criticité: {criticality}""",
+    
+    "anomaly_detection": """Expert en monitoring et détection d'anomalies Oracle.
+
+Pour l'entrée de log fournie en fin de message, donne une analyse DÉTAILLÉE avec:
+
+1. CLASSIFICATION: NORMAL|SUSPECT|CRITICAL
+2. JUSTIFICATION TECHNIQUE APPROFONDIE:
+   - Pattern détecté et sa signification
+   - Codes d'erreur Oracle et leur explication
+   - Impact potentiel sur la base de données
+3. INVESTIGATION REQUISE:
+   - Requêtes de diagnostic à exécuter
+   - Alertes à vérifier dans Enterprise Manager
+   - Fichiers logs additionnels à examiner
+4. ACTIONS IMMÉDIATES:
+   - Commandes à exécuter pour investigation
+   - Correctifs si nécessaire
+   - Monitoring à mettre en place
+5. DOCUMENTATION:
+   - Notes Oracle MOS pertinentes
+   - Références aux manuels Oracle
+   - Scripts de diagnostic
+
+CONTEXTE: {context}
+ENTRÉE DE LOG: {log_entry}""",
+    
+    "chatbot_general": """Tu es un DBA Oracle SENIOR avec 15 ans d'expérience en production.
+
+=== EXEMPLES DE BONNES RÉPONSES ===
+
+Q: "Comment améliorer la sécurité ?"
+R: "Pour améliorer la sécurité Oracle:
+1. Activer l'audit: ALTER SYSTEM SET AUDIT_TRAIL='DB' SCOPE=SPFILE;
+2. Mots de passe forts: CREATE PROFILE secure LIMIT PASSWORD_LIFE_TIME 90 PASSWORD_REUSE_MAX 5 FAILED_LOGIN_ATTEMPTS 3;
+3. Révoquer privilèges inutiles: REVOKE DBA FROM app_user;"
+
+Q: "Comment optimiser une requête ?"
+R: "Pour optimiser:
+1. Créer un index composite: CREATE INDEX idx_orders_customer_date ON orders(customer_id, order_date);
+2. Mettre à jour les statistiques: EXEC DBMS_STATS.GATHER_TABLE_STATS('SCHEMA','ORDERS');
+3. Analyser le plan: EXPLAIN PLAN FOR SELECT ...; puis SELECT * FROM TABLE(DBMS_XPLAN.DISPLAY);"
+
+=== FIN DES EXEMPLES ===
+{context}
+{history}
+Maintenant réponds à: {query}
+.""",
+    
+    "security_deep_analysis": """Tu es un auditeur sécurité Oracle senior.
+Un audit automatique par règles a déjà été exécuté sur la base. À partir des
+résultats fournis en fin de message, réponds au format JSON:
+{{
+    "unseen_risks": ["Risque non détecté par les règles automatiques"],
+    "critical_vulnerabilities": ["Vulnérabilité potentielle la plus critique"],
+    "strategic_recommendations": ["Recommandation stratégique à long terme"]
+}}
+
+Exemples de risques typiques:
+{examples}
+
+Configuration: {config_summary}
+Risques identifiés ({risk_count} au total): {risks}""",
+    
+    "anomaly_batch": """Expert en monitoring et détection d'anomalies Oracle.
+
+Classe chaque ligne de log numérotée fournie en fin de message:
+- NORMAL: activité régulière
+- SUSPECT: comportement inhabituel
+- CRITIQUE: attaque ou faille de sécurité
+
+Réponds UNIQUEMENT en JSON, un verdict par ID, raison en 12 mots maximum:
+{{"verdicts": [{{"id": 1, "level": "NORMAL", "reason": "requête applicative courante"}}]}}
+
+LOGS:
+{logs}""",
+    
+    # Prompt système du chat (/api/chat): texte fixe, préfixe stable du cache KV
+    "chatbot_system": """Tu es un DBA Oracle SENIOR avec 15 ans d'expérience en production.
+
+=== EXEMPLES DE BONNES RÉPONSES ===
+
+Q: "Comment améliorer la sécurité ?"
+R: "Pour améliorer la sécurité Oracle:
+1. Activer l'audit: ALTER SYSTEM SET AUDIT_TRAIL='DB' SCOPE=SPFILE;
+2. Mots de passe forts: CREATE PROFILE secure LIMIT PASSWORD_LIFE_TIME 90 PASSWORD_REUSE_MAX 5 FAILED_LOGIN_ATTEMPTS 3;
+3. Révoquer privilèges inutiles: REVOKE DBA FROM app_user;"
+
+Q: "Comment optimiser une requête ?"
+R: "Pour optimiser:
+1. Créer un index composite: CREATE INDEX idx_orders_customer_date ON orders(customer_id, order_date);
+2. Mettre à jour les statistiques: EXEC DBMS_STATS.GATHER_TABLE_STATS('SCHEMA','ORDERS');
+3. Analyser le plan: EXPLAIN PLAN FOR SELECT ...; puis SELECT * FROM TABLE(DBMS_XPLAN.DISPLAY);"
+
+=== FIN DES EXEMPLES ===
+
+Réponds à la dernière question de l'utilisateur en t'appuyant sur la conversation
+et sur le contexte Oracle joint. Donne des commandes SQL concrètes et exécutables."""
+}
+
+
+
+class CompiledPrompt:
+    """
+    Template découpé une fois pour toutes en segments littéraux et variables:
+    le rendu est une simple concaténation, sans remplacement itératif.
+    """
+
+    def __init__(self, key: str, source: str):
+        self.key = key
+        self.source = source
+        self._literals: List[str] = []
+        self._variables: List[str] = []
+        position, literal = 0, []
+        for match in _TOKEN_RE.finditer(source):
+            literal.append(source[position:match.start()])
+            if match.group(1):
+                self._literals.append("".join(literal))
+                self._variables.append(match.group(1))
+                literal = []
+            else:
+                literal.append(match.group(0)[0])  # "{{" -> "{", "}}" -> "}"
+            position = match.end()
+        literal.append(source[position:])
+        self._literals.append("".join(literal))
+        # Instructions fixes (sans variables), pour le budget de tokens
+        self.fixed_text = "".join(self._literals)
+        self._fixed_tokens: Dict[str, int] = {}
+
+    @property
+    def placeholders(self) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys(self._variables))
+
+    def occurrences(self, name: str) -> int:
+        return self._variables.count(name)
+
+    def fixed_tokens(self, counter) -> int:
+        """Tokens des instructions fixes (mis en cache par tokenizer)"""
+        cache_key = f"{counter.tokenizer_name}:{counter.exact}"
+        if cache_key not in self._fixed_tokens:
+            self._fixed_tokens[cache_key] = counter.count(self.fixed_text)
+        return self._fixed_tokens[cache_key]
+
+    def render(self, values: Dict[str, str]) -> str:
+        """Assemble le prompt; une variable absente reste visible sous forme `{nom}`"""
+        parts = [self._literals[0]]
+        for name, literal in zip(self._variables, self._literals[1:]):
+            parts.append(values.get(name, f"{{{name}}}"))
+            parts.append(literal)
+        return "".join(parts)
+
+
+class PromptRegistry:
+    """
+    Prompts compilés, partagés par toutes les instances du moteur.
+    Le fichier YAML est relu automatiquement quand sa date de modification
+    change; une surcharge dont les variables ne correspondent pas au prompt
+    par défaut est refusée.
+    """
+
+    def __init__(self, path: str = PROMPTS_PATH, defaults: Optional[Dict[str, str]] = None,
+                 check_interval: float = 1.0):
+        """
+        Args:
+            path: Fichier YAML de surcharge
+            defaults: Prompts par défaut (DEFAULT_PROMPTS)
+            check_interval: Délai minimal entre deux vérifications du fichier (secondes)
+        """
+        self.path = path
+        self.defaults = {key: CompiledPrompt(key, text)
+                         for key, text in (DEFAULT_PROMPTS if defaults is None else defaults).items()}
+        self.check_interval = check_interval
+        self._prompts: Dict[str, CompiledPrompt] = dict(self.defaults)
+        self._mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> bool:
+        """Relit le fichier YAML; retourne True si les prompts ont changé"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime == self._mtime and self._prompts:
+                return False
+            self._mtime = mtime
+
+            prompts = dict(self.defaults)
+            if mtime is not None:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        loaded = yaml.safe_load(f) or {}
+                except Exception as e:
+                    print(f"⚠️ Erreur chargement prompts YAML: {e}")
+                    print("✅ Conservation des prompts actuels")
+                    return False
+                for key, text in loaded.items():
+                    if not isinstance(text, str):
+                        continue
+                    compiled = CompiledPrompt(key, text)
+                    problem = self._validate(compiled)
+                    if problem:
+                        print(f"⚠️ Prompt YAML '{key}' ignoré: {problem}")
+                        continue
+                    prompts[key] = compiled
+            self._prompts = prompts
+            print(f"✅ {len(prompts)} prompts compilés")
+            return True
+
+    def _validate(self, compiled: CompiledPrompt) -> Optional[str]:
+        """Les variables d'une surcharge doivent être celles du prompt par défaut"""
+        default = self.defaults.get(compiled.key)
+        if default is None:
+            return None
+        expected, found = set(default.placeholders), set(compiled.placeholders)
+        missing = expected - found - set(OPTIONAL_PLACEHOLDERS)
+        unknown = found - expected
+        if missing:
+            return f"variables manquantes {sorted(missing)}"
+        if unknown:
+            return f"variables inconnues {sorted(unknown)}"
+        return None
+
+    def _check_for_changes(self):
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self.reload()
+
+    def get(self, key: str) -> Optional[CompiledPrompt]:
+        self._check_for_changes()
+        return self._prompts.get(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def keys(self) -> Iterable[str]:
+        self._check_for_changes()
+        return list(self._prompts)
+
+    def sources(self) -> Dict[str, str]:
+        """Textes des prompts actifs (après surcharge YAML)"""
+        self._check_for_changes()
+        return {key: prompt.source for key, prompt in self._prompts.items()}
+
+
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """Registre partagé par le processus"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+        return _registry
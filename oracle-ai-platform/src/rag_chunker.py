@@ -0,0 +1,249 @@
+# src/rag_chunker.py
+"""
+Découpage en flux de la documentation, compté en tokens du modèle
+d'embedding: aucun chunk ne dépasse la longueur que le modèle encode
+(au-delà, SentenceTransformer tronque sans prévenir). La garantie suppose
+le tokenizer de l'embedder en service; sans lui, l'estimation de
+TokenCounter n'est pas un majorant de WordPiece (accents retirés,
+identifiants Oracle découpés finement) et les chunks sont réduits d'une
+marge, sans garantie.
+
+Le texte est lu ligne à ligne (mémoire constante quelle que soit la taille
+du manuel). Les titres ouvrent un nouveau chunk, les instructions SQL
+(blocs ``` ou lignes commençant par un mot-clé SQL jusqu'au ';') ne sont
+coupées, ligne par ligne, que si elles dépassent à elles seules la taille
+d'un chunk, et les dernières lignes de texte d'un chunk sont répétées au
+début du suivant.
+"""
+import re
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from src.prompt_budget import TokenCounter
+except ImportError:
+    from prompt_budget import TokenCounter
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+# Longueur maximale encodée par modèle, [CLS] et [SEP] compris
+MODEL_MAX_TOKENS = {
+    "all-MiniLM-L6-v2": 256,
+    "all-MiniLM-L12-v2": 256,
+    "paraphrase-multilingual-MiniLM-L12-v2": 128,
+    "all-mpnet-base-v2": 384,
+}
+SPECIAL_TOKENS = 2
+# Part de la limite utilisée quand les tokens ne sont qu'estimés
+ESTIMATE_MARGIN = 0.6
+
+# Ligne sans retour à la ligne (texte extrait d'un PDF): coupée à cette taille
+MAX_LINE_CHARS = 16 * 1024
+# Instruction SQL sans ';' final: bornée à ce nombre de lignes
+MAX_STATEMENT_LINES = 200
+
+# Titre Markdown ou au moins deux mots en majuscules ("ORACLE BEST PRACTICE: ...")
+_HEADING = re.compile(r"^(#{1,6}\s+\S.*|[A-ZÀ-Ý0-9][A-ZÀ-Ý0-9_/&'()-]*( [A-ZÀ-Ý0-9_/&'()-]+)+(:.*)?)$")
+_SQL_START = re.compile(
+    r"^((SQL|RMAN)>|RUN\s*\{|(SELECT|INSERT|UPDATE|DELETE|MERGE|CREATE|ALTER|DROP|TRUNCATE|GRANT|"
+    r"REVOKE|AUDIT|NOAUDIT|BEGIN|DECLARE|WITH|EXEC|EXECUTE|CALL|BACKUP|RESTORE|RECOVER)\b)"
+)
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def token_counter(model: str = DEFAULT_MODEL, embedder=None):
+    """
+    Compteur du tokenizer du modèle d'embedding: celui de l'embedder en
+    service (embedding_backends), sinon le cache Hugging Face local, sinon
+    une estimation (attribut `exact` à False)
+    """
+    if embedder is not None and hasattr(embedder, "token_counter"):
+        try:
+            return embedder.token_counter()
+        except Exception as e:
+            print(f"⚠️ Tokenizer de l'embedder indisponible ({e})")
+    return TokenCounter(model if "/" in model else f"sentence-transformers/{model}")
+
+
+class TokenChunker:
+    """
+    Chunker pages -> chunks (même interface que ParagraphChunker) dont la
+    taille est mesurée en tokens du modèle d'embedding
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, overlap: int = 32,
+                 model: str = DEFAULT_MODEL, counter: Optional[Callable[[str], int]] = None,
+                 embedder=None):
+        """
+        Args:
+            max_tokens: Tokens par chunk (défaut et plafond: limite du modèle)
+            overlap: Tokens de texte repris du chunk précédent
+            model: Modèle d'embedding dont on utilise le tokenizer
+            counter: Fonction texte -> nombre de tokens (défaut: tokenizer du modèle)
+            embedder: Backend d'embedding en service, dont le tokenizer fait foi
+        """
+        limit = MODEL_MAX_TOKENS.get(model, 256) - SPECIAL_TOKENS
+        # Comptage exact (tokenizer du modèle ou compteur fourni) ou estimation
+        self.exact = True
+        if counter is None:
+            tokens = token_counter(model, embedder)
+            counter = tokens.count
+            self.exact = tokens.exact
+            if not self.exact:
+                limit = int(limit * ESTIMATE_MARGIN)
+                print(f"⚠️ Tokenizer de {model} introuvable: tokens estimés, chunks limités à {limit} "
+                      f"(sans garantie de non-troncature à l'encodage)")
+        self.max_tokens = min(max_tokens or limit, limit)
+        self.overlap = min(overlap, self.max_tokens // 2)
+        self.count = counter
+        # Coût des séparateurs (nul pour WordPiece, non nul pour l'estimation)
+        self._separator_tokens = {"\n": self.count("\n"), "\n\n": self.count("\n\n")}
+
+    def __call__(self, pages: Iterable[str]) -> Iterator[str]:
+        chunk = _Chunk()
+        for kind, text, separator in self._units(self._lines(pages)):
+            for piece in self._fit(kind, text, separator):
+                yield from self._add(chunk, kind, piece, separator)
+                separator = "\n"
+        if chunk.has_content():
+            yield chunk.text()
+
+    # ------------------------------------------------------------------
+    # Lecture: pages -> lignes -> unités (titre, texte, code)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _lines(pages: Iterable[str]) -> Iterator[str]:
+        buffer = ""
+        for page in pages:
+            buffer += page
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                yield line.rstrip("\r")
+            while len(buffer) > MAX_LINE_CHARS:
+                cut = buffer.rfind(" ", 0, MAX_LINE_CHARS)
+                cut = cut if cut > 0 else MAX_LINE_CHARS
+                yield buffer[:cut]
+                buffer = buffer[cut:].lstrip(" ")
+        if buffer:
+            yield buffer.rstrip("\r")
+
+    @staticmethod
+    def _units(lines: Iterable[str]) -> Iterator[Tuple[str, str, str]]:
+        """(type, texte, séparateur avec l'unité précédente)"""
+        statement, fenced, blank = [], False, False
+
+        def separator():
+            return "\n\n" if blank else "\n"
+
+        for line in lines:
+            stripped = line.strip()
+            if fenced:
+                statement.append(line)
+                if stripped.startswith("```"):
+                    fenced = False
+                if not fenced or len(statement) >= MAX_STATEMENT_LINES:
+                    yield "code", "\n".join(statement), separator()
+                    statement, blank = [], False
+                continue
+            if statement:
+                # Instruction SQL hors bloc: jusqu'au ';' ou '/' ou à la ligne vide
+                if stripped:
+                    statement.append(line)
+                if not stripped or stripped.endswith((";", "/")) or len(statement) >= MAX_STATEMENT_LINES:
+                    yield "code", "\n".join(statement), separator()
+                    statement, blank = [], not stripped
+                continue
+            if not stripped:
+                blank = True
+            elif stripped.startswith("```"):
+                statement, fenced = [line], True
+            elif _SQL_START.match(stripped):
+                statement = [line]
+                if stripped.endswith((";", "/")):
+                    yield "code", line, separator()
+                    statement, blank = [], False
+            else:
+                yield ("heading" if _HEADING.match(stripped) else "text"), line, separator()
+                blank = False
+        if statement:
+            yield "code", "\n".join(statement), separator()
+
+    # ------------------------------------------------------------------
+    # Assemblage des unités en chunks
+    # ------------------------------------------------------------------
+    def _fit(self, kind: str, text: str, separator: str) -> Iterator[str]:
+        """Découpe une unité plus longue qu'un chunk (lignes, phrases, mots, caractères)"""
+        budget = self.max_tokens - self._separator_tokens[separator]
+        if self.count(text) <= budget:
+            yield text
+            return
+        if kind == "code" and "\n" in text:
+            parts, joiner = text.split("\n"), "\n"
+        elif len(_SENTENCE_END.split(text)) > 1:
+            parts, joiner = _SENTENCE_END.split(text), " "
+        elif " " in text.strip():
+            parts, joiner = text.split(" "), " "
+        else:
+            # Mot unique démesuré: au plus deux tokens par caractère (estimation)
+            step = max(1, budget // 2)
+            yield from (text[i:i + step] for i in range(0, len(text), step))
+            return
+
+        current = []
+        for part in parts:
+            candidate = joiner.join(current + [part])
+            if current and self.count(candidate) > budget:
+                yield joiner.join(current)
+                current = []
+            if self.count(part) > budget:
+                yield from self._fit(kind, part, separator)
+            else:
+                current.append(part)
+        if current:
+            yield joiner.join(current)
+
+    def _add(self, chunk: "_Chunk", kind: str, text: str, separator: str) -> Iterator[str]:
+        tokens = self.count(text) + self._separator_tokens[separator]
+        # Un titre ouvre un nouveau chunk (sans reprise du précédent)
+        if kind == "heading":
+            if chunk.has_content():
+                yield chunk.text()
+            chunk.reset()
+        elif chunk.tokens + tokens > self.max_tokens:
+            if chunk.has_content():
+                yield chunk.text()
+            chunk.carry_over(self.overlap)
+            if chunk.tokens + tokens > self.max_tokens:
+                chunk.reset()
+        chunk.append(kind, text, separator, tokens)
+
+
+class _Chunk:
+    """Unités du chunk en cours (les premières peuvent venir du chunk précédent)"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.units: List[Tuple[str, str, str, int]] = []
+        self.tokens = 0
+        self.carried = 0
+
+    def append(self, kind: str, text: str, separator: str, tokens: int):
+        self.units.append((kind, text, separator, tokens))
+        self.tokens += tokens
+
+    def has_content(self) -> bool:
+        return len(self.units) > self.carried
+
+    def text(self) -> str:
+        return "".join(separator + text for _, text, separator, _ in self.units).strip("\n")
+
+    def carry_over(self, overlap: int):
+        """Garde les dernières unités de texte (pas de code) dans la limite `overlap`"""
+        kept, tokens = [], 0
+        for unit in reversed(self.units):
+            if unit[0] == "code" or tokens + unit[3] > overlap:
+                break
+            kept.insert(0, unit)
+            tokens += unit[3]
+        self.units, self.tokens, self.carried = kept, tokens, len(kept)
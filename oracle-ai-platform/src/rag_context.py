@@ -0,0 +1,112 @@
+# src/rag_context.py
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+try:
+    from src.embedding_cache import normalize_text
+    from src.llm_telemetry import get_telemetry
+except ImportError:
+    from embedding_cache import normalize_text
+    from llm_telemetry import get_telemetry
+
+
+class RetrievalContext:
+    """
+    Résultat d'une recherche RAG pour une requête (un tour de chat): la
+    génération de la réponse, le panneau des sources et la télémétrie
+    réutilisent les mêmes documents au lieu de relancer la recherche.
+    """
+
+    def __init__(self, query: str, documents: List[Dict], seconds: float = 0.0,
+                 cached: bool = False, version: Hashable = None):
+        self.query = query
+        self.documents = documents
+        self.seconds = seconds
+        self.cached = cached
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def sources(self, n: Optional[int] = None) -> List[Dict]:
+        """Documents à afficher comme sources (les n premiers)"""
+        return self.documents[:n] if n else self.documents
+
+    def as_dict(self) -> Dict:
+        return {"query": self.query, "documents": len(self.documents),
+                "seconds": round(self.seconds, 4), "cached": self.cached}
+
+
+class RetrievalCache:
+    """
+    LRU requête -> documents, clé (texte normalisé, n_results, filtre,
+    version de la collection): tout ajout ou suppression de document change
+    la version et rend les entrées précédentes inaccessibles.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query: str, n_results: int, where: Optional[Dict], version: Hashable) -> Tuple:
+        return (normalize_text(query).casefold(), n_results,
+                json.dumps(where, sort_keys=True) if where else None, version)
+
+    def get(self, key: Tuple) -> Optional[List[Dict]]:
+        with self._lock:
+            documents = self._entries.get(key)
+            if documents is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return documents
+
+    def put(self, key: Tuple, documents: List[Dict]):
+        with self._lock:
+            self._entries[key] = documents
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate_pct": round(100 * self.hits / total, 1) if total else None}
+
+
+def retrieve(cache: RetrievalCache, search: Callable[[str, int, Optional[Dict]], List[Dict]],
+             query: str, n_results: int, where: Optional[Dict] = None,
+             version: Hashable = None) -> RetrievalContext:
+    """
+    Recherche via le LRU; la durée est enregistrée dans la télémétrie
+    (série "rag_retrieval", modèle "cache" pour les requêtes servies par le LRU)
+
+    Args:
+        cache: LRU des résultats
+        search: Fonction (requête, n_results, filtre) -> documents
+        version: Version de la collection (change à chaque écriture)
+    """
+    started = time.perf_counter()
+    key = cache.key(query, n_results, where, version)
+    documents = cache.get(key)
+    cached = documents is not None
+    if not cached:
+        documents = search(query, n_results, where)
+        # Liste vide (erreur de recherche comprise): non mémorisée
+        if documents:
+            cache.put(key, documents)
+    seconds = time.perf_counter() - started
+    get_telemetry().record("rag_retrieval", "cache" if cached else "hybrid", total_s=seconds)
+    return RetrievalContext(query, documents, seconds, cached, version)
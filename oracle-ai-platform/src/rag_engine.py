@@ -1,11 +1,26 @@
 # src/rag_engine.py 
 import chromadb
 from chromadb.config import Settings
-from chromadb.utils import embedding_functions
 import os
 from typing import List, Dict, Optional, Tuple
 import json
 from pathlib import Path
+from datetime import datetime
+
+try:
+    from src.embedding_backends import embedding_backend_from_env
+    from src.embedding_cache import EmbeddingCache, CachedEmbeddingFunction, QueryEmbeddingLRU
+    from src.rag_chunker import TokenChunker
+    from src.rag_hybrid import HybridRetriever
+    from src.rag_stats import STATS_FILE
+except ImportError:
+    from embedding_backends import embedding_backend_from_env
+    from embedding_cache import EmbeddingCache, CachedEmbeddingFunction, QueryEmbeddingLRU
+    from rag_chunker import TokenChunker
+    from rag_hybrid import HybridRetriever
+    from rag_stats import STATS_FILE
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
 class OracleRAGEngine:
     """
@@ -36,15 +51,33 @@ class OracleRAGEngine:
         
         # Utiliser SentenceTransformer (GRATUIT, local, pas d'API)
         print("📦 Chargement du modèle d'embedding...")
-        self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"  # Modèle léger et performant
-        )
+        # Backend PyTorch ou ONNX int8 (RAG_EMBEDDING_BACKEND), même modèle
+        model_function = embedding_backend_from_env(EMBEDDING_MODEL)
+        print(f"   Backend d'embedding: {model_function.kind}")
+        # Cache disque par empreinte de texte: seuls les textes nouveaux sont ré-encodés
+        # (un cache par backend: les vecteurs int8 ne remplacent pas ceux de PyTorch)
+        self.embedding_cache = EmbeddingCache(model_function.name)
+        self.embedding_function = CachedEmbeddingFunction(model_function, self.embedding_cache)
+        # Questions: LRU en mémoire, encodées par lots (une passe du modèle pour N questions)
+        self.query_embeddings = QueryEmbeddingLRU(model_function)
+        # Documents découpés à la longueur encodée par le modèle (256 tokens)
+        self.chunker = TokenChunker(model=EMBEDDING_MODEL, embedder=model_function)
         
         # Créer/récupérer la collection Oracle
         self.collection = self._get_or_create_collection()
         
+        # Recherche hybride: BM25 (identifiants exacts) + vecteurs, fusion RRF
+        # (compteurs de get_collection_stats dans un sidecar SQLite à côté de la collection)
+        self.retriever = HybridRetriever(self.collection, embed_queries=self.query_embeddings,
+                                         stats_path=os.path.join(persist_directory, STATS_FILE))
+        
         print(f"✅ RAG Engine initialisé avec {self.collection.count()} documents")
     
+    @property
+    def version(self) -> int:
+        """Version de la collection (change à chaque ajout ou suppression de document)"""
+        return self.retriever.version
+    
     def _get_or_create_collection(self):
         """Récupère ou crée la collection Oracle"""
         try:
@@ -86,14 +119,19 @@ class OracleRAGEngine:
         ids = []
         
         for i, doc in enumerate(oracle_docs):
-            documents.append(doc['content'])
-            metadatas.append({
-                'category': doc['category'],
-                'topic': doc['topic'],
-                'severity': doc.get('severity', 'INFO'),
-                'source': doc.get('source', 'oracle_internal')
-            })
-            ids.append(f"oracle_doc_{i}")
+            # Un document plus long que 256 tokens devient plusieurs chunks
+            chunks = list(self.chunker([doc['content']]))
+            for k, chunk in enumerate(chunks):
+                documents.append(chunk)
+                metadatas.append({
+                    'category': doc['category'],
+                    'topic': doc['topic'],
+                    'severity': doc.get('severity', 'INFO'),
+                    'source': doc.get('source', 'oracle_internal'),
+                    'chunk': k,
+                    'chunks': len(chunks)
+                })
+                ids.append(f"oracle_doc_{i}" if k == 0 else f"oracle_doc_{i}_{k}")
         
         try:
             # Vérifier si des documents existent déjà
@@ -112,7 +150,7 @@ class OracleRAGEngine:
                 ids=ids
             )
             
-            print(f"✅ {len(documents)} documents Oracle chargés dans ChromaDB")
+            print(f"✅ {len(oracle_docs)} documents Oracle chargés dans ChromaDB ({len(documents)} chunks)")
         except Exception as e:
             print(f"❌ Erreur chargement documents: {e}")
     
@@ -588,39 +626,36 @@ Références: Administrator's Guide, Chapter 16"""
         ]
     
     # AJOUT DES MÉTHODES MANQUANTES
-    def query(self, question: str, n_results: int = 5) -> List[Dict]:
+    def query(self, question: str, n_results: int = 5, where: Optional[Dict] = None) -> List[Dict]:
         """
         Recherche de documents pertinents dans la base de connaissances
+        (BM25 et vecteurs en parallèle, classements fusionnés par RRF)
         
         Args:
             question: Question ou requête de l'utilisateur
             n_results: Nombre de résultats à retourner
+            where: Filtre sur les métadonnées (ex: {"category": "security"})
             
         Returns:
             Liste de documents pertinents avec métadonnées
         """
+        return self.query_many([question], n_results, where)[0]
+    
+    def query_many(self, questions: List[str], n_results: int = 5,
+                   where: Optional[Dict] = None) -> List[List[Dict]]:
+        """
+        Recherche de plusieurs questions: embeddings calculés en un lot
+        (LRU des questions déjà vues) et une seule requête vectorielle
+        
+        Returns:
+            Une liste de documents par question, dans l'ordre des questions
+        """
         try:
-            results = self.collection.query(
-                query_texts=[question],
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"]
-            )
-            
-            # Formater les résultats
-            formatted_results = []
-            if results['documents'] and len(results['documents'][0]) > 0:
-                for i in range(len(results['documents'][0])):
-                    formatted_results.append({
-                        'document': results['documents'][0][i],
-                        'metadata': results['metadatas'][0][i],
-                        'similarity_score': 1 - results['distances'][0][i]  # Convert distance to similarity
-                    })
-            
-            return formatted_results
+            return self.retriever.query_many(questions, n_results, where=where)
             
         except Exception as e:
             print(f"❌ Erreur lors de la recherche: {str(e)}")
-            return []
+            return [[] for _ in questions]
     
     def add_document(self, content: str, metadata: Dict) -> bool:
         """
@@ -637,10 +672,11 @@ Références: Administrator's Guide, Chapter 16"""
             # Générer un ID unique
             doc_id = f"custom_doc_{self.collection.count() + 1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             
-            self.collection.add(
-                documents=[content],
-                metadatas=[metadata],
-                ids=[doc_id]
+            chunks = list(self.chunker([content]))
+            self.retriever.add(
+                documents=chunks,
+                metadatas=[{**metadata, 'chunk': k, 'chunks': len(chunks)} for k in range(len(chunks))],
+                ids=[doc_id if k == 0 else f"{doc_id}_{k}" for k in range(len(chunks))]
             )
             
             print(f"✅ Document ajouté avec ID: {doc_id}")
@@ -652,39 +688,14 @@ Références: Administrator's Guide, Chapter 16"""
     
     def get_collection_stats(self) -> Dict:
         """
-        Retourne les statistiques de la collection
+        Retourne les statistiques de la collection (compteurs tenus à jour
+        à chaque ajout ou suppression: lecture en temps constant)
         
         Returns:
             Dictionnaire avec statistiques
         """
         try:
-            count = self.collection.count()
-            
-            # Récupérer tous les documents avec métadonnées
-            results = self.collection.get(
-                include=["metadatas"],
-                limit=count if count > 0 else 100
-            )
-            
-            # Compter par catégorie et topic
-            categories = {}
-            topics = {}
-            
-            if 'metadatas' in results and results['metadatas']:
-                for metadata in results['metadatas']:
-                    if metadata:
-                        category = metadata.get('category', 'unknown')
-                        topic = metadata.get('topic', 'unknown')
-                        
-                        categories[category] = categories.get(category, 0) + 1
-                        topics[topic] = topics.get(topic, 0) + 1
-            
-            return {
-                'total_documents': count,
-                'categories': categories,
-                'topics': topics,
-                'categories_distribution': categories  # Alias pour compatibilité
-            }
+            return self.retriever.collection_stats()
             
         except Exception as e:
             print(f"❌ Erreur récupération stats: {str(e)}")
@@ -695,6 +706,13 @@ Références: Administrator's Guide, Chapter 16"""
                 'categories_distribution': {}
             }
     
+    def check_collection_stats(self, repair: bool = True) -> Dict:
+        """
+        Vérifie les compteurs contre un parcours complet de la collection
+        (maintenance, coût proportionnel au nombre de documents)
+        """
+        return self.retriever.stats.check(self.collection, repair=repair)
+    
     def test_retrieval(self, test_queries: List[str] = None) -> Dict:
         """
         Teste la récupération de documents avec différentes requêtes
@@ -715,12 +733,12 @@ Références: Administrator's Guide, Chapter 16"""
             ]
         
         results = {}
-        for query in test_queries:
-            docs = self.query(query, 3)
+        for query, docs in zip(test_queries, self.query_many(test_queries, 3)):
             results[query] = {
                 'found': len(docs),
                 'top_topics': [doc['metadata'].get('topic', 'N/A') for doc in docs[:2]] if docs else [],
-                'relevance': [doc.get('similarity_score', 0) for doc in docs[:2]] if docs else []
+                'relevance': [doc['similarity_score'] if doc.get('similarity_score') is not None
+                              else doc.get('lexical_score') for doc in docs[:2]] if docs else []
             }
         
         return results
@@ -752,7 +770,7 @@ def test_rag_engine():
         
         print(f"  Résultats trouvés: {len(results)}")
         for i, result in enumerate(results):
-            print(f"  {i+1}. [{result['metadata']['category']}] {result['metadata']['topic']} (score: {result['similarity_score']:.3f})")
+            print(f"  {i+1}. [{result['metadata']['category']}] {result['metadata']['topic']} (rrf: {result['rrf_score']:.3f}, similarité: {result['similarity_score'] if result['similarity_score'] is not None else 'BM25 seul'})")
     
     print("\n✅ Test RAG terminé avec succès!")
     return engine
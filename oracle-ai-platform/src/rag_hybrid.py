@@ -0,0 +1,421 @@
+# src/rag_hybrid.py
+"""
+Recherche hybride pour la base de connaissances Oracle: index inversé BM25
+(identifiants exacts: V$SESSION, DBMS_STATS, ORA-01017...) à côté de la
+recherche vectorielle ChromaDB, classements fusionnés par Reciprocal Rank
+Fusion (RRF). Les deux recherches s'exécutent en parallèle.
+"""
+import math
+import re
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from src.rag_stats import CollectionStats
+except ImportError:
+    from rag_stats import CollectionStats
+
+RRF_K = 60
+# Termes dont les contributions BM25 restent en mémoire entre deux recherches
+TERM_CACHE_SIZE = 512
+
+# Identifiants Oracle: lettres, chiffres, _ $ #, codes d'erreur ORA-01017
+_TOKEN = re.compile(r"[\w$#]+(?:-\d+)?", re.UNICODE)
+_PARTS = re.compile(r"[_$#]+")
+
+STOPWORDS = frozenset("""
+a au aux avec ce ces dans de des du elle en est et il la le les leur lui ma mais me
+ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes ton un une vos
+votre vous y the of to and in is for on with by an be as at or it this that from are
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Termes indexés: minuscules, identifiants entiers et leurs parties
+    (PASSWORD_LIFE_TIME -> password_life_time, password, life, time)
+    """
+    terms = [token for token in _TOKEN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+    for compound in [token for token in terms if "_" in token or "$" in token or "#" in token]:
+        terms.extend(part for part in _PARTS.split(compound) if len(part) > 1 and part not in STOPWORDS)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fusion RRF: score(d) = somme des 1 / (k + rang de d) sur les classements"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    Index inversé BM25 mis à jour par ajouts et suppressions.
+
+    Postings en tableaux compacts (array) par terme, longueurs et présence
+    des documents en numpy: une recherche ne parcourt que les postings des
+    termes de la requête, en vectoriel. Les documents supprimés ou remplacés
+    sont marqués absents puis retirés des postings au compactage.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._slots: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict]] = []
+        self._lengths = np.zeros(1024, dtype=np.float32)
+        self._alive = np.zeros(1024, dtype=bool)
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0.0
+        self._dead = 0
+        # Contributions BM25 par terme, valables tant que l'index ne change pas
+        self._generation = 0
+        self._weights: "OrderedDict[str, Tuple[int, np.ndarray, np.ndarray]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def generation(self) -> int:
+        """Incrémenté à chaque ajout ou suppression"""
+        return self._generation
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._slots
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._slots)
+
+    def add(self, ids: Sequence[str], documents: Sequence[str], metadatas: Optional[Sequence[Dict]] = None):
+        """Ajoute ou remplace des documents"""
+        analyzed = [tokenize(document) for document in documents]
+        with self._lock:
+            self._discard(ids)
+            self._generation += 1
+            for position, (doc_id, terms) in enumerate(zip(ids, analyzed)):
+                slot = len(self._ids)
+                if slot >= len(self._lengths):
+                    self._lengths = np.concatenate([self._lengths, np.zeros_like(self._lengths)])
+                    self._alive = np.concatenate([self._alive, np.zeros_like(self._alive)])
+                self._ids.append(doc_id)
+                self._metadatas.append(metadatas[position] if metadatas else None)
+                self._slots[doc_id] = slot
+                self._lengths[slot] = len(terms)
+                self._alive[slot] = True
+                self._total_length += len(terms)
+                for term, tf in Counter(terms).items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array("i"), array("H"))
+                    postings[0].append(slot)
+                    postings[1].append(tf if tf < 65535 else 65535)
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            self._discard(ids)
+            self._generation += 1
+            if self._dead > 1000 and self._dead > len(self._slots):
+                self._compact()
+
+    def _discard(self, ids: Iterable[str]):
+        for doc_id in ids:
+            slot = self._slots.pop(doc_id, None)
+            if slot is not None:
+                self._alive[slot] = False
+                self._total_length -= float(self._lengths[slot])
+                self._ids[slot] = None
+                self._metadatas[slot] = None
+                self._dead += 1
+
+    def _compact(self):
+        """Renumérote les documents présents et purge les postings des absents"""
+        live = np.flatnonzero(self._alive[:len(self._ids)])
+        renumber = np.full(len(self._ids), -1, dtype=np.int64)
+        renumber[live] = np.arange(len(live))
+        for term in list(self._postings):
+            slots, tfs = self._postings[term]
+            old = np.frombuffer(slots, dtype=np.int32).copy()
+            keep = renumber[old] >= 0
+            if not keep.any():
+                del self._postings[term]
+                continue
+            self._postings[term] = (array("i", renumber[old[keep]].astype(np.int32).tobytes()),
+                                    array("H", np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes()))
+        self._ids = [self._ids[slot] for slot in live]
+        self._metadatas = [self._metadatas[slot] for slot in live]
+        lengths = self._lengths[live]
+        self._lengths = np.zeros(max(1024, 2 * len(live)), dtype=np.float32)
+        self._lengths[:len(live)] = lengths
+        self._alive = np.zeros(len(self._lengths), dtype=bool)
+        self._alive[:len(live)] = True
+        self._slots = {doc_id: slot for slot, doc_id in enumerate(self._ids)}
+        self._dead = 0
+
+    def search(self, query: str, n_results: int = 10,
+               where: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """
+        Meilleurs documents pour la requête
+
+        Args:
+            query: Texte de la requête
+            n_results: Nombre de résultats
+            where: Filtre d'égalité sur les métadonnées ({"category": "security"})
+
+        Returns:
+            [(id, score BM25)] par score décroissant
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._slots)
+            if not count or not terms:
+                return []
+            size = len(self._ids)
+            scores = np.zeros(size, dtype=np.float32)
+            for term in terms:
+                slots, weights = self._term_weights(term)
+                scores[slots] += weights
+
+            candidates = np.flatnonzero(scores)
+            if not where and len(candidates) > n_results:
+                candidates = candidates[np.argpartition(-scores[candidates], n_results - 1)[:n_results]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            results = []
+            for slot in candidates:
+                if where:
+                    metadata = self._metadatas[slot] or {}
+                    if any(metadata.get(key) != value for key, value in where.items()):
+                        continue
+                results.append((self._ids[slot], float(scores[slot])))
+                if len(results) >= n_results:
+                    break
+            return results
+
+    def lexical_score(self, query: str, score: float) -> float:
+        """
+        Score BM25 rapporté à l'IDF total des termes de la requête, borné à 1
+        (~1: chaque terme présent au moins une fois; les termes inconnus de
+        l'index comptent avec l'IDF maximal). Comparable d'une requête à
+        l'autre, contrairement au score brut ou rapporté au meilleur résultat.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._slots)
+            if not count or not terms:
+                return 0.0
+            bound = 0.0
+            for term in terms:
+                postings = self._postings.get(term)
+                frequency = int(self._alive[np.array(postings[0], dtype=np.int64)].sum()) if postings else 0
+                bound += math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+        return min(1.0, score / bound) if bound else 0.0
+
+    def _term_weights(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Documents contenant le terme et leur score BM25 pour ce terme (en cache)"""
+        cached = self._weights.get(term)
+        if cached is not None and cached[0] == self._generation:
+            self._weights.move_to_end(term)
+            return cached[1], cached[2]
+        postings = self._postings.get(term)
+        slots = np.array(postings[0], dtype=np.int64) if postings else np.zeros(0, dtype=np.int64)
+        present = self._alive[slots]
+        slots = slots[present]
+        weights = np.zeros(0, dtype=np.float32)
+        if len(slots):
+            count = len(self._slots)
+            average = self._total_length / count or 1.0
+            idf = math.log(1 + (count - len(slots) + 0.5) / (len(slots) + 0.5))
+            tf = np.array(postings[1], dtype=np.float32)[present]
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[slots] / average)
+            weights = (idf * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+        self._weights[term] = (self._generation, slots, weights)
+        if len(self._weights) > TERM_CACHE_SIZE:
+            self._weights.popitem(last=False)
+        return slots, weights
+
+
+class HybridRetriever:
+    """
+    Recherche BM25 + vectorielle sur une collection ChromaDB, fusion RRF.
+    L'index BM25 est construit depuis la collection puis tenu à jour par
+    add()/delete(); les écritures faites hors de ce processus (ingestion)
+    sont rattrapées en comparant les IDs de la collection à ceux de l'index
+    (un fichier modifié remplace ses chunks sans changer leur nombre).
+    """
+
+    def __init__(self, collection, candidates: int = 20, rrf_k: int = RRF_K,
+                 refresh_interval: float = 30.0, embed_queries: Optional[Callable] = None,
+                 stats_path: Optional[str] = None):
+        """
+        Args:
+            collection: Collection ChromaDB
+            embed_queries: Fonction questions -> embeddings (défaut: celle de la collection)
+            candidates: Résultats demandés à chaque recherche avant fusion
+            rrf_k: Constante k de la fusion RRF
+            refresh_interval: Secondes entre deux vérifications de la collection
+            stats_path: Sidecar SQLite des compteurs catégorie / topic / source (None: en mémoire)
+        """
+        self.collection = collection
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.refresh_interval = refresh_interval
+        self.embed_queries = embed_queries
+        self.index = BM25Index()
+        # Compteurs catégorie / topic / source, persistés et tenus à jour avec l'index
+        self.stats = CollectionStats(stats_path)
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-dense")
+        self._checked_at = 0.0
+        self.sync()
+
+    def sync(self, batch_size: int = 1000) -> Dict:
+        """Aligne l'index BM25 sur la collection (seuls les écarts sont lus)"""
+        started = time.perf_counter()
+        stored = set(self.collection.get(include=[])["ids"])
+        known = set(self.index.ids())
+        self._checked_at = time.monotonic()
+        if stored == known and len(self.stats) == len(stored):
+            return {"added": 0, "removed": 0, "documents": len(self.index),
+                    "duration_s": round(time.perf_counter() - started, 3)}
+        # Compteurs relus du sidecar: seuls les documents qu'il ne connaît pas sont comptés
+        counted = self.stats.ids()
+        missing = sorted(stored - known)
+        for start in range(0, len(missing), batch_size):
+            batch = self.collection.get(ids=missing[start:start + batch_size],
+                                        include=["documents", "metadatas"])
+            self.index.add(batch["ids"], batch["documents"], batch["metadatas"])
+            new = [(doc_id, metadata) for doc_id, metadata in zip(batch["ids"], batch["metadatas"])
+                   if doc_id not in counted]
+            if new:
+                self.stats.add([doc_id for doc_id, _ in new], [metadata for _, metadata in new])
+        self.index.remove(known - stored)
+        self.stats.remove(counted - stored)
+        report = {"added": len(missing), "removed": len(known - stored), "documents": len(self.index),
+                  "duration_s": round(time.perf_counter() - started, 3)}
+        if missing or known - stored:
+            print(f"🔎 Index BM25: +{report['added']} / -{report['removed']} documents "
+                  f"({report['documents']} au total, {report['duration_s']} s)")
+        return report
+
+    @property
+    def version(self) -> int:
+        """Version de l'index (écritures externes rattrapées au passage)"""
+        self._maybe_sync()
+        return self.index.generation
+
+    def collection_stats(self) -> Dict:
+        """Nombre de documents par catégorie / topic / source (sans lire la collection)"""
+        self._maybe_sync()
+        return self.stats.snapshot()
+
+    def _maybe_sync(self):
+        if time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        # IDs et non nombre de documents: un ajout + une suppression le laissent inchangé
+        self.sync()
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        """Ajoute des documents à la collection et à l'index BM25"""
+        self.collection.add(ids=ids, documents=documents, metadatas=metadatas)
+        self.index.add(ids, documents, metadatas)
+        self.stats.add(ids, metadatas)
+
+    def delete(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+        self.index.remove(ids)
+        self.stats.remove(ids)
+
+    def _dense(self, questions: List[str], n_results: int,
+               where: Optional[Dict]) -> List[List[Tuple[str, str, Dict, float]]]:
+        """Une seule recherche vectorielle pour toutes les questions"""
+        if self.embed_queries is not None:
+            vectors = self.embed_queries(questions)
+            results = self.collection.query(query_embeddings=[np.asarray(v).tolist() for v in vectors],
+                                            n_results=n_results, where=where,
+                                            include=["documents", "metadatas", "distances"])
+        else:
+            results = self.collection.query(query_texts=questions, n_results=n_results, where=where,
+                                            include=["documents", "metadatas", "distances"])
+        return [list(zip(*columns)) for columns in zip(results["ids"], results["documents"],
+                                                        results["metadatas"], results["distances"])]
+
+    def query(self, question: str, n_results: int = 5, where: Optional[Dict] = None) -> List[Dict]:
+        """
+        Recherche hybride
+
+        Returns:
+            Documents (document, metadata, similarity_score et distance
+            vectorielles, lexical_score BM25, rangs vectoriel et lexical,
+            rrf_score de fusion) par rang fusionné
+        """
+        return self.query_many([question], n_results, where)[0]
+
+    def query_many(self, questions: List[str], n_results: int = 5,
+                   where: Optional[Dict] = None) -> List[List[Dict]]:
+        """Recherche hybride de plusieurs questions (embeddings en un lot, une requête vectorielle)"""
+        if not questions:
+            return []
+        self._maybe_sync()
+        candidates = max(self.candidates, n_results)
+        # Recherche vectorielle dans un thread, BM25 (quelques ms) pendant ce temps
+        dense_future = self._executor.submit(self._dense, list(questions), candidates, where)
+        lexical = [self.index.search(question, candidates, where) for question in questions]
+        try:
+            dense = dense_future.result()
+        except Exception as e:
+            print(f"⚠️ Recherche vectorielle indisponible, BM25 seul: {e}")
+            dense = [[] for _ in questions]
+
+        fused = [reciprocal_rank_fusion([[hit[0] for hit in hits], [doc_id for doc_id, _ in ranked]],
+                                        self.rrf_k)[:n_results]
+                 for hits, ranked in zip(dense, lexical)]
+        found = {hit[0]: hit[1:] for hits in dense for hit in hits}
+        # Documents trouvés par BM25 seul: texte et métadonnées lus dans la collection (un appel)
+        lexical_only = sorted({doc_id for ranking in fused for doc_id, _ in ranking if doc_id not in found})
+        if lexical_only:
+            fetched = self.collection.get(ids=lexical_only, include=["documents", "metadatas"])
+            for doc_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                found[doc_id] = (document, metadata, None)
+
+        return [self._results(question, ranking, hits, ranked, found)
+                for question, ranking, hits, ranked in zip(questions, fused, dense, lexical)]
+
+    def _results(self, question: str, fused: List[Tuple[str, float]], dense: List[Tuple],
+                 lexical: List[Tuple[str, float]], found: Dict[str, Tuple]) -> List[Dict]:
+        dense_rank = {hit[0]: rank for rank, hit in enumerate(dense, 1)}
+        lexical_rank = {doc_id: rank for rank, (doc_id, _) in enumerate(lexical, 1)}
+        lexical_scores = dict(lexical)
+        best = 2.0 / (self.rrf_k + 1)
+        results = []
+        for doc_id, score in fused:
+            if doc_id not in found:
+                continue
+            document, metadata, distance = found[doc_id]
+            results.append({
+                'id': doc_id,
+                'document': document,
+                'metadata': metadata,
+                # Similarité vectorielle réelle (None: document trouvé par BM25 seul)
+                'similarity_score': 1 - distance if distance is not None else None,
+                'distance': distance,
+                # Rang fusionné ramené à [0, 1] (1 = premier dans les deux classements):
+                # ordre des résultats uniquement, pas une mesure de pertinence
+                'rrf_score': round(score / best, 4),
+                'lexical_score': round(self.index.lexical_score(question, lexical_scores[doc_id]), 4)
+                if doc_id in lexical_scores else None,
+                'vector_rank': dense_rank.get(doc_id),
+                'lexical_rank': lexical_rank.get(doc_id),
+            })
+        return results
@@ -0,0 +1,295 @@
+# src/rag_ingest.py
+"""
+Ingestion incrémentale de la documentation Oracle (PDF, TXT, DOCX) dans
+ChromaDB: extraction dans un pool de processus, texte transmis page par
+page au découpage, empreintes de fichiers et de chunks pour n'insérer que
+ce qui a changé, suppression des chunks des fichiers retirés.
+
+Usage:
+    python src/rag_ingest.py docs/oracle --workers 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+try:
+    from src.rag_chunker import TokenChunker
+except ImportError:
+    from rag_chunker import TokenChunker
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".docx")
+
+MANIFEST_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# Taille des blocs lus dans les fichiers texte (pages "virtuelles")
+TEXT_BLOCK_SIZE = 64 * 1024
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_pages(path: str) -> Iterator[str]:
+    """Texte d'un document page par page (blocs pour TXT, paragraphes pour DOCX)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pdf":
+        import PyPDF2
+        with open(path, "rb") as f:
+            for page in PyPDF2.PdfReader(f).pages:
+                # Un saut de page est une fin de paragraphe
+                yield (page.extract_text() or "") + "\n\n"
+    elif extension == ".docx":
+        import docx
+        paragraphs = []
+        for paragraph in docx.Document(path).paragraphs:
+            paragraphs.append(paragraph.text)
+            if len(paragraphs) >= 200:
+                yield "\n\n".join(paragraphs) + "\n\n"
+                paragraphs = []
+        if paragraphs:
+            yield "\n\n".join(paragraphs)
+    else:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for block in iter(lambda: f.read(TEXT_BLOCK_SIZE), ""):
+                yield block
+
+
+class ParagraphChunker:
+    """
+    Découpage en flux par paragraphes, au plus `max_chars` caractères par
+    chunk (les paragraphes trop longs sont coupés)
+    """
+
+    def __init__(self, max_chars: int = 2000):
+        self.max_chars = max_chars
+
+    def __call__(self, pages: Iterable[str]) -> Iterator[str]:
+        buffer, current = "", ""
+        for page in pages:
+            buffer += page
+            *paragraphs, buffer = buffer.split("\n\n")
+            # Paragraphe sans fin (texte sans lignes vides): mémoire bornée
+            while len(buffer) > self.max_chars:
+                paragraphs.append(buffer[:self.max_chars])
+                buffer = buffer[self.max_chars:]
+            for paragraph in paragraphs:
+                current = yield from self._add(current, paragraph)
+        current = yield from self._add(current, buffer)
+        if current:
+            yield current
+
+    def _add(self, current: str, paragraph: str):
+        """Ajoute un paragraphe au chunk en cours; émet les chunks pleins"""
+        paragraph = paragraph.strip()
+        if not paragraph:
+            return current
+        if current and len(current) + len(paragraph) + 2 > self.max_chars:
+            yield current
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+        while len(current) > self.max_chars:
+            yield current[:self.max_chars]
+            current = current[self.max_chars:]
+        return current
+
+
+def chunk_ids(source: str, chunks: List[str]) -> List[str]:
+    """
+    IDs dérivés du contenu: un chunk inchangé garde son ID même si le
+    fichier est modifié ailleurs (les doublons sont numérotés)
+    """
+    ids, seen = [], {}
+    for chunk in chunks:
+        digest = hashlib.sha1(chunk.encode("utf-8")).hexdigest()[:16]
+        seen[digest] = seen.get(digest, 0) + 1
+        suffix = f"-{seen[digest]}" if seen[digest] > 1 else ""
+        ids.append(f"{source}#{digest}{suffix}")
+    return ids
+
+
+def _extract_file(path: str, source: str, previous_digest: Optional[str],
+                  chunker: Callable[[Iterable[str]], Iterator[str]]) -> Dict:
+    """Travail d'un processus: empreinte, extraction et découpage d'un fichier"""
+    started = time.perf_counter()
+    digest = file_digest(path)
+    if digest == previous_digest:
+        return {"source": source, "digest": digest, "unchanged": True}
+    chunks = [chunk for chunk in chunker(iter_pages(path)) if chunk.strip()]
+    return {"source": source, "digest": digest, "unchanged": False, "chunks": chunks,
+            "bytes": os.path.getsize(path), "seconds": time.perf_counter() - started}
+
+
+class IngestionPipeline:
+    """
+    Synchronise un dossier de documentation avec une collection ChromaDB.
+    Le manifeste (taille, date, empreinte et IDs des chunks par fichier)
+    permet de ne traiter que les fichiers nouveaux, modifiés ou supprimés.
+    """
+
+    def __init__(self, collection, chunker: Optional[Callable] = None, workers: Optional[int] = None,
+                 batch_size: int = 256, manifest_path: Optional[str] = None,
+                 doc_type: str = "oracle_best_practice"):
+        """
+        Args:
+            collection: Collection ChromaDB (sa fonction d'embedding encode les lots)
+            chunker: Fonction pages -> chunks (défaut TokenChunker)
+            workers: Processus d'extraction (défaut: nombre de CPU)
+            batch_size: Chunks par appel upsert (= par lot d'embedding)
+            manifest_path: Manifeste (défaut data/ingest_<collection>.json)
+        """
+        self.collection = collection
+        self.chunker = chunker or TokenChunker()
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.manifest_path = manifest_path or os.path.join(MANIFEST_DIR, f"ingest_{collection.name}.json")
+        self.doc_type = doc_type
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self) -> Dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def _save_manifest(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+        temporary = self.manifest_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+        os.replace(temporary, self.manifest_path)
+
+    @staticmethod
+    def scan(directory: str) -> Dict[str, str]:
+        """Fichiers supportés du dossier (récursif): {chemin relatif: chemin absolu}"""
+        files = {}
+        for root, _, names in os.walk(directory):
+            for name in sorted(names):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    files[os.path.relpath(path, directory).replace(os.sep, "/")] = path
+        return files
+
+    def sync(self, directory: str) -> Dict:
+        """
+        Met la collection à jour avec le contenu du dossier
+
+        Returns:
+            Rapport: fichiers (inchangés, modifiés, supprimés), chunks
+            (ajoutés, conservés, supprimés), débit
+        """
+        started = time.perf_counter()
+        files = self.scan(directory)
+        report = {"files": len(files), "unchanged": 0, "updated": 0, "removed": 0,
+                  "chunks_added": 0, "chunks_kept": 0, "chunks_deleted": 0, "bytes": 0}
+
+        # Fichiers retirés du dossier: supprimer leurs chunks
+        for source in sorted(set(self.manifest) - set(files)):
+            self._delete(self.manifest.pop(source)["ids"], report)
+            report["removed"] += 1
+
+        # Taille et date identiques: fichier considéré inchangé sans le relire
+        pending = []
+        for source, path in files.items():
+            stat = os.stat(path)
+            entry = self.manifest.get(source)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                report["unchanged"] += 1
+                report["chunks_kept"] += len(entry["ids"])
+            else:
+                pending.append((source, path, entry["digest"] if entry else None))
+
+        if pending:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                futures = {pool.submit(_extract_file, path, source, digest, self.chunker): (source, path)
+                           for source, path, digest in pending}
+                for done, future in enumerate(as_completed(futures), 1):
+                    source, path = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"❌ [{done}/{len(pending)}] {source}: {e}")
+                        continue
+                    self._apply(result, path, report)
+                    state = "inchangé" if result["unchanged"] else f"{len(result['chunks'])} chunks"
+                    print(f"📄 [{done}/{len(pending)}] {source}: {state}")
+                    self._save_manifest()
+
+        self._save_manifest()
+        duration = time.perf_counter() - started
+        report["duration_s"] = round(duration, 2)
+        report["mb_per_s"] = round(report["bytes"] / 1e6 / duration, 2) if duration else None
+        report["chunks_per_s"] = round(report["chunks_added"] / duration, 1) if duration else None
+        print(f"✅ Ingestion: {report['updated']} fichiers mis à jour, {report['chunks_added']} chunks "
+              f"ajoutés, {report['chunks_deleted']} supprimés en {report['duration_s']} s")
+        return report
+
+    def _apply(self, result: Dict, path: str, report: Dict):
+        """Upsert des chunks nouveaux, suppression des chunks disparus d'un fichier"""
+        source = result["source"]
+        stat = os.stat(path)
+        previous = self.manifest.get(source, {}).get("ids", [])
+        if result["unchanged"]:
+            # Seule la date a changé (copie, touch): rien à ré-encoder
+            ids = previous
+            report["unchanged"] += 1
+            report["chunks_kept"] += len(ids)
+        else:
+            chunks = result["chunks"]
+            ids = chunk_ids(source, chunks)
+            known = set(previous)
+            new = [(position, i, chunk) for position, (i, chunk) in enumerate(zip(ids, chunks))
+                   if i not in known]
+            for start in range(0, len(new), self.batch_size):
+                batch = new[start:start + self.batch_size]
+                self.collection.upsert(
+                    ids=[i for _, i, _ in batch],
+                    documents=[chunk for _, _, chunk in batch],
+                    metadatas=[{"source": source, "chunk": position, "doc_type": self.doc_type,
+                                "file_digest": result["digest"][:16]} for position, _, _ in batch]
+                )
+            self._delete(sorted(known - set(ids)), report)
+            report["updated"] += 1
+            report["chunks_added"] += len(new)
+            report["chunks_kept"] += len(ids) - len(new)
+            report["bytes"] += result["bytes"]
+        self.manifest[source] = {"digest": result["digest"], "size": stat.st_size,
+                                 "mtime_ns": stat.st_mtime_ns, "ids": ids}
+
+    def _delete(self, ids: List[str], report: Dict):
+        for start in range(0, len(ids), self.batch_size):
+            self.collection.delete(ids=ids[start:start + self.batch_size])
+        report["chunks_deleted"] += len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion incrémentale de la documentation Oracle")
+    parser.add_argument("directory", nargs="?", default="docs/oracle")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--collection", default="oracle_knowledge_base")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.rag_engine import OracleRAGEngine
+
+    engine = OracleRAGEngine()
+    collection = engine.client.get_or_create_collection(name=args.collection,
+                                                        embedding_function=engine.embedding_function)
+    # Chunks comptés avec le tokenizer de l'embedder du moteur
+    report = IngestionPipeline(collection, engine.chunker, workers=args.workers,
+                               batch_size=args.batch_size).sync(args.directory)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,10 @@
 
 from rag_engine import OracleRAGEngine
 from llm_engine_phi import LLMEnginePhi
+from llm_cascade import ModelCascade
+from rag_context import RetrievalCache, RetrievalContext, retrieve
+from rag_rerank import get_reranker
+from security_audit import SecurityAuditor
 from typing import List, Dict, Optional
 
 class RAGIntegration:
@@ -21,6 +25,13 @@ class RAGIntegration:
         # Initialiser le moteur RAG
         self.rag_engine = OracleRAGEngine()
         self.llm_engine = llm_engine
+        # Documentation / petit modèle d'abord, Phi seulement si nécessaire
+        # (évaluations de sécurité: règles SecurityAuditor sans LLM au niveau 0)
+        self.cascade = ModelCascade(llm_engine, auditor=SecurityAuditor()) if llm_engine else None
+        # Résultats de recherche récents (requête normalisée + version de la collection)
+        self.retrieval_cache = RetrievalCache()
+        # Reclassement cross-encoder optionnel (RAG_RERANK=1)
+        self.reranker = get_reranker()
         
         print("✅ RAG Integration prête")
     
@@ -35,36 +46,56 @@ class RAGIntegration:
         Returns:
             Liste de documents pertinents avec métadonnées
         """
+        return self.retrieve(query, n_results).documents
+    
+    def retrieve(self, query: str, n_results: int = 5, where: Optional[Dict] = None) -> RetrievalContext:
+        """
+        Recherche unique pour une requête, partagée entre la réponse, les
+        sources affichées et la télémétrie (servie par le LRU si déjà faite)
+        """
+        context = retrieve(self.retrieval_cache, self._search, query, n_results, where,
+                           version=self.rag_engine.version)
+        if not context.cached:
+            print(f"📚 {len(context)} documents récupérés pour: '{query[:50]}...'")
+        return context
+    
+    def _search(self, query: str, n_results: int, where: Optional[Dict]) -> List[Dict]:
         try:
-            # Recherche dans ChromaDB
-            results = self.rag_engine.collection.query(
-                query_texts=[query],
-                n_results=n_results
-            )
-            
-            # Formater les résultats
-            documents = []
-            for i in range(len(results['documents'][0])):
-                documents.append({
-                    'content': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i],
-                    'distance': results['distances'][0][i] if 'distances' in results else None
-                })
-            
-            print(f"📚 {len(documents)} documents récupérés pour: '{query[:50]}...'")
-            return documents
-            
+            # Recherche hybride (BM25 + ChromaDB, fusion RRF), candidats en plus si reclassement
+            fetch = max(n_results, self.reranker.candidates) if self.reranker else n_results
+            documents = self._format(self.rag_engine.query(query, fetch, where=where))
+            if self.reranker:
+                documents, _ = self.reranker.rerank(query, documents, n_results)
+            return documents[:n_results]
         except Exception as e:
             print(f"❌ Erreur retrieve_context: {e}")
             return []
     
-    def enhanced_llm_query(self, user_query: str, category: Optional[str] = None) -> str:
+    @staticmethod
+    def _format(results: List[Dict]) -> List[Dict]:
+        """Résultats du moteur RAG au format du dashboard (content, metadata, distance)"""
+        return [{
+            'content': result['document'],
+            'metadata': result['metadata'],
+            # Distance Chroma réelle (None: trouvé par BM25 seul), jamais déduite du rang fusionné
+            'distance': result.get('distance'),
+            'lexical_score': result.get('lexical_score'),
+            'rrf_score': result.get('rrf_score'),
+            'vector_rank': result.get('vector_rank'),
+            'lexical_rank': result.get('lexical_rank')
+        } for result in results]
+    
+    def enhanced_llm_query(self, user_query: str, category: Optional[str] = None,
+                           history: Optional[List[Dict]] = None,
+                           retrieval: Optional[RetrievalContext] = None) -> str:
         """
         Requête LLM enrichie avec contexte RAG
         
         Args:
             user_query: Question utilisateur
             category: Catégorie pour filtrer le contexte (security, performance, backup, etc.)
+            history: Messages précédents de la conversation (role/content)
+            retrieval: Recherche déjà faite pour ce tour (évite de la relancer)
             
         Returns:
             Réponse du LLM enrichie du contexte Oracle
@@ -73,41 +104,30 @@ class RAGIntegration:
             return "⚠️ LLM Engine non disponible"
         
         try:
-            # 1. Récupérer le contexte pertinent
-            context_docs = self.retrieve_context(user_query, n_results=3)
-            
-            # 2. Construire le contexte enrichi
-            context_text = "\n\n=== CONTEXTE ORACLE (Base de connaissances) ===\n"
+            # 1. Récupérer le contexte pertinent (une seule recherche par tour)
+            context_docs = (retrieval or self.retrieve(user_query, n_results=3)).documents
+            
+            # 2. Construire le contexte enrichi (documents classés par pertinence,
+            #    le budget de tokens du moteur LLM coupe les derniers si nécessaire)
+            context_text = ("\n=== CONTEXTE ORACLE (Base de connaissances) ===\n"
+                            "Appuie-toi sur ces documents. S'ils ne suffisent pas, "
+                            "utilise tes connaissances générales Oracle.\n")
             for i, doc in enumerate(context_docs, 1):
                 context_text += f"\n--- Document {i} ({doc['metadata']['topic']}) ---\n"
-                context_text += doc['content'][:1000]  # Limiter pour ne pas dépasser le contexte
+                context_text += doc['content']
                 context_text += "\n"
             
-            # 3. Construire le prompt enrichi
-            enriched_prompt = f"""Tu es un expert Oracle DBA avec accès à une base de connaissances complète.
-
-{context_text}
-
-=== QUESTION DE L'UTILISATEUR ===
-{user_query}
-
-=== INSTRUCTIONS ===
-Réponds à la question en t'appuyant sur le contexte Oracle ci-dessus.
-Fournis des exemples SQL concrets et des commandes exécutables.
-Si le contexte ne suffit pas, utilise tes connaissances générales Oracle.
-"""
-            
-            # 4. Appeler le LLM avec le contexte enrichi
-            response = self.llm_engine.generate(
-                "chatbot_general",
-                variables={
-                    "query": enriched_prompt,
-                    "history": ""
-                },
-                max_tokens=1200
+            # 3. Répondre via la cascade (document, petit modèle puis Phi en mode
+            #    chat: l'historique part en messages, le contexte RAG est joint
+            #    à la dernière question uniquement)
+            result = self.cascade.chat(
+                user_query,
+                history or [],
+                context_docs=context_docs,
+                context=context_text
             )
             
-            return response
+            return result["answer"]
             
         except Exception as e:
             return f"❌ Erreur enhanced_llm_query: {str(e)}"
@@ -124,27 +144,9 @@ Si le contexte ne suffit pas, utilise tes connaissances générales Oracle.
         Returns:
             Documents de la catégorie
         """
-        try:
-            # Recherche avec filtre de catégorie
-            results = self.rag_engine.collection.query(
-                query_texts=[query if query else category],
-                n_results=n_results,
-                where={"category": category}
-            )
-            
-            documents = []
-            for i in range(len(results['documents'][0])):
-                documents.append({
-                    'content': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i],
-                    'distance': results['distances'][0][i] if 'distances' in results else None
-                })
-            
-            return documents
-            
-        except Exception as e:
-            print(f"❌ Erreur search_by_category: {e}")
-            return []
+        # Recherche avec filtre de catégorie
+        return self.retrieve(query if query else category, n_results,
+                             where={"category": category}).documents
     
     def get_related_documents(self, topic: str, n_results: int = 5) -> List[Dict]:
         """
@@ -190,7 +192,8 @@ Si le contexte ne suffit pas, utilise tes connaissances générales Oracle.
             
             # Analyser avec LLM + contexte
             if analysis_type == "security":
-                result = self.llm_engine.assess_security(data)
+                # Règles, petit modèle puis Phi: le premier niveau au résultat conforme
+                result = self.cascade.assess_security(data)
                 result['context_applied'] = context_summary
                 return result
                 
@@ -228,9 +231,6 @@ Si le contexte ne suffit pas, utilise tes connaissances générales Oracle.
             True si ajouté avec succès
         """
         try:
-            import uuid
-            doc_id = f"custom_{uuid.uuid4().hex[:8]}"
-            
             doc_metadata = {
                 'category': category,
                 'topic': topic,
@@ -241,14 +241,8 @@ Si le contexte ne suffit pas, utilise tes connaissances générales Oracle.
             if metadata:
                 doc_metadata.update(metadata)
             
-            self.rag_engine.collection.add(
-                documents=[content],
-                metadatas=[doc_metadata],
-                ids=[doc_id]
-            )
-            
-            print(f"✅ Document ajouté: {doc_id}")
-            return True
+            # Découpage (TokenChunker) et comptage délégués au moteur
+            return self.rag_engine.add_document(content, doc_metadata)
             
         except Exception as e:
             print(f"❌ Erreur add_custom_document: {e}")
@@ -262,27 +256,10 @@ Si le contexte ne suffit pas, utilise tes connaissances générales Oracle.
             Statistiques (nombre de documents, catégories, etc.)
         """
         try:
-            count = self.rag_engine.collection.count()
-            
-            # Récupérer quelques documents pour analyser les catégories
-            sample = self.rag_engine.collection.get(limit=count)
-            
-            categories = {}
-            topics = {}
-            
-            for metadata in sample['metadatas']:
-                cat = metadata.get('category', 'unknown')
-                topic = metadata.get('topic', 'unknown')
-                
-                categories[cat] = categories.get(cat, 0) + 1
-                topics[topic] = topics.get(topic, 0) + 1
-            
-            return {
-                'total_documents': count,
-                'categories': categories,
-                'topics': topics,
-                'collection_name': self.rag_engine.collection.name
-            }
+            # Compteurs du moteur (temps constant, sans relire les métadonnées)
+            stats = self.rag_engine.retriever.collection_stats()
+            stats['collection_name'] = self.rag_engine.collection.name
+            return stats
             
         except Exception as e:
             return {'error': str(e)}
@@ -308,8 +285,9 @@ Si le contexte ne suffit pas, utilise tes connaissances générales Oracle.
         
         results = {}
         
-        for query in test_queries:
-            docs = self.retrieve_context(query, n_results=3)
+        # Toutes les questions en un lot (un seul appel au modèle d'embedding)
+        for query, found in zip(test_queries, self.rag_engine.query_many(test_queries, 3)):
+            docs = self._format(found)
             results[query] = {
                 'found': len(docs),
                 'top_topics': [doc['metadata']['topic'] for doc in docs],
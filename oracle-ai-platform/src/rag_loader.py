@@ -0,0 +1,99 @@
+# src/rag_loader.py
+"""
+Chargement différé du moteur RAG: le client ChromaDB, le modèle d'embedding
+et l'encodage des documents initiaux se font dans un thread, pendant que le
+dashboard s'affiche et répond avec la recherche lexicale (BM25).
+
+Configuration (.env):
+    RAG_BACKGROUND_LOAD=0        Charger le moteur au démarrage (bloquant)
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+try:
+    from src.llm_telemetry import get_telemetry
+except ImportError:
+    from llm_telemetry import get_telemetry
+
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class BackgroundLoader:
+    """Construit un objet coûteux dans un thread; l'état se consulte sans bloquer"""
+
+    def __init__(self, factory: Callable[[], Any], name: str = "rag-engine-load",
+                 on_ready: Optional[Callable[[Any], None]] = None):
+        """
+        Args:
+            factory: Fonction qui construit l'objet (ex: OracleRAGEngine)
+            name: Nom du thread (et de la série de télémétrie)
+            on_ready: Appelée avec l'objet construit, dans le thread de chargement
+        """
+        self.factory = factory
+        self.name = name
+        self.on_ready = on_ready
+        self.state: Optional[str] = None
+        self.value = None
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self._started: Optional[float] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, background: Optional[bool] = None) -> "BackgroundLoader":
+        """
+        Lance le chargement (une seule fois)
+
+        Args:
+            background: Dans un thread (défaut: RAG_BACKGROUND_LOAD, activé)
+        """
+        if background is None:
+            background = os.getenv("RAG_BACKGROUND_LOAD", "1") != "0"
+        with self._lock:
+            if self.state is not None:
+                return self
+            self.state = LOADING
+            self._started = time.perf_counter()
+        if background:
+            threading.Thread(target=self._run, name=self.name, daemon=True).start()
+        else:
+            self._run()
+        return self
+
+    def _run(self):
+        try:
+            value = self.factory()
+            if self.on_ready:
+                self.on_ready(value)
+            self.value, self.state = value, READY
+        except Exception as e:
+            self.error, self.state = str(e), FAILED
+            print(f"⚠️ Chargement {self.name} échoué: {e}")
+        finally:
+            self.seconds = time.perf_counter() - self._started
+            get_telemetry().record("rag_startup", self.name, total_s=self.seconds)
+            self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Attend la fin du chargement; True si l'objet est prêt"""
+        if self.state is None:
+            return False
+        self._done.wait(timeout)
+        return self.ready
+
+    def status(self) -> Dict:
+        """État pour l'affichage: state, seconds (écoulées si en cours), error"""
+        if self.state == LOADING:
+            seconds = time.perf_counter() - self._started
+        else:
+            seconds = self.seconds
+        return {"state": self.state, "seconds": round(seconds, 1) if seconds is not None else None,
+                "error": self.error}
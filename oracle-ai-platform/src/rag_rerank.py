@@ -0,0 +1,149 @@
+# src/rag_rerank.py
+"""
+Reclassement des documents récupérés par un cross-encoder local (CPU):
+on récupère 20 à 50 candidats, on les note par lots avec la question et on
+ne garde que les k meilleurs, pour que le contexte de Phi (2048 tokens) ne
+contienne que des passages utiles.
+
+Le reclassement a un budget de temps par requête: il est sauté quand
+l'estimation (latence mesurée par paire) dépasse le budget, et arrêté entre
+deux lots si le budget est consommé. Tant que le modèle se charge (en
+arrière-plan), les résultats sont rendus dans l'ordre de la recherche.
+
+Configuration (.env):
+    RAG_RERANK=1                 Activer le reclassement
+    RAG_RERANK_MODEL=cross-encoder/ms-marco-MiniLM-L-6-v2
+    RAG_RERANK_BUDGET_MS=300     Budget par requête
+    RAG_RERANK_CANDIDATES=20     Candidats récupérés avant reclassement
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from src.llm_telemetry import get_telemetry
+except ImportError:
+    from llm_telemetry import get_telemetry
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+    """Reclassement (question, passage) par cross-encoder, borné en temps"""
+
+    def __init__(self, model_name: str = DEFAULT_RERANK_MODEL, budget_s: float = 0.3,
+                 candidates: int = 20, batch_size: int = 16, max_length: int = 256,
+                 scorer: Optional[Callable[[List[Tuple[str, str]]], Sequence[float]]] = None):
+        """
+        Args:
+            model_name: Cross-encoder sentence-transformers
+            budget_s: Temps maximal de reclassement par requête
+            candidates: Documents à récupérer avant reclassement
+            batch_size: Paires notées par appel au modèle
+            max_length: Tokens par paire (les passages plus longs sont tronqués)
+            scorer: Fonction paires -> scores (remplace le modèle, pour les tests)
+        """
+        self.model_name = model_name
+        self.budget_s = budget_s
+        self.candidates = candidates
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._scorer = scorer
+        self._loading = None
+        self._lock = threading.Lock()
+        # Latence moyenne (mobile) d'une paire, mesurée sur les lots précédents
+        self.pair_seconds: Optional[float] = None
+        self.available = True
+
+    def _load(self):
+        try:
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+            self._scorer = lambda pairs: model.predict(pairs, batch_size=self.batch_size,
+                                                       show_progress_bar=False)
+            print(f"✅ Cross-encoder chargé: {self.model_name}")
+        except Exception as e:
+            self.available = False
+            print(f"⚠️ Reclassement désactivé ({self.model_name}): {e}")
+
+    def ready(self) -> bool:
+        """Modèle prêt; sinon lance son chargement en arrière-plan"""
+        if self._scorer is not None:
+            return True
+        with self._lock:
+            if self.available and self._loading is None:
+                self._loading = threading.Thread(target=self._load, name="rag-rerank-load", daemon=True)
+                self._loading.start()
+        return False
+
+    def rerank(self, query: str, documents: List[Dict], k: int, budget_s: Optional[float] = None,
+               text_key: str = "content") -> Tuple[List[Dict], Dict]:
+        """
+        Garde les k documents les mieux notés par le cross-encoder
+
+        Args:
+            query: Question
+            documents: Candidats, dans l'ordre de la recherche
+            k: Documents à garder
+            budget_s: Budget de temps (défaut: celui du reclasseur)
+            text_key: Clé du texte dans chaque document
+
+        Returns:
+            (documents gardés, rapport: reranked, reason, scored, seconds)
+        """
+        budget = self.budget_s if budget_s is None else budget_s
+        report = {"reranked": False, "reason": None, "scored": 0, "seconds": 0.0}
+        if len(documents) <= 1:
+            report["reason"] = "trop peu de candidats"
+            return documents[:k], report
+        if not self.ready():
+            report["reason"] = "modèle en chargement" if self.available else "modèle indisponible"
+            return documents[:k], report
+        if self.pair_seconds is not None and self.pair_seconds * len(documents) > budget:
+            # Tous les candidats ne tiendraient pas: n'en noter que ce que le budget permet
+            affordable = int(budget / self.pair_seconds)
+            if affordable <= k:
+                report["reason"] = f"budget {budget * 1000:.0f} ms insuffisant"
+                return documents[:k], report
+            documents = documents[:affordable]
+
+        started = time.perf_counter()
+        scores: List[float] = []
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            elapsed = time.perf_counter() - started
+            if scores and self.pair_seconds and elapsed + self.pair_seconds * len(batch) > budget:
+                report["reason"] = "budget atteint"
+                break
+            batch_started = time.perf_counter()
+            scores.extend(float(s) for s in self._scorer([(query, doc.get(text_key, "")) for doc in batch]))
+            per_pair = (time.perf_counter() - batch_started) / len(batch)
+            self.pair_seconds = per_pair if self.pair_seconds is None else 0.8 * self.pair_seconds + 0.2 * per_pair
+
+        scored = [dict(doc, rerank_score=score) for doc, score in zip(documents, scores)]
+        scored.sort(key=lambda doc: doc["rerank_score"], reverse=True)
+        # Candidats non notés (budget atteint): après les notés, dans l'ordre de la recherche
+        kept = (scored + documents[len(scores):])[:k]
+        report.update(reranked=True, scored=len(scores), seconds=time.perf_counter() - started)
+        get_telemetry().record("rag_rerank", self.model_name, total_s=report["seconds"])
+        return kept, report
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    """Reclasseur partagé par le processus (None si RAG_RERANK n'est pas activé)"""
+    global _reranker
+    if os.getenv("RAG_RERANK", "0") != "1":
+        return None
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = CrossEncoderReranker(
+                model_name=os.getenv("RAG_RERANK_MODEL", DEFAULT_RERANK_MODEL),
+                budget_s=float(os.getenv("RAG_RERANK_BUDGET_MS", "300")) / 1000,
+                candidates=int(os.getenv("RAG_RERANK_CANDIDATES", "20")),
+            )
+        return _reranker
@@ -1,64 +1,66 @@
 # src/rag_setup.py
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
-import PyPDF2
 import os
 
+try:
+    from src.embedding_backends import embedding_backend_from_env
+    from src.embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+    from src.rag_chunker import TokenChunker
+    from src.rag_ingest import IngestionPipeline, chunk_ids, iter_pages
+except ImportError:
+    from embedding_backends import embedding_backend_from_env
+    from embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+    from rag_chunker import TokenChunker
+    from rag_ingest import IngestionPipeline, chunk_ids, iter_pages
+
 class RAGSetup:
     def __init__(self):
         self.client = chromadb.Client(Settings(
             chroma_db_impl="duckdb+parquet",
             persist_directory="./data/chroma_db"
         ))
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # PyTorch ou ONNX int8 selon RAG_EMBEDDING_BACKEND
+        self.embedding_model = embedding_backend_from_env('all-MiniLM-L6-v2')
+        # Reconstruire la collection ne ré-encode que les chunks nouveaux ou modifiés
+        self._embed_function = CachedEmbeddingFunction(self._encode, EmbeddingCache(self.embedding_model.name))
+        # Chunks comptés en tokens du modèle: aucun texte tronqué à l'encodage
+        self.chunker = TokenChunker(model='all-MiniLM-L6-v2', embedder=self.embedding_model)
+    
+    def _encode(self, texts):
+        return self.embedding_model.embed(texts)
         
     def load_oracle_documents(self, docs_directory):
-        """Charge les documents Oracle pour le contexte"""
+        """Charge les documents Oracle pour le contexte (IDs dérivés du contenu)"""
         documents = []
         metadatas = []
         ids = []
         
-        # Parcourir les fichiers de documentation
-        for filename in os.listdir(docs_directory):
-            if filename.endswith('.pdf'):
-                text = self._extract_pdf_text(
-                    os.path.join(docs_directory, filename)
-                )
-            elif filename.endswith('.txt'):
-                with open(os.path.join(docs_directory, filename), 'r') as f:
-                    text = f.read()
-            
-            # Découper en chunks
-            chunks = self._chunk_text(text, 500)
-            
-            for i, chunk in enumerate(chunks):
+        # Parcourir les fichiers de documentation (PDF, TXT, DOCX)
+        for source, path in IngestionPipeline.scan(docs_directory).items():
+            chunks = [c for c in self.chunker(iter_pages(path)) if c.strip()]
+            for i, (chunk_id, chunk) in enumerate(zip(chunk_ids(source, chunks), chunks)):
                 documents.append(chunk)
                 metadatas.append({
-                    "source": filename,
+                    "source": source,
                     "chunk": i,
                     "doc_type": "oracle_best_practice"
                 })
-                ids.append(f"{filename}_{i}")
+                ids.append(chunk_id)
         
         return documents, metadatas, ids
     
-    def create_collection(self, collection_name="oracle_docs"):
-        """Crée une collection dans ChromaDB"""
-        collection = self.client.create_collection(
+    def create_collection(self, collection_name="oracle_docs", workers=None):
+        """Crée ou met à jour une collection dans ChromaDB (seuls les fichiers modifiés sont traités)"""
+        self.collection = self.client.get_or_create_collection(
             name=collection_name,
             embedding_function=self._embed_function
         )
         
-        # Charger les documents
-        docs, metas, ids = self.load_oracle_documents("docs/oracle/")
-        collection.add(
-            documents=docs,
-            metadatas=metas,
-            ids=ids
-        )
+        # Ingestion parallèle et incrémentale des documents
+        self.ingest_report = IngestionPipeline(self.collection, self.chunker, workers=workers).sync("docs/oracle/")
         
-        return collection
+        return self.collection
     
     def retrieve_context(self, query, n_results=5):
         """Récupère les documents pertinents"""
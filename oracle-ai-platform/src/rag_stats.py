@@ -0,0 +1,161 @@
+# src/rag_stats.py
+"""
+Statistiques de la base de connaissances tenues à jour à chaque écriture:
+nombre de documents par catégorie, topic et source, dans un fichier SQLite
+à côté de la collection ChromaDB. La lecture ne dépend plus de la taille de
+la collection (plus de collection.get() de toutes les métadonnées à chaque
+affichage du dashboard), ni au démarrage: les compteurs sont relus tels
+quels, seul check() parcourt la collection.
+"""
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+FIELDS = ("category", "topic", "source")
+STATS_FILE = "collection_stats.sqlite"
+
+# Lignes insérées par appel lors d'une reconstruction
+_BATCH = 500
+
+
+class CollectionStats:
+    """
+    Compteurs par catégorie / topic / source (SQLite). Chaque document garde
+    ses valeurs: un remplacement ou une suppression décrémente exactement ce
+    qui avait été compté. Plusieurs moteurs (sessions Streamlit) peuvent
+    partager le même fichier: les compteurs sont relus à chaque snapshot().
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: Fichier SQLite du sidecar (None: en mémoire, non persisté)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._memory = None if path else sqlite3.connect(":memory:", check_same_thread=False)
+        with self._lock, self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS documents ("
+                       "id TEXT PRIMARY KEY, category TEXT, topic TEXT, source TEXT)")
+            db.execute("CREATE TABLE IF NOT EXISTS counts ("
+                       "field TEXT, value TEXT, n INTEGER, PRIMARY KEY (field, value))")
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._memory or sqlite3.connect(self.path, timeout=30)
+
+    def __len__(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    @staticmethod
+    def _values(metadata: Optional[Dict]) -> Tuple[str, ...]:
+        metadata = metadata or {}
+        return tuple(str(metadata.get(field) or "unknown") for field in FIELDS)
+
+    @staticmethod
+    def _count(db: sqlite3.Connection, values: Sequence[str], delta: int):
+        for field, value in zip(FIELDS, values):
+            db.execute("INSERT INTO counts VALUES (?, ?, ?) "
+                       "ON CONFLICT (field, value) DO UPDATE SET n = n + excluded.n",
+                       (field, value, delta))
+
+    @staticmethod
+    def _forget(db: sqlite3.Connection, doc_id: str):
+        row = db.execute("SELECT category, topic, source FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if row is not None:
+            db.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+            CollectionStats._count(db, row, -1)
+
+    def ids(self) -> Set[str]:
+        """IDs comptés (rapprochement avec la collection au démarrage)"""
+        with self._connect() as db:
+            return {row[0] for row in db.execute("SELECT id FROM documents")}
+
+    def add(self, ids: Sequence[str], metadatas: Optional[Sequence[Dict]] = None):
+        """Compte des documents (un ID déjà connu est remplacé)"""
+        with self._lock, self._connect() as db:
+            # Transaction d'écriture dès la lecture des anciennes valeurs (autres moteurs)
+            db.execute("BEGIN IMMEDIATE")
+            for position, doc_id in enumerate(ids):
+                self._forget(db, doc_id)
+                values = self._values(metadatas[position] if metadatas else None)
+                db.execute("INSERT INTO documents VALUES (?, ?, ?, ?)", (doc_id, *values))
+                self._count(db, values, 1)
+            db.execute("DELETE FROM counts WHERE n <= 0")
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock, self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            for doc_id in ids:
+                self._forget(db, doc_id)
+            db.execute("DELETE FROM counts WHERE n <= 0")
+
+    def snapshot(self) -> Dict:
+        """Statistiques au format du dashboard (coût indépendant du nombre de documents)"""
+        counts = {field: {} for field in FIELDS}
+        with self._connect() as db:
+            for field, value, n in db.execute("SELECT field, value, n FROM counts"):
+                counts[field][value] = n
+        categories = counts["category"]
+        return {
+            'total_documents': sum(categories.values()),
+            'categories': categories,
+            'topics': counts["topic"],
+            'sources': counts["source"],
+            'categories_distribution': categories  # Alias pour compatibilité
+        }
+
+    def _replace_all(self, rows: List[Tuple[str, ...]]):
+        with self._lock, self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM documents")
+            db.execute("DELETE FROM counts")
+            for start in range(0, len(rows), _BATCH):
+                db.executemany("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)", rows[start:start + _BATCH])
+            for field in FIELDS:
+                db.execute(f"INSERT INTO counts SELECT ?, {field}, COUNT(*) FROM documents GROUP BY {field}",
+                           (field,))
+
+    def check(self, collection, batch_size: int = 1000, repair: bool = False) -> Dict:
+        """
+        Compare les compteurs avec un parcours complet de la collection
+        (opération de maintenance: lit toutes les métadonnées par lots)
+
+        Args:
+            collection: Collection ChromaDB
+            batch_size: Métadonnées lues par appel
+            repair: Remplacer les compteurs par ceux de la collection en cas d'écart
+
+        Returns:
+            consistent, documents (collection / compteurs) et écarts par champ
+        """
+        rows = []
+        offset = 0
+        while True:
+            batch = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            rows.extend((doc_id, *self._values(metadata))
+                        for doc_id, metadata in zip(batch["ids"], batch["metadatas"]))
+            offset += len(batch["ids"])
+
+        expected = {field: {} for field in FIELDS}
+        for row in rows:
+            for field, value in zip(FIELDS, row[1:]):
+                expected[field][value] = expected[field].get(value, 0) + 1
+        actual = self.snapshot()
+        differences = {}
+        for key, field in (("categories", "category"), ("topics", "topic"), ("sources", "source")):
+            names = set(expected[field]) | set(actual[key])
+            delta = {name: actual[key].get(name, 0) - expected[field].get(name, 0) for name in names}
+            delta = {name: value for name, value in delta.items() if value}
+            if delta:
+                differences[key] = delta
+        consistent = not differences and len(rows) == actual["total_documents"]
+        if not consistent:
+            print(f"⚠️ Statistiques RAG incohérentes: {actual['total_documents']} comptés, "
+                  f"{len(rows)} dans la collection")
+            if repair:
+                self._replace_all(rows)
+        return {"consistent": consistent, "collection_documents": len(rows),
+                "counted_documents": actual["total_documents"], "differences": differences}
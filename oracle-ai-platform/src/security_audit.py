@@ -8,15 +8,22 @@ from typing import Dict, List, Any, Optional, Tuple
 import os
 import html
 
+try:
+    from src.llm_precompute import audit_fingerprint, database_name
+except ImportError:
+    from llm_precompute import audit_fingerprint, database_name
+
 class SecurityAuditor:
-    def __init__(self, llm_engine=None):
+    def __init__(self, llm_engine=None, precomputed=None):
         """
         Initialise l'auditeur de sécurité
         
         Args:
             llm_engine: Moteur LLM pour l'analyse (optionnel)
+            precomputed: PrecomputeStore des analyses LLM calculées hors pointe (optionnel)
         """
         self.llm = llm_engine
+        self.precomputed = precomputed
         self.risk_thresholds = {
             'CRITICAL': 20,
             'HIGH': 10,
@@ -202,9 +209,20 @@ class SecurityAuditor:
         
         # Si un LLM est disponible, utiliser pour une analyse approfondie
         if self.llm:
-            print("Analyse approfondie avec LLM...")
-            llm_analysis = self._llm_deep_analysis(config_data, report['risks'])
-            report['llm_analysis'] = llm_analysis
+            fingerprint = audit_fingerprint(database_name(config_data), report['risks'])
+            stored = self.precomputed.get_audit(fingerprint) if self.precomputed else None
+            if stored:
+                # Même base, mêmes risques: l'analyse de la passe de nuit reste valable
+                print(f"Analyse approfondie précalculée ({stored['age']})")
+                report['llm_analysis'] = stored['result']
+                report['llm_analysis_precomputed'] = {k: stored[k] for k in ('computed_at', 'age', 'stale')}
+            else:
+                print("Analyse approfondie avec LLM...")
+                llm_analysis = self._llm_deep_analysis(config_data, report['risks'])
+                report['llm_analysis'] = llm_analysis
+                if self.precomputed and 'error' not in llm_analysis:
+                    self.precomputed.put("security_deep_analysis", fingerprint, llm_analysis,
+                                         label=database_name(config_data))
         
         print(f"=== Audit terminé. Score: {report['score']}/100 ===")
         return report
@@ -569,6 +587,22 @@ class SecurityAuditor:
             # Générer des exemples pour few-shot learning
             examples = self.generate_security_examples()
             
+            # Moteur avec sortie JSON contrainte par schéma (LLMEnginePhi)
+            if hasattr(self.llm, 'generate_json'):
+                analysis = self.llm.generate_json(
+                    "security_deep_analysis",
+                    variables={
+                        "examples": json.dumps(examples[:3], ensure_ascii=False, indent=2),
+                        "config_summary": json.dumps(context['config_summary']),
+                        "risk_count": len(risks),
+                        "risks": json.dumps(context['risks_found'], ensure_ascii=False, default=str)
+                    },
+                    max_tokens=600
+                )
+                if analysis:
+                    return analysis
+                return {"error": "Analyse LLM: aucune réponse JSON exploitable"}
+            
             # Créer le prompt
             prompt = f"""
             Analyse de sécurité Oracle - Rapport d'audit
@@ -0,0 +1,49 @@
+# test_embedding_backends.py - Tests des backends d'embedding (PyTorch / ONNX int8)
+import sys
+import os
+
+import numpy as np
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.embedding_backends import (OnnxEmbedder, TorchEmbedder, compare_backends,
+                                    embedding_backend_from_env, mean_pooling)
+
+
+def test_mean_pooling_ignores_padding_and_normalizes():
+    """Les tokens de padding ne comptent pas dans la moyenne; vecteurs de norme 1"""
+    hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]])
+    mask = np.array([[1, 1, 0]])
+    pooled = mean_pooling(hidden, mask)
+    assert np.allclose(pooled, [[1.0, 0.0]])
+
+
+def test_compare_backends_reports_agreement():
+    """Un backend légèrement bruité reste aligné sur la référence"""
+    rng = np.random.default_rng(0)
+    vocabulary = {}
+
+    def reference(texts):
+        return np.array([vocabulary.setdefault(t, rng.normal(size=16)) for t in texts])
+
+    def candidate(texts):
+        return reference(texts) + 0.01 * rng.normal(size=(len(texts), 16))
+
+    documents = [f"document {i}" for i in range(6)]
+    report = compare_backends(reference, candidate, ["question a", "question b"], documents, repeat=2)
+    assert report["mean_cosine"] > 0.99 and report["top1_agreement"] == 1.0
+    assert report["overlap_at_3"] == 1.0 and report["speedup"] > 0
+
+
+def test_backend_from_env(tmp_path, monkeypatch):
+    """ONNX seulement si l'export existe; aucun modèle chargé à la construction"""
+    monkeypatch.setenv("RAG_EMBEDDING_BACKEND", "onnx")
+    monkeypatch.setenv("RAG_ONNX_DIR", str(tmp_path))
+    assert isinstance(embedding_backend_from_env(), TorchEmbedder)
+
+    (tmp_path / "model.onnx").write_bytes(b"")
+    monkeypatch.setenv("RAG_EMBEDDING_THREADS", "2")
+    backend = embedding_backend_from_env()
+    assert isinstance(backend, OnnxEmbedder) and backend.threads == 2
+    assert backend.name != TorchEmbedder().name and backend._session is None
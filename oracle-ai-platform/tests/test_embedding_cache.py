@@ -0,0 +1,71 @@
+# test_embedding_cache.py - Tests du cache disque des embeddings
+import sys
+import os
+
+import numpy as np
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+
+
+class CountingEncoder:
+    """Encodeur déterministe qui compte les textes encodés"""
+
+    def __init__(self):
+        self.encoded = 0
+
+    def __call__(self, texts):
+        self.encoded += len(texts)
+        return np.array([[len(t), t.count("e"), 1.0, 0.5] for t in texts], dtype=np.float32)
+
+
+def test_only_new_texts_are_embedded(tmp_path):
+    """Les textes déjà vus (à l'espacement près) ne repassent pas par le modèle"""
+    encoder = CountingEncoder()
+    function = CachedEmbeddingFunction(encoder, EmbeddingCache("mini", str(tmp_path)))
+
+    first = function(["index bitmap", "redo log"])
+    second = function(["index  bitmap ", "undo tablespace", "redo log"])
+    assert encoder.encoded == 3
+    assert second[0] == first[0] and second[2] == first[1]
+    assert function.cache.stats()["hits"] == 2
+
+
+def test_cache_survives_reopen_and_partial_write(tmp_path):
+    """Les vecteurs sont relus par memmap; une ligne incomplète est ignorée"""
+    cache = EmbeddingCache("mini", str(tmp_path), dtype="float32")
+    cache.put_many(["a", "b"], [[1, 2, 3, 4], [5, 6, 7, 8]])
+    with open(os.path.join(cache.directory, "vectors.bin"), "ab") as f:
+        f.write(b"\x00" * 6)  # écriture interrompue
+
+    reopened = EmbeddingCache("mini", str(tmp_path))
+    vectors, missing = reopened.get_many(["b", "c", "a"])
+    assert missing == [1] and len(reopened) == 2
+    assert vectors[0].tolist() == [5, 6, 7, 8]
+    assert reopened.dtype == np.float32
+
+
+def test_models_do_not_share_vectors(tmp_path):
+    """Deux modèles d'embedding ont des caches distincts"""
+    EmbeddingCache("mini", str(tmp_path)).put_many(["a"], [[1, 2, 3, 4]])
+    _, missing = EmbeddingCache("mpnet", str(tmp_path)).get_many(["a"])
+    assert missing == [0]
+
+
+def test_instances_sharing_a_directory_interleave_writes(tmp_path):
+    """Deux instances sur le même dossier: chaque clé pointe sur son propre vecteur"""
+    first = EmbeddingCache("mini", str(tmp_path), dtype="float32")
+    second = EmbeddingCache("mini", str(tmp_path), dtype="float32")
+
+    first.put_many(["a"], [[1, 1, 1, 1]])
+    second.put_many(["b"], [[2, 2, 2, 2]])
+    first.put_many(["c", "b"], [[3, 3, 3, 3], [9, 9, 9, 9]])
+    second.put_many(["d"], [[4, 4, 4, 4]])
+
+    expected = {"a": 1, "b": 2, "c": 3, "d": 4}
+    for cache in (first, second, EmbeddingCache("mini", str(tmp_path))):
+        vectors, missing = cache.get_many(list(expected))
+        assert missing == [] and len(cache) == 4
+        assert [vector[0] for vector in vectors] == list(expected.values())
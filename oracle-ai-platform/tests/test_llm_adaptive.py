@@ -0,0 +1,87 @@
+# test_llm_adaptive.py - Tests des limites num_predict / num_ctx adaptatives
+import sys
+import os
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_adaptive import AdaptiveLimits
+
+
+def test_num_predict_follows_observed_percentile():
+    """Après assez d'observations, la limite suit le p95 des sorties (+ marge)"""
+    limits = AdaptiveLimits(min_samples=10)
+    assert limits.num_predict("anomaly_detection", 500) == 500
+
+    for _ in range(30):
+        limit = limits.num_predict("anomaly_detection", 500)
+        limits.observe("anomaly_detection", limit, {"eval_count": 150, "done_reason": "stop"})
+    assert limits.num_predict("anomaly_detection", 500) == 192
+
+
+def test_num_predict_widens_on_truncation_within_caps():
+    """Des sorties coupées font remonter la limite, sans dépasser le plafond"""
+    limits = AdaptiveLimits(min_samples=5)
+    limit = 0
+    for _ in range(40):
+        limit = limits.num_predict("anomaly_detection", 500)
+        limits.observe("anomaly_detection", limit, {"eval_count": limit, "done_reason": "length"})
+    assert limit == 700
+
+
+def test_num_ctx_grows_immediately_and_shrinks_slowly():
+    """La fenêtre partagée grandit tout de suite et ne rétrécit qu'après min_samples"""
+    limits = AdaptiveLimits(min_samples=5)
+    assert limits.num_ctx(1500, 400) == 2048
+    sizes = [limits.num_ctx(200, 300) for _ in range(10)]
+    assert sizes[0] == 2048 and sizes[-1] == 2048  # le p99 garde la grosse requête
+
+    limits = AdaptiveLimits(min_samples=5)
+    sizes = [limits.num_ctx(200, 300) for _ in range(5)]
+    assert sizes[-1] == 1024
+
+
+def test_models_learn_separately():
+    """Les sorties du petit modèle ne changent ni la limite ni la fenêtre de Phi"""
+    limits = AdaptiveLimits(min_samples=5)
+    for _ in range(10):
+        limit = limits.num_predict("chatbot_general", 1200, model="tiny:latest")
+        limits.observe("chatbot_general", limit, {"eval_count": 100, "done_reason": "stop"}, model="tiny:latest")
+        limits.num_ctx(200, 300, model="tiny:latest")
+    assert limits.num_predict("chatbot_general", 1200, model="tiny:latest") == 200
+    assert limits.num_predict("chatbot_general", 1200, model="phi:latest") == 1200
+    assert limits.num_ctx(200, 300, model="tiny:latest") == 1024
+    assert limits.num_ctx(200, 300, model="phi:latest") == 2048
+    assert {row["model"] for row in limits.report()} == {"tiny:latest"}
+
+
+def test_report_counts_reserved_tokens_and_adaptive_truncations():
+    """Tokens réservés en moins comptés comme tokens (appels terminés normalement); coupures à part"""
+    limits = AdaptiveLimits(min_samples=1)
+    limits.observe("anomaly_detection", 500, {"eval_count": 100, "eval_duration": 1e9})
+    limit = limits.num_predict("anomaly_detection", 500)
+    assert limit == 128
+    limits.observe("anomaly_detection", limit, {"eval_count": 90, "done_reason": "stop", "eval_duration": 1e9},
+                   num_ctx=1024)
+    limits.observe("anomaly_detection", limit, {"eval_count": 128, "done_reason": "length", "eval_duration": 1e9},
+                   num_ctx=1024)
+
+    row = limits.report()[0]
+    assert row["reserved_predict_tokens"] == 500 - 128
+    assert row["reserved_ctx_tokens"] == 2 * (2048 - 1024)
+    assert row["adaptive_truncations"] == 1
+    assert row["saved_seconds"] is None  # aucune mesure de chargement / prompt par fenêtre
+
+
+def test_saved_seconds_come_from_measured_prompt_and_load_durations():
+    """Temps économisé = écart mesuré de chargement et d'évaluation du prompt entre fenêtres"""
+    limits = AdaptiveLimits()
+    limits.observe("chatbot_general", 500, {"eval_count": 100, "prompt_eval_count": 200,
+                                            "prompt_eval_duration": 2e9, "load_duration": 1e9}, num_ctx=2048)
+    for _ in range(3):
+        limits.observe("chatbot_general", 500, {"eval_count": 100, "prompt_eval_count": 200,
+                                                "prompt_eval_duration": 1e9, "load_duration": 0.5e9},
+                       num_ctx=1024)
+
+    # Par appel en 1024: 0.5 s de chargement + 200 tokens x 5 ms de prompt en moins
+    assert limits.report()[0]["saved_seconds"] == 3 * (0.5 + 1.0)
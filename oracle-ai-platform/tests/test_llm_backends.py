@@ -0,0 +1,75 @@
+# test_llm_backends.py - Tests des backends LLM et du routeur
+import sys
+import os
+import time
+
+import pytest
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_backends import BackendError, BackendRouter, MockBackend, OpenAICompatibleBackend
+
+
+PAYLOAD = {"model": "phi:latest", "prompt": "Qu'est-ce qu'un AWR ?", "options": {"num_predict": 50}}
+
+
+class FailingBackend(MockBackend):
+    """Backend simulé qui échoue après `fail_after` fragments"""
+
+    def __init__(self, name: str, status_code: int = 503, fail_after: int = 0):
+        super().__init__(name=name)
+        self.status_code = status_code
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def generate(self, payload, timeout=600):
+        self.calls += 1
+        raise BackendError("serveur indisponible", self.status_code)
+
+    def stream(self, payload, timeout=600):
+        self.calls += 1
+        for _ in range(self.fail_after):
+            yield {"response": "début ", "done": False}
+        raise BackendError("serveur indisponible", self.status_code)
+
+
+def test_openai_backend_sends_the_requested_model():
+    """Le modèle de la requête (petit modèle de la cascade) est transmis, pas celui du backend"""
+    backend = OpenAICompatibleBackend("http://localhost:8080/v1", "phi:latest")
+    path, body = backend._translate({**PAYLOAD, "model": "qwen2.5:0.5b"}, stream=False)
+    assert path == "/v1/completions" and body["model"] == "qwen2.5:0.5b"
+    assert backend._translate({"prompt": "x"}, stream=True)[1]["model"] == "phi:latest"
+
+
+def test_stream_fails_over_before_first_chunk_only():
+    """Échec avant le premier fragment: bascule sur le backend suivant; après: erreur remontée"""
+    down, spare = FailingBackend("hs"), MockBackend(name="secours")
+    router = BackendRouter([down, spare])
+    chunks = list(router.stream(PAYLOAD))
+    assert "".join(c.get("response", "") for c in chunks).startswith("[MOCK phi:latest]")
+    assert [s["healthy"] for s in router.snapshot()] == [False, True]
+
+    partial = FailingBackend("coupé", fail_after=2)
+    router = BackendRouter([partial, MockBackend(name="secours")])
+    received = []
+    with pytest.raises(BackendError):
+        for chunk in router.stream(PAYLOAD):
+            received.append(chunk)
+    assert len(received) == 2 and partial.calls == 1
+
+
+def test_hedged_generate_starts_next_backend_on_failure():
+    """Requête doublée: un échec du premier backend lance le suivant sans attendre le délai"""
+    down, spare = FailingBackend("hs"), MockBackend(name="secours")
+    router = BackendRouter([down, spare])
+    started = time.perf_counter()
+    result = router.generate(PAYLOAD, hedge_after=5.0)
+    assert time.perf_counter() - started < 1
+    assert result["backend"] == "secours" and result["hedged"]
+    assert result["response"].startswith("[MOCK phi:latest]")
+
+    # Erreur de la requête elle-même (4xx): pas de nouvelle tentative
+    invalid, spare = FailingBackend("invalide", status_code=404), MockBackend(name="secours")
+    with pytest.raises(BackendError):
+        BackendRouter([invalid, spare]).generate(PAYLOAD, hedge_after=5.0)
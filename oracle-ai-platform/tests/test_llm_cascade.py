@@ -0,0 +1,96 @@
+# test_llm_cascade.py - Tests de la cascade de modèles
+import sys
+import os
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_backends import MockBackend
+from src.llm_engine_phi import LLMEnginePhi
+from src.llm_cascade import ModelCascade, keyword_coverage
+
+
+DOC = {
+    "content": "Politique de mots de passe: CREATE PROFILE secure_profile LIMIT "
+               "PASSWORD_LIFE_TIME 90 FAILED_LOGIN_ATTEMPTS 5 PASSWORD_REUSE_MAX 10",
+    "metadata": {"category": "security", "topic": "password_policy"},
+    "distance": 0.1,
+}
+
+
+def _cascade():
+    full = LLMEnginePhi(backends=[MockBackend(model="phi:latest")])
+    small = LLMEnginePhi(model="tiny:latest", backends=[MockBackend(model="tiny:latest")])
+    return ModelCascade(full, small_engine=small)
+
+
+def test_keyword_coverage_ignores_accents_and_stopwords():
+    """La couverture compare les termes significatifs sans accents"""
+    assert keyword_coverage("Quelle durée pour PASSWORD_LIFE_TIME ?", "password_life_time duree 90") == 1.0
+
+
+def test_document_answer_at_tier_zero():
+    """Une question entièrement couverte par un document n'appelle aucun modèle"""
+    cascade = _cascade()
+    result = cascade.chat("profile password_life_time failed_login_attempts", context_docs=[DOC])
+    assert result["tier"] == 0
+    assert "PASSWORD_LIFE_TIME 90" in result["answer"]
+
+
+def test_short_small_model_answer_escalates():
+    """Une réponse trop courte du petit modèle est escaladée vers le modèle complet"""
+    cascade = _cascade()
+    result = cascade.chat("Comment réduire les attentes log file sync ?", context_docs=[DOC])
+    assert result["tier"] == 2
+    assert result["answer"].startswith("[MOCK phi:latest]")
+
+
+def test_invalid_small_model_json_escalates():
+    """Un JSON non conforme au schéma du petit modèle passe au niveau suivant"""
+    result = _cascade().assess_security({"password_life_time": "UNLIMITED"})
+    assert result["tier"] == 2
+    assert "score" in result
+
+
+def test_tabular_config_is_audited_by_rules():
+    """Une configuration extraite de la base (DataFrames) est évaluée par SecurityAuditor, sans modèle"""
+    import pandas as pd
+    from src.security_audit import SecurityAuditor
+
+    full = LLMEnginePhi(backends=[MockBackend(model="phi:latest")])
+    cascade = ModelCascade(full, auditor=SecurityAuditor())
+    users = pd.DataFrame({"USERNAME": ["SYSTEM"], "ACCOUNT_STATUS": ["OPEN"], "PROFILE": ["DEFAULT"],
+                          "DEFAULT_TABLESPACE": ["SYSTEM"], "PASSWORD_VERSIONS": ["10G"]})
+    def security_calls():
+        return sum(row["calls"] for row in full.telemetry.snapshot() if row["prompt_key"] == "security_assessment")
+
+    before = security_calls()
+    result = cascade.assess_security({"users": users})
+    assert result["tier"] == 0 and isinstance(result["score"], int)
+    assert security_calls() == before
+
+    # Configuration non tabulaire: les règles ne s'appliquent pas, escalade
+    assert cascade.assess_security({"users": 5})["tier"] == 2
+
+
+def test_fragments_are_not_served_at_tier_zero():
+    """Un document tronqué ou un chunk d'un document découpé passe au modèle"""
+    query = "profile password_life_time failed_login_attempts"
+    truncated = dict(DOC, truncated=True)
+    fragment = dict(DOC, metadata={**DOC["metadata"], "chunk": 1, "chunks": 3})
+    for doc in (truncated, fragment):
+        assert _cascade().chat(query, context_docs=[doc])["tier"] == 2
+    whole = dict(DOC, metadata={**DOC["metadata"], "chunk": 0, "chunks": 1})
+    assert _cascade().chat(query, context_docs=[whole])["tier"] == 0
+
+
+def test_tier_zero_requires_absolute_relevance():
+    """Premier du classement fusionné mais peu similaire, ou trouvé par BM25 avec peu de termes: pas de niveau 0"""
+    cascade = _cascade()
+    query = "profile password_life_time failed_login_attempts"
+    distant = dict(DOC, distance=0.6, rrf_score=1.0)
+    assert cascade.chat(query, context_docs=[distant])["tier"] != 0
+
+    lexical_only = dict(DOC, distance=None, lexical_score=0.4)
+    assert cascade.chat(query, context_docs=[lexical_only])["tier"] != 0
+    assert cascade.chat(query, context_docs=[dict(lexical_only, lexical_score=1.0)])["tier"] == 0
@@ -0,0 +1,94 @@
+# test_llm_cassette.py - Tests de l'enregistrement / rejeu des réponses LLM
+import sys
+import os
+import time
+
+import pytest
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_backends import MockBackend, BackendError
+from src.llm_cassette import CassetteBackend, request_fingerprint
+from src.llm_engine_phi import LLMEnginePhi
+
+
+PAYLOAD = {"model": "phi:latest", "prompt": "Qu'est-ce qu'un AWR ?",
+           "options": {"num_predict": 300, "num_ctx": 2048}, "stream": True}
+
+
+def test_fingerprint_ignores_transport_fields():
+    """stream, keep_alive et num_ctx ne changent pas l'empreinte; num_predict (fixé par le moteur) si"""
+    same = dict(PAYLOAD, stream=False, keep_alive="30m",
+                options={"num_predict": 300, "num_ctx": 1024})
+    other = dict(PAYLOAD, options={"num_predict": 200, "num_ctx": 2048})
+    assert request_fingerprint(PAYLOAD) == request_fingerprint(same)
+    assert request_fingerprint(PAYLOAD) != request_fingerprint(other)
+
+
+def test_replay_without_backend_serves_recorded_stream(tmp_path):
+    """Un flux enregistré est rejoué à l'identique, métadonnées comprises"""
+    path = str(tmp_path / "llm.db")
+    recorder = CassetteBackend(MockBackend(), path, mode="record")
+    recorded = list(recorder.stream(PAYLOAD))
+
+    player = CassetteBackend(None, path, mode="replay", model="phi:latest")
+    replayed = list(player.stream(PAYLOAD))
+    text = lambda chunks: "".join(c.get("response", "") for c in chunks)
+    assert text(replayed) == text(recorded)
+    assert replayed[-1]["done"] and replayed[-1]["eval_count"] == recorded[-1]["eval_count"]
+    assert player.generate(dict(PAYLOAD, stream=False))["response"] == text(recorded)
+
+    with pytest.raises(BackendError) as error:
+        player.generate(dict(PAYLOAD, prompt="Question jamais posée"))
+    assert error.value.status_code == 404
+
+
+def test_realtime_replay_keeps_recorded_latency(tmp_path):
+    """En mode temps réel, le rejeu reproduit la latence enregistrée"""
+    path = str(tmp_path / "llm.db")
+    CassetteBackend(MockBackend(latency=0.2), path, mode="record").generate(PAYLOAD)
+
+    fast = CassetteBackend(None, path, mode="replay", model="phi:latest")
+    started = time.perf_counter()
+    fast.generate(PAYLOAD)
+    assert time.perf_counter() - started < 0.1
+
+    slow = CassetteBackend(None, path, mode="replay", model="phi:latest", realtime=True)
+    started = time.perf_counter()
+    slow.generate(PAYLOAD)
+    assert time.perf_counter() - started >= 0.2
+
+
+def test_engine_replays_from_env(tmp_path, monkeypatch):
+    """LLM_CASSETTE enregistre puis rejoue les générations du moteur"""
+    monkeypatch.setenv("LLM_CASSETTE", str(tmp_path / "llm.db"))
+    variables = {"sql_query": "SELECT 1 FROM dual", "execution_plan": ""}
+
+    monkeypatch.setenv("LLM_CASSETTE_MODE", "record")
+    expected = LLMEnginePhi(backends=[MockBackend()]).generate("query_analysis", variables)
+
+    monkeypatch.setenv("LLM_CASSETTE_MODE", "replay")
+    engine = LLMEnginePhi()
+    assert engine.router.backends[0].kind == "cassette"
+    assert engine.generate("query_analysis", variables) == expected
+
+
+def test_replay_after_adaptive_limits_warmed_up(tmp_path, monkeypatch):
+    """Enregistré à froid, rejoué après que les limites adaptatives ont bougé: même empreinte"""
+    from src.llm_adaptive import AdaptiveLimits
+
+    monkeypatch.setenv("LLM_CASSETTE", str(tmp_path / "llm.db"))
+    variables = {"sql_query": "SELECT * FROM v$session", "execution_plan": ""}
+
+    monkeypatch.setenv("LLM_CASSETTE_MODE", "record")
+    expected = LLMEnginePhi(backends=[MockBackend()]).generate("query_analysis", variables)
+
+    monkeypatch.setenv("LLM_CASSETTE_MODE", "replay")
+    engine = LLMEnginePhi()
+    engine.adaptive = AdaptiveLimits(min_samples=1)
+    for _ in range(5):
+        engine.adaptive.observe("query_analysis", 1000, {"eval_count": 150, "done_reason": "stop"},
+                                model=engine.model)
+    assert engine.adaptive.num_predict("query_analysis", 1000, model=engine.model) < 1000
+    assert engine.generate("query_analysis", variables) == expected
@@ -0,0 +1,63 @@
+# test_llm_deadlines.py - Tests des échéances et requêtes doublées
+import sys
+import os
+import time
+
+import pytest
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_backends import BackendRouter, DeadlineExceeded, MockBackend, OllamaBackend
+from src.llm_engine_phi import LLMEnginePhi, MIN_DEADLINE_TOKENS
+from src.mock_ollama_server import MockOllamaServer, MockOllamaConfig
+
+
+PAYLOAD = {"model": "phi:latest", "prompt": "Qu'est-ce qu'un AWR ?", "options": {"num_predict": 50}}
+
+
+def test_hedged_request_wins_on_second_backend():
+    """Un backend lent est doublé après le délai; la réponse rapide l'emporte"""
+    slow = MockBackend(name="lent", latency=1.0)
+    fast = MockBackend(name="rapide")
+    router = BackendRouter([slow, fast])
+
+    started = time.perf_counter()
+    result = router.generate(PAYLOAD, hedge_after=0.1)
+    assert time.perf_counter() - started < 0.8
+    assert result["backend"] == "rapide" and result["hedged"]
+    assert result["response"].startswith("[MOCK phi:latest]")
+
+
+def test_deadline_cancels_generation_server_side():
+    """À l'échéance, la requête est abandonnée et la génération annulée sur le serveur"""
+    config = MockOllamaConfig(latency=0.0, token_rate=10, prompt_rate=1e6, max_tokens=100)
+    with MockOllamaServer(config) as server:
+        router = BackendRouter([OllamaBackend(server.url, "phi:latest")])
+        with pytest.raises(DeadlineExceeded):
+            list(router.stream(PAYLOAD, deadline=time.monotonic() + 0.0))
+
+        engine = LLMEnginePhi(backends=[OllamaBackend(server.url, "phi:latest")])
+        engine.telemetry.reset()
+        with engine.deadline(0.5):
+            chunks = list(engine.generate_stream("query_analysis",
+                                                 {"sql_query": "SELECT 1 FROM dual", "execution_plan": ""}))
+        assert "délai de réponse atteint" in chunks[-1]
+        time.sleep(0.3)
+        assert server.stats["cancelled"] == 1
+
+
+def test_num_predict_scaled_to_remaining_time():
+    """num_predict est réduit à ce que le débit mesuré permet avant l'échéance"""
+    engine = LLMEnginePhi(backends=[MockBackend()])
+    engine.telemetry.reset()
+    engine.telemetry.record("query_analysis", "phi:latest", total_s=2.0, ttft_s=1.0,
+                            output_tokens=200, tokens_per_s=20.0)
+    payload = {"options": {"num_predict": 1000}}
+
+    fitted = engine._fit_to_deadline(payload, "query_analysis", time.monotonic() + 11)
+    assert 150 <= fitted["options"]["num_predict"] <= 180
+    short = engine._fit_to_deadline(payload, "query_analysis", time.monotonic() + 1)
+    assert short["options"]["num_predict"] == MIN_DEADLINE_TOKENS
+    assert engine._fit_to_deadline(payload, "query_analysis", time.monotonic() + 600) is payload
+    engine.telemetry.reset()
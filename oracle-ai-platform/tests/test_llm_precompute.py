@@ -0,0 +1,76 @@
+# test_llm_precompute.py - Tests du précalcul des explications LLM
+import sys
+import os
+from datetime import datetime
+
+import pandas as pd
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_backends import MockBackend
+from src.llm_engine_phi import LLMEnginePhi
+from src.llm_precompute import PrecomputeStore, Precomputer, in_window, query_key
+from src.security_audit import SecurityAuditor
+
+
+SLOW_QUERIES = pd.DataFrame({
+    "SQL_ID": ["a1", "b2", "c3"],
+    "PLAN_HASH_VALUE": [11, 22, 33],
+    "SQL_TEXT": ["SELECT * FROM t1", "SELECT * FROM t2", "SELECT * FROM t3"],
+    "ELAPSED_TIME": [3_000_000, 9_000_000, 5_000_000],
+})
+
+SECURITY_CONFIG = {
+    "users": pd.DataFrame({
+        "USERNAME": ["SYS", "APP_USER"],
+        "ACCOUNT_STATUS": ["OPEN", "EXPIRED"],
+        "PROFILE": ["DEFAULT", "DEFAULT"],
+    })
+}
+
+
+def test_window_spans_midnight():
+    """La fenêtre 22:00-06:00 couvre la nuit, pas la journée"""
+    assert in_window("22:00-06:00", datetime(2024, 1, 1, 23, 30))
+    assert in_window("22:00-06:00", datetime(2024, 1, 1, 5, 59))
+    assert not in_window("22:00-06:00", datetime(2024, 1, 1, 14, 0))
+
+
+def test_top_queries_are_stored_by_sql_id_and_plan(tmp_path):
+    """Les N requêtes les plus lentes sont analysées une fois, clé SQL_ID + plan"""
+    store = PrecomputeStore(str(tmp_path / "pre.db"))
+    precomputer = Precomputer(LLMEnginePhi(backends=[MockBackend()]), store, top_n=2)
+
+    assert precomputer.run(SLOW_QUERIES, {}, force=True)["queries"] == 2
+    assert store.get_query("b2", 22) and store.get_query("c3", 33)
+    assert store.get_query("a1", 11) is None
+    # Nouveau plan: l'analyse stockée ne s'applique plus
+    assert store.get_query("b2", 99) is None
+    # Résultats frais: la passe suivante n'appelle pas le LLM
+    assert precomputer.run_queries(SLOW_QUERIES) == 0
+    assert query_key("b2") == "b2:0"
+
+
+def test_outside_window_is_skipped(tmp_path):
+    """Hors fenêtre creuse, la passe est reportée"""
+    store = PrecomputeStore(str(tmp_path / "pre.db"))
+    hour = datetime.now().hour
+    window = f"{(hour + 2) % 24:02d}:00-{(hour + 3) % 24:02d}:00"
+    precomputer = Precomputer(LLMEnginePhi(backends=[MockBackend()]), store, window=window)
+    assert precomputer.run(SLOW_QUERIES, {})["skipped"]
+    assert store.summary() == []
+
+
+def test_audit_serves_precomputed_deep_analysis(tmp_path, monkeypatch):
+    """L'audit réutilise l'analyse précalculée pour les mêmes risques, avec son ancienneté"""
+    store = PrecomputeStore(str(tmp_path / "pre.db"))
+    engine = LLMEnginePhi(backends=[MockBackend()])
+    nightly = {"unseen_risks": ["Nuit"], "critical_vulnerabilities": [], "strategic_recommendations": []}
+    monkeypatch.setattr(SecurityAuditor, "_llm_deep_analysis", lambda self, config, risks: nightly)
+    assert Precomputer(engine, store).run_audits({"prod": SECURITY_CONFIG}, force=True) == 1
+    monkeypatch.undo()
+
+    report = SecurityAuditor(llm_engine=engine, precomputed=store).audit_database(SECURITY_CONFIG)
+    assert report["llm_analysis"]["unseen_risks"] == ["Nuit"]
+    assert report["llm_analysis_precomputed"]["stale"] is False
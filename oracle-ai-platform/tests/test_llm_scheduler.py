@@ -0,0 +1,86 @@
+# test_llm_scheduler.py - Tests de l'ordonnanceur des appels LLM
+import sys
+import os
+import threading
+import time
+
+import pytest
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_scheduler import LLMScheduler, SchedulerRejected
+
+
+def _queue_behind_busy_slot(scheduler, requests):
+    """Occupe l'unique slot, met en file `requests` puis libère; retourne l'ordre de service"""
+    order = []
+    busy = scheduler.acquire("normal", "busy")
+
+    def worker(priority, session):
+        with scheduler.slot(priority, session):
+            order.append((priority, session))
+
+    threads = []
+    for priority, session in requests:
+        thread = threading.Thread(target=worker, args=(priority, session))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)  # ordre d'arrivée déterministe
+    scheduler.release(busy)
+    for thread in threads:
+        thread.join(timeout=5)
+    return order
+
+
+def test_interactive_served_before_batch():
+    """Une question de chat passe devant les travaux batch déjà en file"""
+    scheduler = LLMScheduler(slots=1, interactive_grace_s=0.05)
+    order = _queue_behind_busy_slot(scheduler, [("batch", "audit"), ("normal", "a"),
+                                                ("interactive", "chat")])
+    assert [p for p, _ in order] == ["interactive", "normal", "batch"]
+
+
+def test_sessions_served_round_robin():
+    """Dans une même classe, les sessions sont servies à tour de rôle"""
+    scheduler = LLMScheduler(slots=1)
+    order = _queue_behind_busy_slot(scheduler, [("normal", "a"), ("normal", "a"),
+                                                ("normal", "b")])
+    assert [s for _, s in order] == ["a", "b", "a"]
+
+
+def test_batch_rejected_when_queue_full():
+    """Le contrôle d'admission refuse le batch quand sa file est pleine"""
+    scheduler = LLMScheduler(slots=1, max_batch_queue=0)
+    with pytest.raises(SchedulerRejected):
+        scheduler.acquire("batch", "audit")
+    assert scheduler.snapshot()[2]["rejected"] == 1
+
+
+def test_acquire_timeout():
+    """Un slot non obtenu à temps lève SchedulerRejected et quitte la file"""
+    scheduler = LLMScheduler(slots=1)
+    with scheduler.slot("normal", "a"):
+        with pytest.raises(SchedulerRejected):
+            scheduler.acquire("interactive", "b", timeout=0.05)
+        assert scheduler.snapshot()[0]["queued"] == 0
+
+
+def test_single_slot_holds_batch_after_interactive():
+    """Slot unique: pas de batch juste après une question de chat, puis reprise après le délai"""
+    scheduler = LLMScheduler(slots=1, interactive_grace_s=0.2)
+    with scheduler.slot("interactive", "chat"):
+        pass
+    with pytest.raises(SchedulerRejected):
+        scheduler.acquire("batch", "audit", timeout=0.05)
+
+    # Le batch en attente démarre seul à la fin du délai (aucune autre libération)
+    started = time.perf_counter()
+    with scheduler.slot("batch", "audit", timeout=2):
+        assert time.perf_counter() - started < 1
+    assert scheduler.snapshot()[2]["served"] == 1
+
+    # Sans activité interactive récente, le batch prend le slot libre
+    scheduler = LLMScheduler(slots=1, interactive_grace_s=0.2)
+    with scheduler.slot("batch", "audit", timeout=0.05):
+        pass
@@ -0,0 +1,64 @@
+# test_llm_single_flight.py - Tests du partage des générations identiques en cours
+import sys
+import os
+import threading
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_backends import BackendError, MockBackend
+from src.llm_engine_phi import LLMEnginePhi
+
+
+VARIABLES = {"sql_query": "SELECT * FROM dba_users", "execution_plan": ""}
+
+
+class CountingBackend(MockBackend):
+    """Backend simulé qui compte ses appels et peut échouer"""
+
+    def __init__(self, latency: float, error: bool = False):
+        super().__init__(latency=latency)
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, payload, timeout=600):
+        with self._lock:
+            self.calls += 1
+        result = super().generate(payload, timeout)
+        if self.error:
+            raise BackendError("modèle introuvable", status_code=404)
+        return result
+
+
+def _concurrent_generate(engine, count=5):
+    """Lance `count` requêtes identiques en même temps; retourne les réponses"""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(position):
+        barrier.wait()
+        results[position] = engine.generate("query_analysis", VARIABLES)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_identical_concurrent_requests_share_one_backend_call():
+    """Cinq questions identiques simultanées: un seul appel au modèle, la même réponse pour tous"""
+    backend = CountingBackend(latency=0.3)
+    results = _concurrent_generate(LLMEnginePhi(backends=[backend]))
+    assert backend.calls == 1
+    assert len(set(results)) == 1 and results[0].startswith("[MOCK phi:latest]")
+
+
+def test_followers_receive_leader_error():
+    """Si l'appel du leader échoue, les requêtes en attente reçoivent la même erreur sans rappeler le modèle"""
+    backend = CountingBackend(latency=0.3, error=True)
+    results = _concurrent_generate(LLMEnginePhi(backends=[backend]))
+    assert backend.calls == 1
+    assert len(set(results)) == 1 and results[0].startswith("❌")
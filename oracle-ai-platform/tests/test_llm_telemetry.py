@@ -0,0 +1,72 @@
+# test_llm_telemetry.py - Tests de la télémétrie des appels LLM
+import sys
+import os
+import threading
+import time
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_telemetry import TelemetryStore
+from src.llm_backends import MockBackend
+from src.llm_engine_phi import LLMEnginePhi
+
+
+def test_record_response_uses_ollama_durations():
+    """Débit, tokens et chargement du modèle sont lus dans la réponse Ollama"""
+    store = TelemetryStore()
+    started = time.perf_counter() - 3.0
+    store.record_response("query_analysis", "phi:latest", {
+        "total_duration": int(2.5e9),
+        "load_duration": int(1.2e9),
+        "prompt_eval_count": 400,
+        "prompt_eval_duration": int(0.3e9),
+        "eval_count": 100,
+        "eval_duration": int(1e9),
+    }, started, queue_wait_s=0.5)
+
+    row = store.snapshot()[0]
+    assert row["calls"] == 1 and row["model_loads"] == 1
+    assert row["tokens_per_s"] == 100.0
+    assert row["prompt_tokens_avg"] == 400
+    assert 0.4 <= row["queue_wait_p95_s"] <= 0.6
+
+
+def test_queue_wait_comes_from_the_scheduler():
+    """L'attente enregistrée est celle du ticket de l'ordonnanceur, pas le temps hors serveur"""
+    from src.llm_scheduler import LLMScheduler
+
+    engine = LLMEnginePhi(backends=[MockBackend(latency=0.05)])
+    engine.scheduler = LLMScheduler(slots=1)
+    engine.telemetry = TelemetryStore()
+    busy = engine.scheduler.acquire("normal", "autre session")
+    threading.Timer(0.3, engine.scheduler.release, args=(busy,)).start()
+    engine.generate("query_analysis", {"sql_query": "SELECT 2 FROM dual", "execution_plan": ""})
+
+    row = engine.telemetry.snapshot()[0]
+    served = next(r for r in engine.scheduler.snapshot() if r["served"])
+    assert row["queue_wait_p95_s"] == served["wait_p95_s"]
+    assert row["queue_wait_p95_s"] >= 0.2
+
+
+def test_prometheus_export_has_histograms():
+    """L'export Prometheus contient compteurs et buckets par clé de prompt"""
+    store = TelemetryStore()
+    store.record("chatbot_general", "phi:latest", total_s=1.5, ttft_s=0.4)
+    store.record("chatbot_general", "phi:latest", total_s=0.0, error=True)
+
+    text = store.to_prometheus()
+    assert 'oracle_ai_llm_calls_total{prompt_key="chatbot_general",model="phi:latest"} 2' in text
+    assert 'oracle_ai_llm_errors_total{prompt_key="chatbot_general",model="phi:latest"} 1' in text
+    assert 'oracle_ai_llm_total_seconds_bucket{prompt_key="chatbot_general",model="phi:latest",le="2"} 1' in text
+
+
+def test_engine_records_each_prompt_key():
+    """Chaque génération est enregistrée sous sa clé de prompt"""
+    engine = LLMEnginePhi(backends=[MockBackend()])
+    engine.telemetry.reset()
+    engine.generate("query_analysis", {"sql_query": "SELECT 1 FROM dual", "execution_plan": ""})
+    list(engine.generate_stream("chatbot_general", {"query": "index ?", "context": "", "history": ""}))
+
+    keys = {row["prompt_key"] for row in engine.telemetry.snapshot()}
+    assert keys == {"query_analysis", "chatbot_general"}
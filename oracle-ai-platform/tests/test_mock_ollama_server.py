@@ -0,0 +1,77 @@
+# test_mock_ollama_server.py - Tests du moteur LLM contre le serveur Ollama simulé
+import sys
+import os
+import threading
+import time
+
+import requests
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.mock_ollama_server import MockOllamaServer, MockOllamaConfig
+from src.llm_backends import OllamaBackend
+from src.llm_engine_phi import LLMEnginePhi
+
+
+def _fast_config(**overrides):
+    values = {"latency": 0.0, "token_rate": 2000.0, "max_tokens": 20}
+    values.update(overrides)
+    return MockOllamaConfig(**values)
+
+
+def test_engine_against_mock_server():
+    """Génération bloquante, streamée et chat via le vrai client HTTP"""
+    with MockOllamaServer(_fast_config()) as server:
+        engine = LLMEnginePhi(backends=[OllamaBackend(server.url, "phi:latest")])
+        ok, message = engine.test_connection()
+        assert ok, message
+
+        text = engine.analyze_query("SELECT * FROM dual")
+        assert len(text.split()) == 20
+        chunks = list(engine.generate_stream("query_analysis",
+                                             {"sql_query": "SELECT 2 FROM dual", "execution_plan": ""}))
+        assert len(chunks) == 20
+        assert not engine.chat_response("Qu'est-ce que la SGA ?").startswith("❌")
+
+
+def test_error_injection():
+    """Les erreurs 500 injectées remontent comme message d'erreur du moteur"""
+    with MockOllamaServer(_fast_config(error_rate=1.0)) as server:
+        engine = LLMEnginePhi(backends=[OllamaBackend(server.url, "phi:latest")])
+        assert engine.analyze_query("SELECT 3 FROM dual").startswith("❌")
+        assert server.stats["errors"] >= 1
+
+
+def test_parallel_slots_serialize_generations():
+    """Avec un seul slot, deux générations simultanées sont exécutées l'une après l'autre"""
+    config = _fast_config(token_rate=100.0, max_tokens=10, parallel=1)
+    with MockOllamaServer(config) as server:
+        def call(n):
+            requests.post(f"{server.url}/api/generate",
+                          json={"model": "phi:latest", "prompt": f"q{n}", "stream": False},
+                          timeout=10)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=call, args=(n,)) for n in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert time.perf_counter() - started >= 0.2
+
+
+def test_load_test_slots_match_mock_server(monkeypatch):
+    """--parallel fixe l'ordonnanceur comme le serveur simulé, même si l'environnement dit autre chose"""
+    import pytest
+    from src import llm_scheduler
+    from src.llm_load_test import configure_slots
+
+    monkeypatch.setenv("OLLAMA_NUM_PARALLEL", "4")
+    monkeypatch.setattr(llm_scheduler, "_scheduler", None)
+    assert configure_slots(2) == 2
+    assert llm_scheduler.get_scheduler().slots == 2
+
+    # Ordonnanceur déjà créé avec un autre nombre de slots: échec explicite
+    with pytest.raises(ValueError):
+        configure_slots(3)
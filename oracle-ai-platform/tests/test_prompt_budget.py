@@ -0,0 +1,69 @@
+# test_prompt_budget.py - Tests du budget de tokens des prompts
+import sys
+import os
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.prompt_budget import TokenCounter, PromptBudget, PromptSection
+
+
+def test_truncate_respects_budget():
+    """La réduction ne dépasse jamais le budget demandé"""
+    counter = TokenCounter()
+    text = "SELECT * FROM employees WHERE department_id = 10;\n" * 200
+    for mode in ("head", "tail", "middle"):
+        reduced = counter.truncate(text, 100, mode)
+        assert counter.count(reduced) <= 100
+    assert "[...]" in counter.truncate(text, 100, "middle")
+
+
+def test_fit_keeps_high_priority_sections():
+    """Les sections de basse priorité sont réduites en premier"""
+    counter = TokenCounter()
+    budget = PromptBudget(num_ctx=1024, counter=counter)
+    sections = [
+        PromptSection("query", "Comment optimiser un index ?", priority=90),
+        PromptSection("context", "documentation Oracle " * 2000, priority=40),
+    ]
+    fitted, num_predict = budget.fit(200, sections, 300)
+
+    assert fitted["query"] == "Comment optimiser un index ?"
+    used = 200 + counter.count(fitted["query"]) + counter.count(fitted["context"])
+    assert used + num_predict <= 1024
+    assert num_predict == 300
+
+
+def test_fit_shrinks_output_reserve_last():
+    """La réserve de sortie n'est réduite qu'après les sections optionnelles"""
+    budget = PromptBudget(num_ctx=512, counter=TokenCounter(), safety_margin=0)
+    sections = [PromptSection("history", "historique " * 1000, priority=30)]
+    fitted, num_predict = budget.fit(100, sections, 400)
+
+    assert num_predict == 400
+    assert budget.counter.count(fitted["history"]) <= 12
+
+
+def test_chat_history_larger_than_window_drops_oldest_turns():
+    """Historique plus long que num_ctx: tours anciens retirés, question et contexte conservés dans la fenêtre"""
+    from src.llm_backends import MockBackend
+    from src.llm_engine_phi import LLMEnginePhi
+
+    engine = LLMEnginePhi(backends=[MockBackend()])
+    history = []
+    for turn in range(40):
+        history.append({"role": "user", "content": f"Question {turn}: " + "tablespace USERS plein " * 30})
+        history.append({"role": "assistant", "content": f"Réponse {turn}: " + "ajouter un datafile " * 30})
+    query = "Comment surveiller V$SESSION ?"
+    context = "V$SESSION liste les sessions ouvertes et leur état."
+
+    built = engine._build_chat_messages(query, history, context, max_tokens=512)
+    messages = built["messages"]
+    count = engine.token_counter.count
+    used = sum(count(m["content"]) + 4 for m in messages)
+    assert used + built["num_predict"] <= engine.num_ctx
+
+    past = messages[1:-1]
+    assert 0 < len(past) < len(history)
+    assert past == history[-len(past):]  # les tours les plus récents sont gardés, dans l'ordre
+    assert query in messages[-1]["content"] and context in messages[-1]["content"]
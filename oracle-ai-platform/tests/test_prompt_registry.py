@@ -0,0 +1,40 @@
+# test_prompt_registry.py - Tests du registre de prompts compilés
+import sys
+import os
+import time
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.prompt_registry import CompiledPrompt, PromptRegistry
+
+
+def test_compiled_prompt_escapes_and_renders_once():
+    """`{{` devient `{`, et une valeur contenant `{query}` n'est pas réinterprétée"""
+    prompt = CompiledPrompt("t", 'JSON: {{"score": 1}}\nContexte: {context}\nQ: {query}')
+    assert prompt.placeholders == ("context", "query")
+
+    text = prompt.render({"context": "voir {query}", "query": "index ?"})
+    assert text == 'JSON: {"score": 1}\nContexte: voir {query}\nQ: index ?'
+
+
+def test_yaml_json_examples_are_literal():
+    """Les accolades d'un exemple JSON YAML ne sont pas des variables"""
+    prompt = CompiledPrompt("t", '{\n  "score": 85\n}\nConfig: {config}')
+    assert prompt.placeholders == ("config",)
+    assert prompt.render({"config": "x"}).startswith('{\n  "score": 85\n}')
+
+
+def test_invalid_override_is_rejected_and_reload_on_mtime(tmp_path):
+    """Une surcharge aux variables inconnues est ignorée; une correction est rechargée à chaud"""
+    path = tmp_path / "prompts.yaml"
+    path.write_text("query_analysis: |\n  Analyse {sql} svp\n", encoding="utf-8")
+    registry = PromptRegistry(str(path), defaults={"query_analysis": "Requête: {sql_query}"},
+                              check_interval=0)
+    assert registry.get("query_analysis").source == "Requête: {sql_query}"
+
+    path.write_text("query_analysis: |\n  Nouvelle analyse: {sql_query}\n", encoding="utf-8")
+    future = time.time() + 5
+    os.utime(path, (future, future))
+    assert registry.get("query_analysis").render({"sql_query": "SELECT 1"}).strip() == \
+        "Nouvelle analyse: SELECT 1"
@@ -0,0 +1,84 @@
+# test_rag_chunker.py - Tests du découpage en tokens de la documentation
+import sys
+import os
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.rag_chunker import TokenChunker
+
+
+def words(text):
+    """Compteur de test: un token par mot"""
+    return len(text.split())
+
+
+def test_chunks_respect_token_limit_and_overlap():
+    """Aucun chunk ne dépasse la limite; la fin d'un chunk est reprise au début du suivant"""
+    lines = [f"Ligne {i} sur les statistiques de l'optimiseur." for i in range(60)]
+    chunker = TokenChunker(max_tokens=50, overlap=10, counter=words)
+    chunks = list(chunker(["\n".join(lines)]))
+
+    assert len(chunks) > 1
+    assert all(words(chunk) <= 50 for chunk in chunks)
+    assert chunks[1].startswith(chunks[0].split("\n")[-1])
+    # Limite du modèle: 256 tokens dont [CLS] et [SEP]
+    assert TokenChunker(max_tokens=1000, counter=words).max_tokens == 254
+
+
+def test_sql_blocks_and_headings_are_kept_whole():
+    """Une instruction SQL n'est pas coupée; un titre ouvre un nouveau chunk"""
+    text = ("# Profils\n\n" + "Texte introductif. " * 12 + "\n\n"
+            "CREATE PROFILE secure_profile LIMIT\n  PASSWORD_LIFE_TIME 90\n  FAILED_LOGIN_ATTEMPTS 5;\n\n"
+            "ORACLE BEST PRACTICE: Audit\n\nAUDIT CREATE SESSION WHENEVER NOT SUCCESSFUL;")
+    chunks = list(TokenChunker(max_tokens=30, overlap=5, counter=words)([text]))
+
+    sql = [chunk for chunk in chunks if "CREATE PROFILE" in chunk]
+    assert len(sql) == 1 and "FAILED_LOGIN_ATTEMPTS 5;" in sql[0]
+    assert chunks[-1].startswith("ORACLE BEST PRACTICE: Audit")
+
+
+def test_pages_are_consumed_lazily():
+    """Le découpage avance page par page sans lire tout le document"""
+    consumed = []
+
+    def pages():
+        for i in range(100000):
+            consumed.append(i)
+            yield f"Paragraphe {i} du manuel.\n"
+
+    chunks = TokenChunker(max_tokens=20, overlap=0, counter=words)(pages())
+    first = next(chunks)
+    assert first.startswith("Paragraphe 0") and len(consumed) < 10
+    # Mot démesuré sans espace: découpé sous la limite
+    assert all(words(c) <= 20 for c in TokenChunker(max_tokens=20, counter=words)(["x" * 500]))
+
+
+class FakeEmbedder:
+    """Backend d'embedding dont le tokenizer compte un token par caractère"""
+
+    def token_counter(self):
+        from src.embedding_backends import WordPieceCounter
+
+        class Tokenizer:
+            def encode(self, text, add_special_tokens=False):
+                return list(text)
+
+        return WordPieceCounter(Tokenizer())
+
+
+def test_embedder_tokenizer_is_used_and_estimate_gets_a_margin(capsys):
+    """Le tokenizer de l'embedder fait foi; sans tokenizer, chunks réduits et avertissement"""
+    chunker = TokenChunker(embedder=FakeEmbedder())
+    assert chunker.max_tokens == 254
+    assert all(len(chunk) <= 254 for chunk in chunker(["Sessions V$SESSION bloquantes. " * 50]))
+
+    class Broken:
+        def token_counter(self):
+            raise OSError("tokenizer.json absent")
+
+    # Ni tokenizer de l'embedder ni cache Hugging Face: estimation avec marge
+    estimated = TokenChunker(embedder=Broken())
+    if not estimated.exact:
+        assert estimated.max_tokens == int(254 * 0.6)
+        assert "tokens estimés" in capsys.readouterr().out
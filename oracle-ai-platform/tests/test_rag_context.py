@@ -0,0 +1,44 @@
+# test_rag_context.py - Tests de la recherche unique par tour de chat
+import sys
+import os
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_telemetry import get_telemetry
+from src.rag_context import RetrievalCache, retrieve
+
+
+def test_retrieval_reused_until_collection_changes():
+    """Même requête (casse, espaces): servie par le LRU; nouvelle version: recherche relancée"""
+    calls = []
+
+    def search(query, n_results, where):
+        calls.append(query)
+        return [{"content": f"doc {len(calls)}", "metadata": {"topic": "awr_reports"}}]
+
+    cache = RetrievalCache(maxsize=2)
+    get_telemetry().reset()
+    first = retrieve(cache, search, "Rapport  AWR ?", 3, version=1)
+    again = retrieve(cache, search, "rapport awr ?", 3, version=1)
+    assert len(calls) == 1 and again.cached and again.documents is first.documents
+    assert again.sources(1) == first.documents[:1]
+
+    assert not retrieve(cache, search, "rapport awr ?", 3, version=2).cached
+    assert not retrieve(cache, search, "rapport awr ?", 3, where={"category": "monitoring"}, version=2).cached
+    # LRU borné à 2 entrées: la plus ancienne (version 1) est évincée
+    assert not retrieve(cache, search, "rapport awr ?", 3, version=1).cached
+    assert len(calls) == 4 and cache.stats()["entries"] == 2
+
+    series = {(row["prompt_key"], row["model"]) for row in get_telemetry().snapshot()}
+    assert ("rag_retrieval", "cache") in series and ("rag_retrieval", "hybrid") in series
+    get_telemetry().reset()
+
+
+def test_empty_results_are_not_cached():
+    """Une recherche sans résultat (erreur comprise) est relancée au tour suivant"""
+    calls = []
+    cache = RetrievalCache()
+    for _ in range(2):
+        retrieve(cache, lambda q, n, w: calls.append(q) or [], "ORA-00060", 3, version=0)
+    assert len(calls) == 2
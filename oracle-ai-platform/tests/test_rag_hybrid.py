@@ -0,0 +1,170 @@
+# test_rag_hybrid.py - Tests de la recherche hybride BM25 + vecteurs
+import sys
+import os
+import random
+import time
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.embedding_cache import QueryEmbeddingLRU
+from src.rag_hybrid import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+
+
+DOCUMENTS = {
+    "sessions": "Sessions bloquantes: interroger V$SESSION et V$LOCK pour trouver le bloqueur.",
+    "stats": "Collecter les statistiques avec DBMS_STATS.GATHER_SCHEMA_STATS chaque nuit.",
+    "login": "ORA-01017: nom utilisateur ou mot de passe invalide, vérifier le profil.",
+    "profile": "Profil de mots de passe: PASSWORD_LIFE_TIME 90 et FAILED_LOGIN_ATTEMPTS 5.",
+}
+CATEGORIES = {"sessions": "monitoring", "stats": "performance", "login": "security", "profile": "security"}
+
+
+class FakeCollection:
+    """Collection ChromaDB minimale; la recherche 'vectorielle' suit un ordre fixe"""
+
+    def __init__(self, dense_order):
+        self.documents = dict(DOCUMENTS)
+        self.metadatas = {i: {"category": CATEGORIES[i]} for i in DOCUMENTS}
+        self.dense_order = dense_order
+
+    def count(self):
+        return len(self.documents)
+
+    def get(self, ids=None, include=None):
+        ids = [i for i in (ids or list(self.documents)) if i in self.documents]
+        return {"ids": ids, "documents": [self.documents[i] for i in ids],
+                "metadatas": [self.metadatas[i] for i in ids]}
+
+    def add(self, ids, documents, metadatas):
+        self.documents.update(zip(ids, documents))
+        self.metadatas.update(zip(ids, metadatas))
+
+    def delete(self, ids):
+        for i in ids:
+            self.documents.pop(i, None)
+
+    def query(self, query_texts=None, n_results=10, where=None, include=None, query_embeddings=None):
+        self.queries = getattr(self, "queries", 0) + 1
+        ids = [i for i in self.dense_order if i in self.documents and
+               (not where or self.metadatas[i].get("category") == where["category"])][:n_results]
+        count = len(query_embeddings if query_embeddings is not None else query_texts)
+        return {"ids": [ids] * count, "documents": [[self.documents[i] for i in ids]] * count,
+                "metadatas": [[self.metadatas[i] for i in ids]] * count,
+                "distances": [[0.3] * len(ids)] * count}
+
+
+def test_tokenize_keeps_oracle_identifiers():
+    """Les identifiants Oracle sont indexés entiers et par parties"""
+    terms = tokenize("Vérifier V$SESSION, DBMS_STATS et ORA-01017")
+    assert {"v$session", "dbms_stats", "dbms", "stats", "ora-01017", "session"} <= set(terms)
+
+
+def test_bm25_exact_identifier_and_updates():
+    """BM25 classe l'identifiant exact en premier; ajouts, remplacements, suppressions, filtre"""
+    index = BM25Index()
+    index.add(list(DOCUMENTS), list(DOCUMENTS.values()), [{"category": CATEGORIES[i]} for i in DOCUMENTS])
+
+    assert index.search("ORA-01017 à la connexion")[0][0] == "login"
+    assert index.search("dbms_stats")[0][0] == "stats"
+    assert {i for i, _ in index.search("mot de passe profil", where={"category": "security"})} == {"profile", "login"}
+
+    index.add(["stats"], ["Histogrammes et DBMS_STATS.GATHER_TABLE_STATS"], [{"category": "performance"}])
+    assert index.search("gather_table_stats")[0][0] == "stats"
+    assert index.search("nuit") == []
+    index.remove(["login"])
+    assert index.search("ORA-01017") == [] and len(index) == 3
+
+
+def test_hybrid_fuses_lexical_and_dense_rankings():
+    """Un document absent des résultats vectoriels remonte grâce à BM25 (fusion RRF)"""
+    collection = FakeCollection(dense_order=["profile", "sessions", "stats"])
+    retriever = HybridRetriever(collection, candidates=3)
+
+    results = retriever.query("ORA-01017", n_results=2)
+    assert "login" in [r["id"] for r in results]
+    login = next(r for r in results if r["id"] == "login")
+    assert login["vector_rank"] is None and login["lexical_rank"] == 1
+    assert login["document"].startswith("ORA-01017")
+
+    # Document dans les deux classements: premier, score maximal
+    top = retriever.query("V$SESSION bloqueur", n_results=1, where={"category": "monitoring"})[0]
+    assert top["id"] == "sessions" and top["similarity_score"] <= 1
+
+    # Ajout hors du retriever (autre processus): rattrapé par sync()
+    collection.add(["awr"], ["Rapport AWR: DBA_HIST_SQLSTAT"], [{"category": "monitoring"}])
+    assert retriever.sync()["added"] == 1
+    assert "awr" in [r["id"] for r in retriever.query("dba_hist_sqlstat", n_results=2)]
+    assert reciprocal_rank_fusion([["a", "b"], ["b"]])[0][0] == "b"
+
+
+def test_query_many_embeds_once_and_searches_once():
+    """N questions: un appel au modèle pour les nouvelles, une requête vectorielle, LRU ensuite"""
+    batches = []
+
+    def model(texts):
+        batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    collection = FakeCollection(dense_order=["sessions", "stats", "login", "profile"])
+    embeddings = QueryEmbeddingLRU(model, maxsize=8)
+    retriever = HybridRetriever(collection, candidates=4, embed_queries=embeddings)
+
+    results = retriever.query_many(["ORA-01017", "DBMS_STATS", "ora-01017 "], n_results=2)
+    assert [r[0]["id"] for r in results] == ["login", "stats", "login"]
+    assert len(batches) == 1 and sorted(batches[0]) == ["DBMS_STATS", "ORA-01017", "ora-01017"]
+    assert collection.queries == 1
+
+    retriever.query("DBMS_STATS")
+    assert len(batches) == 1 and embeddings.stats()["hits"] == 1
+
+
+def test_external_replacement_with_same_count_is_picked_up():
+    """Ingestion d'un fichier modifié (nouveaux chunks, anciens supprimés): nombre inchangé, index rattrapé"""
+    collection = FakeCollection(dense_order=[])
+    retriever = HybridRetriever(collection, refresh_interval=0)
+    version = retriever.version
+
+    collection.delete(["stats"])
+    collection.add(["stats_v2"], ["Statistiques incrémentales: DBMS_STATS.SET_TABLE_PREFS INCREMENTAL"],
+                   [{"category": "performance"}])
+    assert collection.count() == len(DOCUMENTS)
+    assert retriever.version != version
+    assert retriever.index.search("set_table_prefs")[0][0] == "stats_v2"
+    assert "stats" not in retriever.index
+
+
+def test_bm25_latency_on_large_corpus():
+    """Corpus synthétique de 20 000 chunks: une recherche reste de l'ordre de la milliseconde"""
+    rng = random.Random(7)
+    vocabulary = [f"terme{i}" for i in range(20000)] + ["v$session", "dbms_stats", "ora-01017"]
+    index = BM25Index()
+    ids = [f"doc{i}" for i in range(20000)]
+    index.add(ids, [" ".join(rng.choices(vocabulary, k=40)) for _ in ids])
+
+    queries = [" ".join(rng.choices(vocabulary, k=4)) for _ in range(50)] + ["V$SESSION dbms_stats ORA-01017"]
+    index.search(queries[0])
+    started = time.perf_counter()
+    for query in queries:
+        assert index.search(query, 10)
+    per_query = (time.perf_counter() - started) / len(queries)
+    assert per_query < 0.05, f"{per_query * 1000:.1f} ms par recherche"
+
+
+def test_fused_results_keep_absolute_relevance():
+    """Le rang fusionné n'écrase pas la similarité vectorielle; BM25 seul: score relatif à la requête"""
+    collection = FakeCollection(dense_order=["profile", "sessions", "stats"])
+    retriever = HybridRetriever(collection, candidates=3)
+
+    top = retriever.query("V$SESSION bloqueur", n_results=1, where={"category": "monitoring"})[0]
+    assert top["rrf_score"] == 1.0
+    assert top["distance"] == 0.3 and abs(top["similarity_score"] - 0.7) < 1e-9
+
+    login = next(r for r in retriever.query("ORA-01017", n_results=3) if r["id"] == "login")
+    assert login["similarity_score"] is None and login["distance"] is None
+    assert login["lexical_score"] == 1.0
+
+    # Un seul terme de la requête présent: meilleur résultat BM25, mais score relatif faible
+    weak = retriever.index.search("ORA-01017 flashback restauration archivelog")[0]
+    assert weak[0] == "login"
+    assert retriever.index.lexical_score("ORA-01017 flashback restauration archivelog", weak[1]) < 0.5
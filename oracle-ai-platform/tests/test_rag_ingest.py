@@ -0,0 +1,66 @@
+# test_rag_ingest.py - Tests de l'ingestion incrémentale de la documentation
+import sys
+import os
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.rag_ingest import IngestionPipeline, ParagraphChunker
+
+
+class MemoryCollection:
+    """Collection en mémoire avec l'interface upsert/delete de ChromaDB"""
+
+    name = "test_docs"
+
+    def __init__(self):
+        self.documents = {}
+        self.upserted = 0
+
+    def upsert(self, ids, documents, metadatas):
+        self.upserted += len(ids)
+        self.documents.update(zip(ids, documents))
+
+    def delete(self, ids):
+        for i in ids:
+            self.documents.pop(i, None)
+
+
+def _write(path, paragraphs):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(paragraphs))
+
+
+def test_sync_only_processes_changes(tmp_path):
+    """Seuls les chunks nouveaux sont insérés; les fichiers supprimés sont retirés"""
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    _write(docs / "rman.txt", ["RMAN incrémental niveau 0", "RMAN niveau 1 cumulatif"])
+    _write(docs / "awr.txt", ["Rapport AWR", "Top SQL par temps écoulé"])
+    collection = MemoryCollection()
+    pipeline = IngestionPipeline(collection, ParagraphChunker(max_chars=30), workers=2,
+                                 manifest_path=str(tmp_path / "manifest.json"))
+
+    first = pipeline.sync(str(docs))
+    assert first["updated"] == 2 and first["chunks_added"] == 4
+    assert pipeline.sync(str(docs))["unchanged"] == 2 and collection.upserted == 4
+
+    # Un paragraphe modifié: un seul chunk ré-inséré, l'ancien supprimé
+    _write(docs / "rman.txt", ["RMAN incrémental niveau 0", "RMAN niveau 1 différentiel"])
+    os.remove(docs / "awr.txt")
+    reloaded = IngestionPipeline(collection, ParagraphChunker(max_chars=30), workers=2,
+                                 manifest_path=str(tmp_path / "manifest.json"))
+    report = reloaded.sync(str(docs))
+    assert report["chunks_added"] == 1 and report["chunks_kept"] == 1
+    assert report["removed"] == 1 and report["chunks_deleted"] == 3
+    assert sorted(collection.documents.values()) == ["RMAN incrémental niveau 0", "RMAN niveau 1 différentiel"]
+
+
+def test_chunker_streams_pages():
+    """Les paragraphes coupés entre deux pages sont recollés, taille bornée"""
+    chunker = ParagraphChunker(max_chars=30)
+    chunks = list(chunker(["Premier para", "graphe complet\n\nSecond", " paragraphe\n\n" + "x" * 70]))
+    assert chunks[0] == "Premier paragraphe complet"
+    assert chunks[1] == "Second paragraphe"
+    assert all(len(chunk) <= 30 for chunk in chunks)
+    assert "".join(chunks[2:]) == "x" * 70
@@ -0,0 +1,45 @@
+# test_rag_loader.py - Tests du chargement différé du moteur RAG
+import sys
+import os
+import threading
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.llm_telemetry import get_telemetry
+from src.rag_loader import FAILED, LOADING, READY, BackgroundLoader
+
+
+def test_background_loader_does_not_block():
+    """start() rend la main pendant le chargement; on_ready reçoit l'objet construit"""
+    release = threading.Event()
+    swapped = []
+
+    def factory():
+        release.wait(5)
+        return "moteur"
+
+    loader = BackgroundLoader(factory, name="test-engine-load", on_ready=swapped.append)
+    assert loader.start(background=True).status()["state"] == LOADING
+    assert not loader.wait(timeout=0.01) and swapped == []
+
+    release.set()
+    assert loader.wait(timeout=5) and loader.value == "moteur" and swapped == ["moteur"]
+    assert loader.status()["state"] == READY and loader.seconds is not None
+    assert any(row["prompt_key"] == "rag_startup" and row["model"] == "test-engine-load"
+               for row in get_telemetry().snapshot())
+    # Un seul chargement même si start() est rappelé
+    assert loader.start().value == "moteur"
+
+
+def test_background_loader_failure_and_sync_mode(monkeypatch):
+    """Erreur de construction: état failed, message conservé; RAG_BACKGROUND_LOAD=0 bloquant"""
+    monkeypatch.setenv("RAG_BACKGROUND_LOAD", "0")
+
+    def factory():
+        raise RuntimeError("chromadb absent")
+
+    loader = BackgroundLoader(factory).start()
+    assert loader.state == FAILED and not loader.wait()
+    assert loader.status()["error"] == "chromadb absent"
+    assert not BackgroundLoader(lambda: None).wait(timeout=0)
@@ -0,0 +1,52 @@
+# test_rag_rerank.py - Tests du reclassement par cross-encoder
+import sys
+import os
+import time
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.rag_rerank import CrossEncoderReranker, get_reranker
+
+
+CANDIDATES = [{"content": text} for text in [
+    "Sauvegarde RMAN incrémentale",
+    "Sessions bloquantes V$SESSION",
+    "Statistiques DBMS_STATS",
+    "Verrous et sessions bloquantes: V$LOCK",
+]]
+
+
+def keyword_scorer(pairs):
+    """Score de test: mots de la question présents dans le passage"""
+    return [sum(word in passage.lower() for word in query.lower().split()) for query, passage in pairs]
+
+
+def test_rerank_keeps_best_k():
+    """Les k meilleurs candidats selon le cross-encoder sont gardés, dans l'ordre des scores"""
+    reranker = CrossEncoderReranker(scorer=keyword_scorer, batch_size=2)
+    kept, report = reranker.rerank("sessions bloquantes v$lock", CANDIDATES, k=2)
+    assert [doc["content"] for doc in kept] == ["Verrous et sessions bloquantes: V$LOCK",
+                                                "Sessions bloquantes V$SESSION"]
+    assert report["reranked"] and report["scored"] == 4 and reranker.pair_seconds is not None
+
+
+def test_rerank_skipped_when_over_budget():
+    """Latence estimée au-delà du budget: ordre de la recherche conservé"""
+    def slow_scorer(pairs):
+        time.sleep(0.02 * len(pairs))
+        return keyword_scorer(pairs)
+
+    reranker = CrossEncoderReranker(scorer=slow_scorer, budget_s=0.05, batch_size=1)
+    kept, report = reranker.rerank("v$lock", CANDIDATES, k=2)
+    # Premier lot noté, les suivants dépasseraient le budget
+    assert report["reason"] == "budget atteint" and report["scored"] < 4
+
+    kept, report = reranker.rerank("v$lock", CANDIDATES, k=2)
+    assert not report["reranked"] and kept == CANDIDATES[:2]
+
+
+def test_reranker_disabled_by_default(monkeypatch):
+    """Sans RAG_RERANK=1, aucun reclassement"""
+    monkeypatch.delenv("RAG_RERANK", raising=False)
+    assert get_reranker() is None
@@ -0,0 +1,94 @@
+# test_rag_stats.py - Tests des statistiques incrémentales de la base de connaissances
+import sys
+import os
+
+# Ajouter le dossier racine du projet au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.rag_hybrid import HybridRetriever
+from src.rag_stats import CollectionStats
+
+
+class FakeCollection:
+    """Collection ChromaDB minimale (get paginé, sans recherche vectorielle)"""
+
+    def __init__(self):
+        self.documents, self.metadatas = {}, {}
+
+    def count(self):
+        return len(self.documents)
+
+    def get(self, ids=None, include=None, limit=None, offset=0):
+        ids = [i for i in (ids or list(self.documents)) if i in self.documents]
+        ids = ids[offset:offset + limit] if limit else ids
+        return {"ids": ids, "documents": [self.documents[i] for i in ids],
+                "metadatas": [self.metadatas[i] for i in ids]}
+
+    def add(self, ids, documents, metadatas):
+        self.documents.update(zip(ids, documents))
+        self.metadatas.update(zip(ids, metadatas))
+
+    def delete(self, ids):
+        for i in ids:
+            self.documents.pop(i, None)
+            self.metadatas.pop(i, None)
+
+
+def test_counts_follow_adds_replacements_and_deletes():
+    """Un remplacement déplace le document d'une catégorie à l'autre; les compteurs vides disparaissent"""
+    stats = CollectionStats()
+    stats.add(["a", "b", "c"], [{"category": "security", "topic": "audit"},
+                                {"category": "security", "topic": "password"},
+                                {"category": "backup", "source": "custom"}])
+    stats.add(["b"], [{"category": "performance", "topic": "index"}])
+    stats.remove(["c", "absent"])
+
+    snapshot = stats.snapshot()
+    assert snapshot["total_documents"] == 2
+    assert snapshot["categories"] == {"security": 1, "performance": 1}
+    assert snapshot["topics"] == {"audit": 1, "index": 1}
+    assert snapshot["sources"] == {"unknown": 2}
+
+
+def test_retriever_keeps_stats_in_sync_and_check_repairs():
+    """Écritures via le retriever et rattrapage par sync(); check() détecte et corrige un écart"""
+    collection = FakeCollection()
+    collection.add(["d1", "d2"], ["V$SESSION", "DBMS_STATS"],
+                   [{"category": "monitoring", "topic": "sessions"}, {"category": "performance", "topic": "stats"}])
+    retriever = HybridRetriever(collection)
+    retriever.add(["d3"], ["RMAN"], [{"category": "backup", "topic": "rman"}])
+    retriever.delete(["d1"])
+    assert retriever.collection_stats()["categories"] == {"performance": 1, "backup": 1}
+    assert retriever.stats.check(collection, batch_size=1)["consistent"]
+
+    # Écriture hors du retriever: rattrapée par sync()
+    collection.add(["d4"], ["AWR"], [{"category": "monitoring", "topic": "awr"}])
+    retriever.sync()
+    assert retriever.collection_stats()["total_documents"] == 3
+
+    # Métadonnées modifiées sans passer par le retriever: écart détecté puis corrigé
+    collection.metadatas["d2"] = {"category": "security", "topic": "stats"}
+    report = retriever.stats.check(collection, repair=True)
+    assert not report["consistent"]
+    assert report["differences"]["categories"] == {"performance": 1, "security": -1}
+    assert retriever.stats.check(collection)["consistent"]
+
+
+def test_sidecar_persists_counts_across_restarts(tmp_path, monkeypatch):
+    """Au redémarrage, les compteurs sont relus du sidecar: aucun document n'est recompté"""
+    path = str(tmp_path / "collection_stats.sqlite")
+    collection = FakeCollection()
+    collection.add(["d1", "d2"], ["V$SESSION", "DBMS_STATS"],
+                   [{"category": "monitoring"}, {"category": "performance"}])
+    HybridRetriever(collection, stats_path=path).add(["d3"], ["RMAN"], [{"category": "backup"}])
+    assert CollectionStats(path).snapshot()["categories"] == {"monitoring": 1, "performance": 1, "backup": 1}
+
+    # Redémarrage après une suppression faite pendant l'arrêt: retirée au rapprochement des IDs
+    collection.delete(["d1"])
+    counted = []
+    original_add = CollectionStats.add
+    monkeypatch.setattr(CollectionStats, "add",
+                        lambda self, ids, metadatas=None: (counted.extend(ids), original_add(self, ids, metadatas)))
+    restarted = HybridRetriever(collection, stats_path=path)
+    assert counted == []
+    assert restarted.collection_stats()["categories"] == {"performance": 1, "backup": 1}